@@ -0,0 +1,118 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/alazar_buffer_pool.py                                 #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time the transitions of the AlazarTechBoard GuilessWorker over a number of shots,
+and count the DMA buffers allocated and freed, using mock_atsapi in place of the
+AlazarTech SDK.
+
+Usage: python alazar_buffer_pool.py [n_shots] [acquisition_duration] [rate]
+
+where acquisition_duration is in seconds and rate is the sample rate in samples per
+second. Successive shots alternate between the full duration and half of it."""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+
+from labscript_devices.testing import mock_atsapi as ats
+
+sys.modules['labscript_devices.atsapi'] = ats
+from labscript_devices.AlazarTechBoard import GuilessWorker
+
+
+def make_worker():
+    """Return an initialised GuilessWorker, without starting a worker process"""
+    worker = object.__new__(GuilessWorker)
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker.init()
+    return worker
+
+
+def write_shot_file(path, acquisition_duration, rate):
+    """Write a shot file with the device properties the worker reads"""
+    properties = dict(
+        clock_source_id=ats.INTERNAL_CLOCK,
+        requested_acquisition_rate=rate,
+        clock_edge_id=ats.CLOCK_EDGE_RISING,
+        acquisition_duration=acquisition_duration,
+        trig_operation=ats.TRIG_ENGINE_OP_J,
+        trig_engine_id1=ats.TRIG_ENGINE_J,
+        trig_source_id1=ats.TRIG_EXTERNAL,
+        trig_slope_id1=ats.TRIGGER_SLOPE_POSITIVE,
+        trig_level_id1=150,
+        trig_engine_id2=ats.TRIG_ENGINE_K,
+        trig_source_id2=ats.TRIG_DISABLE,
+        trig_slope_id2=ats.TRIGGER_SLOPE_POSITIVE,
+        trig_level_id2=150,
+        exttrig_coupling_id=ats.DC_COUPLING,
+        exttrig_range_id=ats.ETR_5V,
+        channels=ats.CHANNEL_A | ats.CHANNEL_B,
+        chA_coupling_id=ats.AC_COUPLING,
+        chA_input_range=4000,
+        chA_impedance_id=ats.IMPEDANCE_1M_OHM,
+        chA_bw_limit=0,
+        chB_coupling_id=ats.AC_COUPLING,
+        chB_input_range=4000,
+        chB_impedance_id=ats.IMPEDANCE_1M_OHM,
+        chB_bw_limit=0,
+    )
+    with h5py.File(path, 'w') as f:
+        f.create_group('devices/alazar')
+        labscript_utils.properties.set_device_properties(f, 'alazar', properties)
+
+
+def main(n_shots=6, acquisition_duration=1.0, rate=10000000):
+    worker = make_worker()
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        for shot in range(int(n_shots)):
+            duration = float(acquisition_duration) / (1 + shot % 2)
+            write_shot_file(path, duration, int(rate))
+            ats.DMABuffer.reset_counts()
+            with contextlib.redirect_stdout(io.StringIO()):
+                start_time = time.perf_counter()
+                worker.transition_to_buffered('alazar', path, {}, True)
+                buffered_time = time.perf_counter() - start_time
+                # Wait for the acquisition thread to fill the buffers:
+                worker.acquisition_done.wait()
+                start_time = time.perf_counter()
+                worker.transition_to_manual()
+                manual_time = time.perf_counter() - start_time
+            print(
+                'shot %d: %d buffers, %d allocated, %d freed, '
+                'transition_to_buffered %.3f s, transition_to_manual %.3f s'
+                % (
+                    shot,
+                    worker.buffersPerAcquisition,
+                    ats.DMABuffer.allocations,
+                    ats.DMABuffer.frees,
+                    buffered_time,
+                    manual_time,
+                )
+            )
+        with contextlib.redirect_stdout(io.StringIO()):
+            worker.shutdown()
+        print('shutdown: %d freed' % ats.DMABuffer.frees)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,139 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/camera_frame_transport.py                             #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Send n_frames frames of each of the given sizes from an IMAQdxCameraWorker with a
+mock camera to an ImageReceiver displaying them in a separate process, as in BLACS,
+and measure the frame rate and the time each frame takes to send. Compare sending
+frames through shared memory with sending them in the zmq message, as the worker did
+previously and still does when shared memory is unavailable.
+
+The receiver renders frames with an offscreen Qt platform, so no display is needed. It
+is run by this script with the --receiver argument.
+
+Usage: python camera_frame_transport.py [n_frames] [size ...]
+
+where each size is the width and height in pixels of square uint16 frames."""
+
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from labscript_devices.IMAQdxCamera.blacs_workers import IMAQdxCameraWorker, MockCamera
+
+
+class SizedMockCamera(MockCamera):
+    """Mock camera returning the same frame of the given size every time, so that
+    generating frames does not dominate the time taken"""
+
+    def __init__(self, size):
+        MockCamera.__init__(self)
+        rng = np.random.default_rng(0)
+        self.image = rng.integers(0, 4096, (size, size), dtype=np.uint16)
+
+    def snap(self):
+        return self.image
+
+
+def run_receiver():
+    """Run an ImageReceiver displaying frames in a pyqtgraph ImageView, as the BLACS tab
+    does, printing its port to stdout and returning once stdin is closed"""
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    import pyqtgraph as pg
+    from qtutils import inmain_later
+    from qtutils.qt import QtWidgets
+    from labscript_devices.IMAQdxCamera.blacs_tabs import ImageReceiver
+
+    app = QtWidgets.QApplication([])
+    image_view = pg.ImageView()
+    label_fps = QtWidgets.QLabel()
+    receiver = ImageReceiver(image_view, label_fps)
+    print(receiver.port, flush=True)
+
+    def wait_for_quit():
+        sys.stdin.read()
+        inmain_later(app.quit)
+
+    threading.Thread(target=wait_for_quit, daemon=True).start()
+    app.exec_()
+    receiver.shutdown()
+
+
+def make_worker(size, port, shared_memory):
+    """Return an initialised IMAQdxCameraWorker with a mock camera, without starting a
+    worker process"""
+    worker = object.__new__(IMAQdxCameraWorker)
+    worker.device_name = 'camera'
+    worker.camera_attributes = {}
+    worker.manual_mode_camera_attributes = {}
+    worker.parent_host = 'localhost'
+    worker.image_receiver_port = port
+    with contextlib.redirect_stdout(io.StringIO()):
+        camera = SizedMockCamera(size)
+        worker.get_camera = lambda: camera
+        worker.init()
+    if not shared_memory and worker.image_writer is not None:
+        worker.image_writer.close()
+        worker.image_writer = None
+    return worker
+
+
+def send_frames(worker, n_frames):
+    """Snap and send n_frames frames, returning the time taken to send each"""
+    send_times = []
+    for _ in range(n_frames):
+        start_time = time.perf_counter()
+        worker.snap()
+        send_times.append(time.perf_counter() - start_time)
+    return np.array(send_times)
+
+
+def main(n_frames=100, *sizes):
+    n_frames = int(n_frames)
+    sizes = [int(size) for size in sizes] or [512, 1024, 2048, 4096]
+    # A separate process, as the BLACS tab is from the worker:
+    receiver = subprocess.Popen(
+        [sys.executable, __file__, '--receiver'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        port = int(receiver.stdout.readline())
+        for size in sizes:
+            for description, shared_memory in [('zmq', False), ('shared memory', True)]:
+                worker = make_worker(size, port, shared_memory)
+                try:
+                    # Let the receiver set up its display of this size first:
+                    send_frames(worker, 1)
+                    send_times = send_frames(worker, n_frames)
+                finally:
+                    worker.shutdown()
+                    worker.image_socket.close(linger=0)
+                msg = '%dx%d, %s: %.1f fps, send latency median %.2f ms, max %.2f ms'
+                fps = n_frames / send_times.sum()
+                median, maximum = 1e3 * np.median(send_times), 1e3 * send_times.max()
+                print(msg % (size, size, description, fps, median, maximum))
+    finally:
+        receiver.stdin.close()
+        receiver.wait()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--receiver']:
+        run_receiver()
+    else:
+        main(*sys.argv[1:])
@@ -0,0 +1,322 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/camera_shot_saving.py                                 #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Run a shot on an IMAQdxCameraWorker with a mock camera acquiring n_images frames of
+the given size, one every interval seconds, and time transition_to_manual, compared
+with its previous implementation, which saved all the images to the shot file at the
+end of the shot rather than in a background thread as they were acquired. Check that
+both save the same images.
+
+Usage: python camera_shot_saving.py [n_images] [size] [interval]"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+from labscript_utils import dedent
+from labscript_utils.properties import set_attributes
+from labscript_utils.shared_drive import path_to_local
+
+from labscript_devices.IMAQdxCamera.blacs_workers import IMAQdxCameraWorker, MockCamera
+
+DEVICE_NAME = 'camera'
+# Exposures are given these names in turn, so that each name has several images, which
+# are saved as an array in a single dataset:
+EXPOSURE_NAMES = ['atoms', 'probe', 'background']
+
+
+class TimedMockCamera(MockCamera):
+    """Mock camera acquiring noisy frames of the given size, one every interval
+    seconds, as a triggered camera would during a shot"""
+
+    def __init__(self, size, interval):
+        MockCamera.__init__(self)
+        self.interval = interval
+        self._abort_acquisition = False
+        # Frames are generated in advance, so that generating them does not delay
+        # acquisition:
+        rng = np.random.default_rng(0)
+        x = np.linspace(-5, 5, size)
+        clean_image = 2000 * (1 - 0.5 * np.exp(-(x ** 2 + x[:, None] ** 2)))
+        self.frames = [rng.poisson(clean_image).astype(np.uint16) for _ in range(4)]
+
+    def grab_multiple(self, n_images, images, waitForNextBuffer=True):
+        next_time = time.perf_counter() + self.interval
+        for i in range(n_images):
+            time.sleep(max(0, next_time - time.perf_counter()))
+            next_time += self.interval
+            if self._abort_acquisition:
+                self._abort_acquisition = False
+                return
+            images.append(self.frames[i % len(self.frames)])
+
+    def abort_acquisition(self):
+        self._abort_acquisition = True
+
+
+def transition_to_buffered_previous(self, device_name, h5_filepath, initial_values, fresh):
+    """The previous implementation of IMAQdxCameraWorker.transition_to_buffered, for
+    comparison"""
+    if getattr(self, 'is_remote', False):
+        h5_filepath = path_to_local(h5_filepath)
+    if self.continuous_thread is not None:
+        # Pause continuous acquistion during transition_to_buffered:
+        self.stop_continuous(pause=True)
+    with h5py.File(h5_filepath, 'r') as f:
+        group = f['devices'][self.device_name]
+        if not 'EXPOSURES' in group:
+            return {}
+        self.h5_filepath = h5_filepath
+        self.exposures = group['EXPOSURES'][:]
+        self.n_images = len(self.exposures)
+
+        # Get the camera_attributes from the device_properties
+        properties = labscript_utils.properties.get(
+            f, self.device_name, 'device_properties'
+        )
+        camera_attributes = properties['camera_attributes']
+        self.stop_acquisition_timeout = properties['stop_acquisition_timeout']
+        self.exception_on_failed_shot = properties['exception_on_failed_shot']
+        saved_attr_level = properties['saved_attribute_visibility_level']
+    # Only reprogram attributes that differ from those last programmed in, or all of
+    # them if a fresh reprogramming was requested:
+    if fresh:
+        self.smart_cache = {}
+    self.set_attributes_smart(camera_attributes)
+    # Get the camera attributes, so that we can save them to the H5 file:
+    if saved_attr_level is not None:
+        self.attributes_to_save = self.get_attributes_as_dict(saved_attr_level)
+    else:
+        self.attributes_to_save = None
+    print(f"Configuring camera for {self.n_images} images.")
+    self.camera.configure_acquisition(continuous=False, bufferCount=self.n_images)
+    self.images = []
+    self.acquisition_thread = threading.Thread(
+        target=self.camera.grab_multiple,
+        args=(self.n_images, self.images),
+        daemon=True,
+    )
+    self.acquisition_thread.start()
+    return {}
+
+
+def transition_to_manual_previous(self):
+    """The previous implementation of IMAQdxCameraWorker.transition_to_manual, for
+    comparison"""
+    if self.h5_filepath is None:
+        print('No camera exposures in this shot.\n')
+        return True
+    assert self.acquisition_thread is not None
+    self.acquisition_thread.join(timeout=self.stop_acquisition_timeout)
+    if self.acquisition_thread.is_alive():
+        msg = """Acquisition thread did not finish. Likely did not acquire expected
+            number of images. Check triggering is connected/configured correctly"""
+        if self.exception_on_failed_shot:
+            self.abort()
+            raise RuntimeError(dedent(msg))
+        else:
+            self.camera.abort_acquisition()
+            self.acquisition_thread.join()
+            print(dedent(msg), file=sys.stderr)
+    self.acquisition_thread = None
+
+    print("Stopping acquisition.")
+    self.camera.stop_acquisition()
+
+    print(f"Saving {len(self.images)}/{len(self.exposures)} images.")
+
+    with h5py.File(self.h5_filepath, 'r+') as f:
+        # Use orientation for image path, device_name if orientation unspecified
+        if self.orientation is not None:
+            image_path = 'images/' + self.orientation
+        else:
+            image_path = 'images/' + self.device_name
+        image_group = f.require_group(image_path)
+        image_group.attrs['camera'] = self.device_name
+
+        # Save camera attributes to the HDF5 file:
+        if self.attributes_to_save is not None:
+            set_attributes(image_group, self.attributes_to_save)
+
+        # Whether we failed to get all the expected exposures:
+        image_group.attrs['failed_shot'] = len(self.images) != len(self.exposures)
+
+        # key the images by name and frametype. Allow for the case of there being
+        # multiple images with the same name and frametype. In this case we will
+        # save an array of images in a single dataset.
+        images = {
+            (exposure['name'], exposure['frametype']): []
+            for exposure in self.exposures
+        }
+
+        # Iterate over expected exposures, sorted by acquisition time, to match them
+        # up with the acquired images:
+        self.exposures.sort(order='t')
+        for image, exposure in zip(self.images, self.exposures):
+            images[(exposure['name'], exposure['frametype'])].append(image)
+
+        # Save images to the HDF5 file:
+        for (name, frametype), imagelist in images.items():
+            data = imagelist[0] if len(imagelist) == 1 else np.array(imagelist)
+            print(f"Saving frame(s) {name}/{frametype}.")
+            group = image_group.require_group(name)
+            dset = group.create_dataset(
+                frametype, data=data, dtype='uint16', compression='gzip'
+            )
+            # Specify this dataset should be viewed as an image
+            dset.attrs['CLASS'] = np.bytes_('IMAGE')
+            dset.attrs['IMAGE_VERSION'] = np.bytes_('1.2')
+            dset.attrs['IMAGE_SUBCLASS'] = np.bytes_('IMAGE_GRAYSCALE')
+            dset.attrs['IMAGE_WHITE_IS_ZERO'] = np.uint8(0)
+
+    # If the images are all the same shape, send them to the GUI for display:
+    try:
+        image_block = np.stack(self.images)
+    except ValueError:
+        print("Cannot display images in the GUI, they are not all the same shape")
+    else:
+        self._send_image_to_parent(image_block)
+
+    self.images = None
+    self.n_images = None
+    self.attributes_to_save = None
+    self.exposures = None
+    self.h5_filepath = None
+    self.stop_acquisition_timeout = None
+    self.exception_on_failed_shot = None
+    print("Setting manual mode camera attributes.\n")
+    self.set_attributes_smart(self.manual_mode_camera_attributes)
+    if self.continuous_dt is not None:
+        # If continuous manual mode acquisition was in progress before the bufferd
+        # run, resume it:
+        self.start_continuous(self.continuous_dt)
+    return True
+
+
+def write_shot(path, n_images, interval):
+    """Write a shot file with n_images exposures, one every interval seconds"""
+    vlenstr = h5py.special_dtype(vlen=str)
+    table_dtypes = [
+        ('t', float),
+        ('name', vlenstr),
+        ('frametype', vlenstr),
+        ('trigger_duration', float),
+    ]
+    exposures = [
+        ((i + 1) * interval, EXPOSURE_NAMES[i % len(EXPOSURE_NAMES)], 'frame', 1e-3)
+        for i in range(n_images)
+    ]
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/' + DEVICE_NAME)
+        group.create_dataset('EXPOSURES', data=np.array(exposures, dtype=table_dtypes))
+        device_properties = {
+            'camera_attributes': {},
+            'stop_acquisition_timeout': 5.0,
+            'exception_on_failed_shot': True,
+            'saved_attribute_visibility_level': None,
+        }
+        labscript_utils.properties.set_device_properties(
+            f, DEVICE_NAME, device_properties
+        )
+
+
+def make_worker(size, interval):
+    """Return an initialised IMAQdxCameraWorker with a mock camera, without starting a
+    worker process or connecting to a BLACS tab to display images"""
+    worker = object.__new__(IMAQdxCameraWorker)
+    worker.device_name = DEVICE_NAME
+    worker.orientation = None
+    worker.camera_attributes = {}
+    worker.manual_mode_camera_attributes = {}
+    worker.parent_host = 'localhost'
+    # Nothing is listening on this port, images are not sent to it:
+    worker.image_receiver_port = 1
+    camera = TimedMockCamera(size, interval)
+    worker.get_camera = lambda: camera
+    worker.init()
+    worker._send_image_to_parent = lambda image: None
+    return worker
+
+
+def run_shot(path, size, interval, previous=False):
+    """Run a shot, returning the time taken by transition_to_manual"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        worker = make_worker(size, interval)
+        if previous:
+            worker.transition_to_buffered = types.MethodType(
+                transition_to_buffered_previous, worker
+            )
+            worker.transition_to_manual = types.MethodType(
+                transition_to_manual_previous, worker
+            )
+        try:
+            worker.transition_to_buffered(DEVICE_NAME, path, {}, True)
+            # Wait until the shot is over, by which time all the images are acquired:
+            worker.acquisition_thread.join()
+            start_time = time.perf_counter()
+            worker.transition_to_manual()
+            return time.perf_counter() - start_time
+        finally:
+            worker.shutdown()
+            worker.image_socket.close(linger=0)
+
+
+def read_images(path):
+    """Return a dict of the image datasets in the shot file, keyed by name"""
+    images = {}
+    with h5py.File(path, 'r') as f:
+        for name, group in f['images/' + DEVICE_NAME].items():
+            for frametype, dataset in group.items():
+                images[name, frametype] = dataset[:], dict(dataset.attrs)
+    return images
+
+
+def main(n_images=12, size=2048, interval=0.3):
+    n_images = int(n_images)
+    size = int(size)
+    interval = float(interval)
+    paths = []
+    try:
+        results = []
+        for description, previous in [('previous', True), ('background writer', False)]:
+            fd, path = tempfile.mkstemp(suffix='.h5')
+            os.close(fd)
+            paths.append(path)
+            write_shot(path, n_images, interval)
+            duration = run_shot(path, size, interval, previous)
+            results.append((description, read_images(path), duration))
+        (_, expected, _), (_, images, _) = results
+        assert images.keys() == expected.keys()
+        for key, (data, attrs) in images.items():
+            expected_data, expected_attrs = expected[key]
+            assert np.array_equal(data, expected_data)
+            assert data.dtype == expected_data.dtype
+            assert attrs == expected_attrs
+        print('%d %dx%d images in %d datasets, identical' % (n_images, size, size, len(images)))
+        for description, _, duration in results:
+            print('%s: transition_to_manual took %.3f s' % (description, duration))
+    finally:
+        for path in paths:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
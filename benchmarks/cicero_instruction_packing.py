@@ -0,0 +1,95 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/cicero_instruction_packing.py                         #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time packing the PULSE_PROGRAM of a CiceroOpalKellyXEM3001 into the bytes written
+to the FPGA, compared with packing each instruction in a Python loop, as was done
+previously. That both give identical bytes, and that unpacking them gives back the
+pulse program, is tested in tests/test_CiceroOpalKellyXEM3001_packing.py.
+
+Usage: python cicero_instruction_packing.py [n_instructions]"""
+
+import sys
+import time
+
+import numpy as np
+
+from labscript_devices.CiceroOpalKellyXEM3001 import instructions_to_bytes
+
+
+def int_to_bytes(n, m):
+    """Part of the previous implementation, for comparison"""
+    return [(n >> (i * 8)) & 0xFF for i in range(m - 1, -1, -1)]
+
+
+def add_instruction_to_bytearray(data, instruction, on, off, reps):
+    """The previous implementation of packing an instruction, for comparison"""
+    on_period = int_to_bytes(on, 6)
+    off_period = int_to_bytes(off, 6)
+    reps = int_to_bytes(reps, 4)
+    offset = 16 * instruction
+    data[offset + 0] = on_period[1]
+    data[offset + 1] = on_period[0]
+    data[offset + 2] = on_period[3]
+    data[offset + 3] = on_period[2]
+    data[offset + 4] = on_period[5]
+    data[offset + 5] = on_period[4]
+    data[offset + 6] = off_period[1]
+    data[offset + 7] = off_period[0]
+    data[offset + 8] = off_period[3]
+    data[offset + 9] = off_period[2]
+    data[offset + 10] = off_period[5]
+    data[offset + 11] = off_period[4]
+    data[offset + 12] = reps[1]
+    data[offset + 13] = reps[0]
+    data[offset + 14] = reps[3]
+    data[offset + 15] = reps[2]
+
+
+def instructions_to_bytes_loop(pulse_program):
+    data = bytearray(len(pulse_program) * 16)
+    for i, instruction in enumerate(pulse_program):
+        add_instruction_to_bytearray(
+            data,
+            i,
+            instruction['on_period'],
+            instruction['off_period'],
+            instruction['reps'],
+        )
+    return data
+
+
+def main(n_instructions=100000):
+    n_instructions = int(n_instructions)
+    rng = np.random.RandomState(0)
+    dtypes = [('on_period', np.int64), ('off_period', np.int64), ('reps', np.int64)]
+    pulse_program = np.zeros(n_instructions, dtype=dtypes)
+    # Values spanning the full width of each field, including its extremes:
+    pulse_program['on_period'] = rng.randint(0, 2 ** 48, n_instructions, dtype=np.int64)
+    pulse_program['off_period'] = rng.randint(0, 2 ** 48, n_instructions, dtype=np.int64)
+    pulse_program['reps'] = rng.randint(0, 2 ** 32, n_instructions, dtype=np.int64)
+    pulse_program[0] = (2 ** 48 - 1, 2 ** 48 - 1, 2 ** 32 - 1)
+    pulse_program[-1] = (1, 2, 0)
+
+    start_time = time.perf_counter()
+    instructions_to_bytes_loop(pulse_program)
+    loop_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    instructions_to_bytes(pulse_program)
+    vectorised_time = time.perf_counter() - start_time
+    print(
+        '%d instructions: loop %.3f s, vectorised %.4f s'
+        % (n_instructions, loop_time, vectorised_time)
+    )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
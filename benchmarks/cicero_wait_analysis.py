@@ -0,0 +1,144 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/cicero_wait_analysis.py                               #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Run a shot with waits on a CiceroOpalKellyXEM3001Worker, using MockFrontPanel in
+place of the device, calling status_monitor at the interval the tab does. Count the
+number of times the status of the device is read, measure how long after the end of
+the shot the tab would be notified, and check the measured wait durations.
+
+Usage: python cicero_wait_analysis.py [shot_duration] [latency]
+
+where latency is the time in seconds each read of the status of the device takes."""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+
+from labscript_devices.CiceroOpalKellyXEM3001 import CiceroOpalKellyXEM3001Worker
+from labscript_devices.testing.mock_frontpanel import MockFrontPanel
+
+CLOCK_FREQUENCY = 100e6
+# Interval at which the tab calls status_monitor:
+POLL_INTERVAL = 0.1
+# Wait timeouts, and how long each wait actually lasts:
+WAIT_TIMEOUTS = [1.0, 1.0, 0.25]
+WAIT_DURATIONS = [0.2, 0.35, 0.5]
+
+
+def write_shot_file(path, shot_duration):
+    """Write a shot file with a pulse program of 1000 instructions of 1 MHz ticks in
+    total lasting shot_duration, with waits evenly spaced throughout"""
+    n_instructions = 1000
+    n_waits = len(WAIT_TIMEOUTS)
+    reps = int(shot_duration * 1e6 / n_instructions)
+    dtypes = [('on_period', np.int64), ('off_period', np.int64), ('reps', np.int64)]
+    pulse_program = np.zeros(n_instructions + n_waits, dtype=dtypes)
+    pulse_program['on_period'] = 50
+    pulse_program['off_period'] = 50
+    pulse_program['reps'] = reps
+    wait_indices = np.arange(1, n_waits + 1) * n_instructions // (n_waits + 1)
+    wait_indices += np.arange(n_waits)
+    wait_times = wait_indices - np.arange(n_waits)
+    wait_times = wait_times * reps * 100 / CLOCK_FREQUENCY
+    for index, timeout in zip(wait_indices, WAIT_TIMEOUTS):
+        pulse_program[index] = (round(timeout * CLOCK_FREQUENCY) - 1, 3, 0)
+    waits = np.zeros(
+        n_waits, dtype=[('label', 'S256'), ('time', float), ('timeout', float)]
+    )
+    waits['label'] = ['wait %d' % i for i in range(n_waits)]
+    waits['time'] = wait_times
+    waits['timeout'] = WAIT_TIMEOUTS
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('devices/cicero/PULSE_PROGRAM', data=pulse_program)
+        dataset = f.create_dataset('waits', data=waits)
+        dataset.attrs['wait_monitor_acquisition_device'] = (
+            'cicero_internal_wait_monitor_outputs'
+        )
+        dataset.attrs['wait_monitor_timeout_device'] = (
+            'cicero_internal_wait_monitor_outputs'
+        )
+        labscript_utils.properties.set_device_properties(
+            f, 'cicero', {'is_master_pseudoclock': True, 'stop_time': shot_duration}
+        )
+        properties = {
+            'trigger_debounce_clock_ticks': 10,
+            'clock_frequency': CLOCK_FREQUENCY,
+        }
+        connection_table = np.array(
+            [(b'cicero', labscript_utils.properties.serialise(properties))],
+            dtype=[('name', 'S256'), ('properties', 'S2048')],
+        )
+        f.create_dataset('connection table', data=connection_table)
+
+
+def make_worker(latency):
+    """Return an initialised CiceroOpalKellyXEM3001Worker connected to a MockFrontPanel,
+    without starting a worker process"""
+    worker = object.__new__(CiceroOpalKellyXEM3001Worker)
+    worker.serial = '1'
+    worker.reference_clock = 'internal'
+    worker.logger = logging.getLogger('cicero')
+    ok = types.ModuleType('ok')
+    ok.okCFrontPanel = lambda: MockFrontPanel(
+        CLOCK_FREQUENCY, latency=latency, wait_durations=WAIT_DURATIONS
+    )
+    sys.modules['ok'] = ok
+    try:
+        worker.init()
+    finally:
+        del sys.modules['ok']
+    return worker
+
+
+def main(shot_duration=2.0, latency=0.001):
+    shot_duration, latency = float(shot_duration), float(latency)
+    worker = make_worker(latency)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        write_shot_file(path, shot_duration)
+        worker.transition_to_buffered('cicero', path, {}, True)
+        n_reads = worker.dev.wire_out_updates
+        worker.start_run()
+        # Call status_monitor as the tab does, until it reports the shot is done:
+        n_calls = 0
+        while True:
+            n_calls += 1
+            if worker.status_monitor():
+                break
+            time.sleep(POLL_INTERVAL)
+        detection_time = time.perf_counter() - worker.dev.end_time
+        n_reads = worker.dev.wire_out_updates - n_reads
+        worker.transition_to_manual()
+        with h5py.File(path, 'r') as f:
+            waits = f['data/waits'][:]
+    finally:
+        os.unlink(path)
+    expected_durations = np.minimum(WAIT_DURATIONS, WAIT_TIMEOUTS)
+    assert np.allclose(waits['duration'], expected_durations)
+    assert list(waits['timed_out']) == list(expected_durations >= WAIT_TIMEOUTS)
+    print(
+        '%d status_monitor calls, %d status reads, shot end detected after %.1f ms'
+        % (n_calls, n_reads, detection_time * 1e3)
+    )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,113 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/narwhal_serial_reader.py                              #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time NarwhalPulseGenWorker reading a stream of messages from the device, as sent
+whilst polling its state during a shot, through a MockNarwhalPulseGenSerial. Check the
+messages are the same as those read by the previous implementation, which read each
+message identifier and the rest of each message separately, and count the reads from
+the serial port each makes.
+
+Usage: python narwhal_serial_reader.py [n_messages]"""
+
+import struct
+import sys
+import time
+import types
+
+import numpy as np
+
+from labscript_devices.NarwhalPulseGen import transcode
+from labscript_devices.NarwhalPulseGen.testing.mock_narwhal import (
+    MockNarwhalPulseGenSerial,
+    make_worker,
+)
+
+
+def _get_message_previous(self, timeout=0.0, print_all_messages=False):
+    """The previous implementation of NarwhalPulseGenWorker._get_message, for
+    comparison"""
+    t0 = time.time()
+    self.ser.timeout = timeout
+    byte_message_identifier = self.ser.read(1)
+    if byte_message_identifier != b'':
+        message_identifier, = struct.unpack('B', byte_message_identifier)
+        if message_identifier not in transcode.msgin_decodeinfo.keys():
+            print('The computer read a an invalid message identifier.')
+            return None, None
+        decode_function = transcode.msgin_decodeinfo[message_identifier]['decode_function']
+        if timeout:
+            self.ser.timeout = max(timeout - (time.time() - t0), 0.0)
+        byte_message = self.ser.read(
+            transcode.msgin_decodeinfo[message_identifier]['message_length'] - 1
+        )
+        if print_all_messages:
+            print(decode_function(byte_message))
+        return message_identifier, decode_function(byte_message)
+    return None, None
+
+
+def recorded_stream(n_messages, seed=0):
+    """Return a stream of device state messages, each followed by a few
+    notifications, as the device sends whilst being polled during a shot"""
+    rng = np.random.RandomState(seed)
+    device = MockNarwhalPulseGenSerial()
+    device.final_ram_address = 8191
+    messages = []
+    while len(messages) < n_messages:
+        device.current_address = int(rng.randint(0, 8192))
+        device.state = int(rng.randint(0, 2 ** 24))
+        messages.append(device.devicestate())
+        for _ in range(rng.randint(0, 4)):
+            address = int(rng.randint(0, 8192))
+            tags = int(rng.randint(0, 8))
+            messages.append(
+                bytes([transcode.msgin_identifier['notification']])
+                + address.to_bytes(2, 'little')
+                + bytes([tags])
+            )
+    return b''.join(messages[:n_messages])
+
+
+def read_stream(worker, stream):
+    """Have the mock device send the stream all at once, and return the messages the
+    worker reads, the number of reads from the serial port and the time taken"""
+    worker.ser.responses.append((0, stream))
+    n_reads = worker.ser.n_reads
+    start_time = time.perf_counter()
+    messages = worker.read_all_messages_in_pipe()
+    duration = time.perf_counter() - start_time
+    return messages, worker.ser.n_reads - n_reads, duration
+
+
+def main(n_messages=20000):
+    stream = recorded_stream(int(n_messages))
+    worker = make_worker()
+    messages, n_reads, duration = read_stream(worker, stream)
+    worker._get_message = types.MethodType(_get_message_previous, worker)
+    expected, n_reads_previous, duration_previous = read_stream(worker, stream)
+
+    assert messages.keys() == expected.keys()
+    for identifier in expected:
+        assert len(messages[identifier]) == len(expected[identifier])
+        for message, expected_message in zip(messages[identifier], expected[identifier]):
+            assert message.keys() == expected_message.keys()
+            for key, value in expected_message.items():
+                assert np.array_equal(message[key], value), key
+    n_read = sum(len(messages[identifier]) for identifier in messages)
+    assert n_read == int(n_messages)
+    print('%d messages, %d bytes' % (n_read, len(stream)))
+    print('previous: %d reads in %.3f s' % (n_reads_previous, duration_previous))
+    print('buffered: %d reads in %.3f s' % (n_reads, duration))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
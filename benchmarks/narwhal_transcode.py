@@ -0,0 +1,115 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/narwhal_transcode.py                                  #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Compare the throughput of encoding a random table of NarwhalPulseGen instructions,
+and decoding a random stream of device state messages, all at once versus one message
+at a time, and with the rate at which the 12 Mbaud serial link can carry the messages.
+The correctness of the batched functions is tested in
+tests/test_NarwhalPulseGen_transcode.py.
+
+Usage: python narwhal_transcode.py [n_messages]"""
+
+import sys
+import time
+
+import numpy as np
+
+from labscript_devices.NarwhalPulseGen import transcode
+
+# Bytes per second over the serial link, with a start and stop bit per byte:
+LINK_RATE = 12e6 / 10
+
+
+def random_instructions(rng, n_instructions):
+    """Return a table of random instructions, with each field spanning its full range
+    in the message format"""
+    instructions = np.zeros(n_instructions, dtype=transcode.instruction_dtype)
+    instructions['address'] = rng.randint(0, 2 ** 16, n_instructions)
+    instructions['state'] = rng.randint(0, 2 ** 24, n_instructions)
+    instructions['duration'] = rng.randint(1, 2 ** 48, n_instructions, dtype=np.int64)
+    instructions['goto_address'] = rng.randint(0, 2 ** 16, n_instructions)
+    instructions['goto_counter'] = rng.randint(0, 2 ** 32, n_instructions, dtype=np.int64)
+    for name in ['stop_and_wait', 'hardware_trig_out', 'notify_computer', 'powerline_sync']:
+        instructions[name] = rng.randint(0, 2, n_instructions)
+    return instructions
+
+
+def encode_instructions_loop(instructions):
+    """Encode the instructions one at a time"""
+    return b''.join(
+        transcode.encode_instruction(
+            address=int(instruction['address']),
+            state=int(instruction['state']),
+            duration=int(instruction['duration']),
+            goto_address=int(instruction['goto_address']),
+            goto_counter=int(instruction['goto_counter']),
+            stop_and_wait=bool(instruction['stop_and_wait']),
+            hardware_trig_out=bool(instruction['hardware_trig_out']),
+            notify_computer=bool(instruction['notify_computer']),
+            powerline_sync=bool(instruction['powerline_sync']),
+        )
+        for instruction in instructions
+    )
+
+
+def random_devicestates(rng, n_messages):
+    """Return a stream of random device state messages, with valid tags"""
+    messages = rng.randint(0, 256, (n_messages, 17)).astype(np.uint8)
+    messages[:, 0] = transcode.msgin_identifier['devicestate']
+    # Tags of 6 bits, without the undefined trigger mode 3:
+    tags = rng.randint(0, 2 ** 6, n_messages).astype(np.uint8)
+    tags[(tags >> 1) & 0b11 == 3] &= ~np.uint8(0b110)
+    messages[:, 14] = tags
+    return messages.tobytes()
+
+
+def decode_devicestates_loop(messages):
+    """Decode the messages one at a time, skipping each message identifier as
+    NarwhalPulseGenWorker._get_message does"""
+    return [
+        transcode.decode_devicestate(messages[i + 1 : i + 17])
+        for i in range(0, len(messages), 17)
+    ]
+
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def main(n_messages=20000):
+    n_messages = int(n_messages)
+    rng = np.random.RandomState(0)
+    instructions = random_instructions(rng, n_messages)
+    _, loop_time = timed(encode_instructions_loop, instructions)
+    data, batched_time = timed(transcode.encode_instructions, instructions)
+    messages = random_devicestates(rng, n_messages)
+    _, decode_loop_time = timed(decode_devicestates_loop, messages)
+    _, decode_batched_time = timed(transcode.decode_devicestates, messages)
+    for description, n_bytes, loop_time, batched_time in [
+        ('encoding instructions', len(data), loop_time, batched_time),
+        ('decoding device states', len(messages), decode_loop_time, decode_batched_time),
+    ]:
+        print(
+            '%s: one at a time %.2f MB/s, batched %.1f MB/s, link %.1f MB/s'
+            % (
+                description,
+                n_bytes / loop_time / 1e6,
+                n_bytes / batched_time / 1e6,
+                LINK_RATE / 1e6,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
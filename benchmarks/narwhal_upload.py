@@ -0,0 +1,179 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/narwhal_upload.py                                     #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Compile a shot for a NarwhalPulseGen with labscript, check that running the
+instruction table produces the expected outputs, and time uploading it in
+NarwhalPulseGenWorker.transition_to_buffered, using MockNarwhalPulseGenSerial in place
+of the device. Compare with uploading one instruction per write, and with uploading a
+shot in which a few instructions differ from the previous one. That uploads load the
+right instructions into the device's memory is tested in
+tests/test_NarwhalPulseGen_upload.py.
+
+Usage: python narwhal_upload.py [n_pulses]"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from labscript_devices.NarwhalPulseGen import transcode
+from labscript_devices.NarwhalPulseGen.testing.mock_narwhal import (
+    MockNarwhalPulseGenSerial,
+    make_worker,
+)
+
+PULSE_DURATION = 1e-5
+RAMP_DURATION = 0.01
+RAMP_RATE = 1e5
+
+
+def compile_shot(path, n_pulses):
+    """Compile a shot with n_pulses pulses on a direct output, followed by a ramp
+    clocked by a clock line, a wait, and a final change to both"""
+    from labscript import (
+        labscript_init,
+        start,
+        stop,
+        wait,
+        AnalogOut,
+        ClockLine,
+        DigitalOut,
+    )
+    from labscript_devices.DummyIntermediateDevice import DummyIntermediateDevice
+    from labscript_devices.NarwhalPulseGen.labscript_devices import NarwhalPulseGen
+
+    labscript_init(path, new=True, overwrite=True)
+    narwhal = NarwhalPulseGen('narwhal', usbport='COM1')
+    pulses = DigitalOut('pulses', narwhal.direct_outputs, 'flag 0')
+    clock_line = ClockLine('clock_line', narwhal.pseudoclock, 'flag 1')
+    dummy = DummyIntermediateDevice('dummy', clock_line)
+    analog_out = AnalogOut('analog_out', dummy, 'ao0')
+    start()
+    t = 0
+    for _ in range(n_pulses):
+        pulses.go_high(t)
+        t += PULSE_DURATION
+        pulses.go_low(t)
+        t += PULSE_DURATION
+    analog_out.ramp(t, RAMP_DURATION, 0, 1, RAMP_RATE)
+    t += RAMP_DURATION
+    wait('wait', t, timeout=1)
+    t += 1e-3
+    analog_out.constant(t, 2)
+    pulses.go_high(t)
+    t += 1e-3
+    stop(t)
+
+
+def run_program(instructions):
+    """Return the state of the outputs after each instruction the device executes, and
+    the cycle at which it starts, disregarding time spent waiting for triggers"""
+    states, start_cycles = [], []
+    counters = {}
+    cycle = 0
+    address = 0
+    while True:
+        instruction = instructions[address]
+        states.append(instruction['state'])
+        start_cycles.append(cycle)
+        cycle += int(instruction['duration'])
+        if instruction['goto_counter']:
+            remaining = counters.get(address, instruction['goto_counter'])
+            if remaining:
+                counters[address] = remaining - 1
+                address = int(instruction['goto_address'])
+                continue
+            del counters[address]
+        if address == len(instructions) - 1:
+            return np.array(states), np.array(start_cycles)
+        address += 1
+
+
+def check_program(path, instructions, n_pulses):
+    """Check the output produced by the instructions has the expected number of pulses
+    and clock ticks, and lasts until the stop time of the shot"""
+    states, start_cycles = run_program(instructions)
+    with h5py.File(path, 'r') as f:
+        n_ticks = len(f['devices/dummy/OUTPUTS'])
+        stop_time = f['devices/narwhal'].attrs['stop_time']
+    for output, n_rising_edges in [(0, n_pulses + 1), (1, n_ticks)]:
+        output_states = (states >> output) & 1
+        assert output_states[0] + np.sum(output_states[1:] > output_states[:-1]) == n_rising_edges
+    cycle_period = 10e-9
+    assert abs(start_cycles[-1] * cycle_period - stop_time) < 1e-6
+    assert instructions['stop_and_wait'].sum() == 1
+
+
+def main(n_pulses=4000):
+    n_pulses = int(n_pulses)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        compile_shot(path, n_pulses)
+        with h5py.File(path, 'r') as f:
+            instructions = f['devices/narwhal/PULSE_PROGRAM'][:]
+        check_program(path, instructions, n_pulses)
+        link_rate = MockNarwhalPulseGenSerial().baudrate / 10
+
+        worker = make_worker()
+        device = worker.ser
+        results = []
+        for description, fresh in [('fresh', True), ('unchanged', False)]:
+            bytes_written = device.bytes_written
+            start_time = time.perf_counter()
+            worker.transition_to_buffered('narwhal', path, {}, fresh)
+            duration = time.perf_counter() - start_time
+            results.append((description, device.bytes_written - bytes_written, duration))
+
+        # Change a few instructions, as if the next shot differed slightly:
+        changed = np.random.RandomState(0).choice(len(instructions), 10, replace=False)
+        instructions['duration'][changed] += 1
+        with h5py.File(path, 'a') as f:
+            f['devices/narwhal/PULSE_PROGRAM'][:] = instructions
+        bytes_written = device.bytes_written
+        start_time = time.perf_counter()
+        worker.transition_to_buffered('narwhal', path, {}, False)
+        duration = time.perf_counter() - start_time
+        results.append(('10 changed', device.bytes_written - bytes_written, duration))
+
+        # One instruction per write:
+        start_time = time.perf_counter()
+        for instruction in instructions:
+            worker.write_instructions(
+                transcode.encode_instruction(
+                    **{name: instruction[name].item() for name in instructions.dtype.names}
+                )
+            )
+        results.append(
+            (
+                'one per write',
+                len(instructions) * transcode.instruction_message_dtype.itemsize,
+                time.perf_counter() - start_time,
+            )
+        )
+    finally:
+        os.unlink(path)
+
+    print('%d instructions, link %.2f MB/s' % (len(instructions), link_rate / 1e6))
+    for description, n_bytes, duration in results:
+        print(
+            '%s: %d bytes in %.3f s, %.2f MB/s'
+            % (description, n_bytes, duration, n_bytes / duration / 1e6)
+        )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,328 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/ni_daqmx_acquisition.py                               #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Run a shot of the given duration on NI_DAQmxAcquisitionWorker, acquiring n_chans
+analog inputs at the given rate from a mock DAQmx task. Measure the peak memory
+allocated during the shot and during transition_to_manual, and the time taken by
+transition_to_manual, compared with the previous implementation, which kept the
+acquired data in memory as a list of arrays and concatenated them at the end of the
+shot. Check that both write identical traces to the shot file.
+
+The worker uses the stand-in for PyDAQmx in mock_daqmx, so neither PyDAQmx nor the
+NI-DAQmx library is required.
+
+Usage: python ni_daqmx_acquisition.py [duration] [rate] [n_chans]"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties as properties
+from labscript_utils import dedent
+from labscript_utils.connections import _ensure_str
+
+from labscript_devices.NI_DAQmx.testing import mock_daqmx
+
+sys.modules.update(mock_daqmx.pydaqmx_modules())
+from labscript_devices.NI_DAQmx.blacs_workers import (
+    NI_DAQmxAcquisitionWorker,
+    DAQmx_Val_GroupByScanNumber,
+    int32,
+)
+from labscript_devices.NI_DAQmx.utils import split_conn_AI
+
+DEVICE_NAME = 'ni_card'
+# Number of acquisitions on each channel, spread over the shot:
+ACQUISITIONS_PER_CHAN = 4
+
+
+def read_previous(self, task_handle, event_type, num_samples, callback_data=None):
+    """The previous implementation of NI_DAQmxAcquisitionWorker.read, for comparison"""
+    samples_read = int32()
+    with self.tasklock:
+        if self.task is None or task_handle != self.task.taskHandle.value:
+            # Task stopped already.
+            return 0
+        self.task.ReadAnalogF64(
+            num_samples,
+            -1,
+            DAQmx_Val_GroupByScanNumber,
+            self.read_array,
+            self.read_array.size,
+            samples_read,
+            None,
+        )
+        # Select only the data read, and downconvert to 32 bit:
+        data = self.read_array[: int(samples_read.value), :].astype(np.float32)
+        if self.buffered_mode:
+            # Append to the list of acquired data:
+            self.acquired_data.append(data)
+        else:
+            # TODO: Send it to the broker thingy.
+            pass
+    return 0
+
+
+def transition_to_buffered_previous(self, device_name, h5file, initial_values, fresh):
+    """The previous implementation of NI_DAQmxAcquisitionWorker.transition_to_buffered,
+    for comparison"""
+    self.logger.debug('transition_to_buffered')
+
+    # read channels, acquisition rate, etc from H5 file
+    with h5py.File(h5file, 'r') as f:
+        group = f['/devices/' + device_name]
+        if 'AI' not in group:
+            # No acquisition
+            return {}
+        AI_table = group['AI'][:]
+        device_properties = properties.get(f, device_name, 'device_properties')
+
+    chans = [_ensure_str(c) for c in AI_table['connection']]
+    # Remove duplicates and sort:
+    if chans:
+        self.buffered_chans = sorted(set(chans), key=split_conn_AI)
+    self.h5_file = h5file
+    self.buffered_rate = device_properties['acquisition_rate']
+    self.acquired_data = []
+    # Stop the manual mode task and start the buffered mode task:
+    self.stop_task()
+    self.buffered_mode = True
+    self.start_task(self.buffered_chans, self.buffered_rate)
+    return {}
+
+
+def transition_to_manual_previous(self, abort=False):
+    """The previous implementation of NI_DAQmxAcquisitionWorker.transition_to_manual,
+    for comparison"""
+    self.logger.debug('transition_to_manual')
+    #  If we were doing buffered mode acquisition, stop the buffered mode task and
+    # start the manual mode task. We might not have been doing buffered mode
+    # acquisition if abort() was called when we are not in buffered mode, or if
+    # there were no acuisitions this shot.
+    if not self.buffered_mode:
+        return True
+    if self.buffered_chans is not None:
+        self.stop_task()
+    self.buffered_mode = False
+    self.logger.info('transitioning to manual mode, task stopped')
+    self.start_task(self.manual_mode_chans, self.manual_mode_rate)
+
+    if abort:
+        self.acquired_data = None
+        self.buffered_chans = None
+        self.h5_file = None
+        self.buffered_rate = None
+        return True
+
+    with h5py.File(self.h5_file, 'a') as hdf5_file:
+        data_group = hdf5_file['data']
+        data_group.create_group(self.device_name)
+        waits_in_use = len(hdf5_file['waits']) > 0
+
+    if self.buffered_chans is not None and not self.acquired_data:
+        msg = """No data was acquired. Perhaps the acquisition task was not
+            triggered to start, is the device connected to a pseudoclock?"""
+        raise RuntimeError(dedent(msg))
+    # Concatenate our chunks of acquired data and recast them as a structured
+    # array with channel names:
+    if self.acquired_data:
+        start_time = time.time()
+        dtypes = [(chan, np.float32) for chan in self.buffered_chans]
+        raw_data = np.concatenate(self.acquired_data).view(dtypes)
+        raw_data = raw_data.reshape((len(raw_data),))
+        self.acquired_data = None
+        self.buffered_chans = None
+        self.extract_measurements(raw_data, waits_in_use)
+        self.h5_file = None
+        self.buffered_rate = None
+        msg = 'data written, time taken: %ss' % str(time.time() - start_time)
+    else:
+        msg = 'No acquisitions in this shot.'
+    self.logger.info(msg)
+
+    return True
+
+
+def extract_measurements_previous(self, raw_data, waits_in_use):
+    """The previous implementation of NI_DAQmxAcquisitionWorker.extract_measurements,
+    for comparison"""
+    self.logger.debug('extract_measurements')
+    if waits_in_use:
+        # There were waits in this shot. We need to wait until the other process has
+        # determined their durations before we proceed:
+        self.wait_durations_analysed.wait(self.h5_file)
+
+    with h5py.File(self.h5_file, 'a') as hdf5_file:
+        if waits_in_use:
+            # get the wait start times and durations
+            waits = hdf5_file['/data/waits']
+            wait_times = waits['time']
+            wait_durations = waits['duration']
+        try:
+            acquisitions = hdf5_file['/devices/' + self.device_name + '/AI']
+        except KeyError:
+            # No acquisitions!
+            return
+        try:
+            measurements = hdf5_file['/data/traces']
+        except KeyError:
+            # Group doesn't exist yet, create it:
+            measurements = hdf5_file.create_group('/data/traces')
+
+        t0 = self.AI_start_delay
+        for connection, label, t_start, t_end, _, _, _ in acquisitions:
+            connection = _ensure_str(connection)
+            label = _ensure_str(label)
+            if waits_in_use:
+                # add durations from all waits that start prior to t_start of
+                # acquisition
+                t_start += wait_durations[(wait_times < t_start)].sum()
+                # compare wait times to t_end to allow for waits during an
+                # acquisition
+                t_end += wait_durations[(wait_times < t_end)].sum()
+            i_start = int(np.ceil(self.buffered_rate * (t_start - t0)))
+            i_end = int(np.floor(self.buffered_rate * (t_end - t0)))
+            # np.ceil does what we want above, but float errors can miss the
+            # equality:
+            if t0 + (i_start - 1) / self.buffered_rate - t_start > -2e-16:
+                i_start -= 1
+            # We want np.floor(x) to yield the largest integer < x (not <=):
+            if t_end - t0 - i_end / self.buffered_rate < 2e-16:
+                i_end -= 1
+            t_i = t0 + i_start / self.buffered_rate
+            t_f = t0 + i_end / self.buffered_rate
+            times = np.linspace(t_i, t_f, i_end - i_start + 1, endpoint=True)
+            values = raw_data[connection][i_start : i_end + 1]
+            dtypes = [('t', np.float64), ('values', np.float32)]
+            data = np.empty(len(values), dtype=dtypes)
+            data['t'] = times
+            data['values'] = values
+            measurements.create_dataset(label, data=data)
+
+
+def write_shot(path, duration, rate, n_chans):
+    """Write a shot file with ACQUISITIONS_PER_CHAN acquisitions on each channel,
+    together covering most of the shot. Acquisitions end well before the shot does, so
+    that all their samples have been acquired by the end of it."""
+    dtypes = [
+        ('connection', 'a256'),
+        ('label', 'a256'),
+        ('start', float),
+        ('stop', float),
+        ('wait label', 'a256'),
+        ('scale factor', float),
+        ('units', 'a256'),
+    ]
+    edges = np.linspace(0, 0.8 * duration, ACQUISITIONS_PER_CHAN + 1)
+    acquisitions = []
+    for i in range(n_chans):
+        for j, (start, stop) in enumerate(zip(edges[:-1], edges[1:])):
+            label = 'ai%d_%d' % (i, j)
+            acquisitions.append(('ai%d' % i, label, start, stop, '', 1.0, 'Volts'))
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/' + DEVICE_NAME)
+        group.create_dataset('AI', data=np.array(acquisitions, dtype=dtypes))
+        properties.set_device_properties(f, DEVICE_NAME, {'acquisition_rate': rate})
+        f.create_dataset('waits', data=np.zeros(0))
+        f.create_group('data')
+
+
+def make_worker(n_chans):
+    worker = object.__new__(NI_DAQmxAcquisitionWorker)
+    worker.device_name = DEVICE_NAME
+    worker.MAX_name = 'Dev1'
+    worker.num_AI = n_chans
+    worker.AI_range = (-10.0, 10.0)
+    worker.AI_start_delay = 0
+    worker.clock_terminal = '/Dev1/PFI0'
+    worker.logger = logging.getLogger(__name__)
+    worker.init()
+    return worker
+
+
+def run_shot(path, duration, previous=False):
+    """Run a shot, returning the peak memory allocated during the shot and during
+    transition_to_manual, and the time taken by transition_to_manual"""
+    with h5py.File(path, 'r') as f:
+        n_chans = len(set(f['devices/%s/AI' % DEVICE_NAME]['connection']))
+    worker = make_worker(n_chans)
+    if previous:
+        worker.read = types.MethodType(read_previous, worker)
+        worker.transition_to_buffered = types.MethodType(
+            transition_to_buffered_previous, worker
+        )
+        worker.transition_to_manual = types.MethodType(
+            transition_to_manual_previous, worker
+        )
+        worker.extract_measurements = types.MethodType(
+            extract_measurements_previous, worker
+        )
+    tracemalloc.start()
+    try:
+        worker.transition_to_buffered(DEVICE_NAME, path, {}, True)
+        time.sleep(duration)
+        _, shot_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        worker.transition_to_manual()
+        transition_time = time.perf_counter() - start_time
+        _, transition_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        worker.shutdown()
+    return shot_peak, transition_peak, transition_time
+
+
+def main(duration=5, rate=100000, n_chans=8):
+    duration = float(duration)
+    rate = float(rate)
+    n_chans = int(n_chans)
+    paths = []
+    try:
+        results = []
+        for description, previous in [('previous', True), ('streamed', False)]:
+            fd, path = tempfile.mkstemp(suffix='.h5')
+            os.close(fd)
+            paths.append(path)
+            write_shot(path, duration, rate, n_chans)
+            shot_peak, transition_peak, transition_time = run_shot(
+                path, duration, previous
+            )
+            with h5py.File(path, 'r') as f:
+                traces = {name: dataset[:] for name, dataset in f['data/traces'].items()}
+            results.append(
+                (description, traces, shot_peak, transition_peak, transition_time)
+            )
+        (_, expected, *_), (_, traces, *_) = results
+        assert traces.keys() == expected.keys()
+        for name in traces:
+            assert traces[name].tobytes() == expected[name].tobytes()
+        n_samples = sum(len(trace) for trace in traces.values())
+        print('%d samples in %d traces, identical' % (n_samples, len(traces)))
+        for description, _, shot_peak, transition_peak, transition_time in results:
+            msg = '%s: peak memory %.1f MB during shot, %.1f MB during '
+            msg += 'transition_to_manual, which took %.3f s'
+            print(msg % (description, shot_peak / 1e6, transition_peak / 1e6, transition_time))
+    finally:
+        for path in paths:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
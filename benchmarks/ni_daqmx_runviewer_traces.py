@@ -0,0 +1,230 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/ni_daqmx_runviewer_traces.py                          #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time the NI_DAQmx runviewer parser constructing the traces of a shot of n_ticks
+clock ticks on a device with n_ports 32-line digital ports and n_AO analog outputs,
+compared with its previous implementation, which extracted each digital line with its
+own shift and mask and built traces for every output, connected or not. Check that
+both produce identical traces.
+
+Shots are parsed with every output connected, and with only every other one
+connected. Each is parsed N_REPEATS times and the fastest time reported, since the
+traces take enough memory that the time taken to allocate it varies considerably.
+
+Usage: python ni_daqmx_runviewer_traces.py [n_ticks] [n_ports] [n_AO]"""
+
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties as properties
+from labscript_utils import dedent
+
+from labscript_devices.NI_DAQmx.runviewer_parsers import NI_DAQmxParser
+
+DEVICE_NAME = 'ni_card'
+NUM_LINES = 32
+N_REPEATS = 5
+
+
+def get_traces_previous(self, add_trace, clock=None):
+    """The previous implementation of NI_DAQmxParser.get_traces, for comparison"""
+
+    with h5py.File(self.path, 'r') as f:
+
+        group = f['devices/' + self.name]
+
+        if 'AO' in group:
+            AO_table = group['AO'][:]
+        else:
+            AO_table = None
+
+        if 'DO' in f['devices/%s' % self.name]:
+            DO_table = group['DO'][:]
+        else:
+            DO_table = None
+
+        props = properties.get(f, self.name, 'connection_table_properties')
+
+        version = props.get('__version__', None)
+        if version is None:
+            msg = """Shot was compiled with the old version of the NI_DAQmx device
+                class. The new runviewer parser is not backward compatible with old
+                shot files. Either downgrade labscript_devices to 2.2.0 or less, or
+                recompile the shot with labscript_devices 2.3.0 or greater."""
+            raise RuntimeError(dedent(msg))
+
+        ports = props['ports']
+        static_AO = props['static_AO']
+        static_DO = props['static_DO']
+
+    times, clock_value = clock[0], clock[1]
+
+    clock_indices = np.where((clock_value[1:] - clock_value[:-1]) == 1)[0] + 1
+    # If initial clock value is 1, then this counts as a rising edge (clock should
+    # be 0 before experiment) but this is not picked up by the above code. So we
+    # insert it!
+    if clock_value[0] == 1:
+        clock_indices = np.insert(clock_indices, 0, 0)
+    clock_ticks = times[clock_indices]
+
+    traces = {}
+
+    if DO_table is not None:
+        ports_in_use = DO_table.dtype.names
+        for port_str in ports_in_use:
+            for line in range(ports[port_str]["num_lines"]):
+                # Extract each digital value from the packed bits:
+                line_vals = (((1 << line) & DO_table[port_str]) != 0).astype(float)
+                if static_DO:
+                    line_vals = np.full(len(clock_ticks), line_vals[0])
+                traces['%s/line%d' % (port_str, line)] = (clock_ticks, line_vals)
+
+    if AO_table is not None:
+        for chan in AO_table.dtype.names:
+            vals = AO_table[chan]
+            if static_AO:
+                vals = np.full(len(clock_ticks), vals[0])
+            traces[chan] = (clock_ticks, vals)
+
+    triggers = {}
+    for channel_name, channel in self.device.child_list.items():
+        if channel.parent_port in traces:
+            trace = traces[channel.parent_port]
+            if channel.device_class == 'Trigger':
+                triggers[channel_name] = trace
+            add_trace(channel_name, trace, self.name, channel.parent_port)
+
+    return triggers
+
+
+def write_shot_file(path, n_ticks, n_ports, n_AO, seed=0):
+    """Write a shot file with random AO and DO tables of n_ticks values"""
+    rng = np.random.RandomState(seed)
+    ports = ['port%d' % i for i in range(n_ports)]
+    DO_table = np.empty(n_ticks, dtype=[(port, np.uint32) for port in ports])
+    for port in ports:
+        DO_table[port] = rng.randint(0, 2 ** NUM_LINES, n_ticks, dtype=np.uint32)
+    AO_table = np.empty(n_ticks, dtype=[('ao%d' % i, float) for i in range(n_AO)])
+    for chan in AO_table.dtype.names:
+        AO_table[chan] = rng.uniform(-10, 10, n_ticks)
+    connection_table_properties = {
+        '__version__': '1.0.0',
+        'ports': {
+            port: {'num_lines': NUM_LINES, 'supports_buffered': True} for port in ports
+        },
+        'static_AO': False,
+        'static_DO': False,
+    }
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/' + DEVICE_NAME)
+        group.create_dataset('DO', data=DO_table)
+        group.create_dataset('AO', data=AO_table)
+        connection_table = np.array(
+            [
+                (
+                    DEVICE_NAME.encode('utf8'),
+                    properties.serialise(connection_table_properties),
+                )
+            ],
+            dtype=[('name', 'S256'), ('properties', 'S8192')],
+        )
+        f.create_dataset('connection table', data=connection_table)
+    return ports
+
+
+def make_device(ports, n_AO, step):
+    """Return a stand-in for the runviewer connection table entry of the device, with
+    a child connected to every step'th output. The first connected digital line is a
+    trigger."""
+    connections = [
+        '%s/line%d' % (port, line) for port in ports for line in range(NUM_LINES)
+    ]
+    connections += ['ao%d' % i for i in range(n_AO)]
+    child_list = {}
+    for connection in connections[::step]:
+        device_class = 'Trigger' if not child_list else 'DigitalOut'
+        if connection.startswith('ao'):
+            device_class = 'AnalogOut'
+        name = connection.replace('/', '_')
+        child_list[name] = SimpleNamespace(
+            parent_port=connection, device_class=device_class
+        )
+    return SimpleNamespace(name=DEVICE_NAME, child_list=child_list)
+
+
+def make_clock(n_ticks):
+    """Return a clock trace of n_ticks ticks, as runviewer passes to the parser"""
+    times = np.arange(2 * n_ticks) * 1e-6
+    clock_value = np.zeros(2 * n_ticks)
+    clock_value[1::2] = 1
+    return times, clock_value
+
+
+def parse(path, device, clock, get_traces):
+    """Return the traces added by the parser, the triggers it returned, and the fastest
+    time taken out of N_REPEATS parses"""
+    parser = NI_DAQmxParser(path, device)
+    durations = []
+    for _ in range(N_REPEATS):
+        traces = {}
+        start_time = time.perf_counter()
+        triggers = get_traces(
+            parser, lambda name, trace, *args: traces.update({name: trace}), clock
+        )
+        durations.append(time.perf_counter() - start_time)
+    return traces, triggers, min(durations)
+
+
+def assert_traces_equal(traces, expected):
+    assert traces.keys() == expected.keys()
+    for name, (times, values) in traces.items():
+        expected_times, expected_values = expected[name]
+        assert np.array_equal(times, expected_times)
+        assert values.dtype == expected_values.dtype
+        assert np.array_equal(values, expected_values)
+
+
+def main(n_ticks=200000, n_ports=2, n_AO=8):
+    n_ticks, n_ports, n_AO = int(n_ticks), int(n_ports), int(n_AO)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        ports = write_shot_file(path, n_ticks, n_ports, n_AO)
+        clock = make_clock(n_ticks)
+        for description, step in [('all outputs', 1), ('every other output', 2)]:
+            device = make_device(ports, n_AO, step)
+            expected, expected_triggers, previous_duration = parse(
+                path, device, clock, get_traces_previous
+            )
+            traces, triggers, duration = parse(
+                path, device, clock, NI_DAQmxParser.get_traces
+            )
+            assert_traces_equal(traces, expected)
+            assert_traces_equal(triggers, expected_triggers)
+            print(
+                '%s connected: %d traces of %d points, identical'
+                % (description, len(traces), n_ticks)
+            )
+            print('previous: %.3f s' % previous_duration)
+            print('vectorised: %.3f s' % duration)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,91 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/novatech_table_upload.py                              #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time programming a NovaTech DDS9m table in NovatechDDS9mWorker.transition_to_buffered,
+using MockNovaTechSerial in place of the device.
+
+Usage: python novatech_table_upload.py [n_lines] [baud_rate] [latency]
+
+where n_lines is the number of lines in the table (at most 16383), and latency is the
+time in seconds responses take to arrive at the computer after being sent by the
+device."""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from labscript_devices.NovaTechDDS9M import NovatechDDS9mWorker
+from labscript_devices.testing.mock_novatech import MockNovaTechSerial
+
+
+def make_worker(baud_rate, latency):
+    """Return a NovatechDDS9mWorker connected to a MockNovaTechSerial, without
+    starting a worker process"""
+    worker = object.__new__(NovatechDDS9mWorker)
+    worker.connection = MockNovaTechSerial(
+        baudrate=baud_rate, timeout=0.1, latency=latency
+    )
+    worker.smart_cache = {'STATIC_DATA': None, 'TABLE_DATA': ''}
+    worker.update_mode = 'synchronous'
+    worker.logger = logging.getLogger('novatech_table_upload')
+    return worker
+
+
+def write_shot_file(path, n_lines, seed):
+    """Write a shot file with random table and static data for the device"""
+    rng = np.random.RandomState(seed)
+    dtypes = [('freq%d' % i, np.uint32) for i in range(2)]
+    dtypes += [('phase%d' % i, np.uint16) for i in range(2)]
+    dtypes += [('amp%d' % i, np.uint16) for i in range(2)]
+    table = np.zeros(n_lines, dtype=dtypes)
+    for i in range(2):
+        table['freq%d' % i] = rng.randint(1, 1710000000, n_lines)
+        table['phase%d' % i] = rng.randint(0, 16384, n_lines)
+        table['amp%d' % i] = rng.randint(0, 1024, n_lines)
+    static_dtypes = [(name.replace('0', '2').replace('1', '3'), dtype) for name, dtype in dtypes]
+    static = np.ones(1, dtype=static_dtypes)
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/novatech')
+        group.create_dataset('TABLE_DATA', data=table)
+        group.create_dataset('STATIC_DATA', data=static)
+    return table
+
+
+def main(n_lines=16383, baud_rate=115200, latency=0.001):
+    worker = make_worker(int(baud_rate), float(latency))
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        for fresh in [True, False]:
+            table = write_shot_file(path, int(n_lines), seed=int(fresh))
+            start_time = time.perf_counter()
+            worker.transition_to_buffered('novatech', path, {}, fresh)
+            duration = time.perf_counter() - start_time
+            description = 'fresh' if fresh else 'smart (all lines changed)'
+            print('%d lines, %s: %.3f s' % (len(table), description, duration))
+            for i in range(2):
+                for line in [0, len(table) - 1]:
+                    expected = tuple(table[line][name % i] for name in ['freq%d', 'phase%d', 'amp%d'])
+                    assert worker.connection.table[i, line] == expected
+            worker.transition_to_manual()
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
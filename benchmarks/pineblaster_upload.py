@@ -0,0 +1,112 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pineblaster_upload.py                                 #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time programming a PineBlaster in PineblasterWorker.transition_to_buffered, using
+MockPineBlasterSerial in place of the device, for a fresh upload and for a shot in
+which a few instructions differ from the previous one. Then time aborting. That
+aborting takes little longer than the device takes to restart, and that the worker
+then reprograms every instruction, is tested in tests/test_PineBlaster_abort.py.
+
+Usage: python pineblaster_upload.py [n_instructions] [n_changed] [latency] [reset_time]
+
+where latency is the time in seconds responses take to arrive at the computer after
+being sent by the device, and reset_time the time in seconds the device takes to
+restart."""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+import serial
+
+from labscript_devices.PineBlaster import PineblasterWorker
+from labscript_devices.testing.mock_pineblaster import MockPineBlasterSerial
+
+
+def make_worker(latency, reset_time):
+    """Return an initialised PineblasterWorker connected to a MockPineBlasterSerial,
+    without starting a worker process"""
+    worker = object.__new__(PineblasterWorker)
+    worker.usbport = 'COM1'
+    Serial = serial.Serial
+    serial.Serial = lambda *args, **kwargs: MockPineBlasterSerial(
+        *args, latency=latency, reset_time=reset_time, **kwargs
+    )
+    try:
+        worker.init()
+    finally:
+        serial.Serial = Serial
+    return worker
+
+
+def write_shot_file(path, pulse_program):
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/pineblaster')
+        group.create_dataset('PULSE_PROGRAM', data=pulse_program)
+        properties = {'is_master_pseudoclock': True, 'stop_time': 1.0}
+        labscript_utils.properties.set_device_properties(f, 'pineblaster', properties)
+
+
+def main(n_instructions=14999, n_changed=10, latency=0.001, reset_time=0.5):
+    n_instructions, n_changed = int(n_instructions), int(n_changed)
+    latency, reset_time = float(latency), float(reset_time)
+    start_time = time.perf_counter()
+    worker = make_worker(latency, reset_time)
+    print('init: %.3f s' % (time.perf_counter() - start_time))
+    rng = np.random.RandomState(0)
+    pulse_program = np.zeros(n_instructions, dtype=[('period', int), ('reps', int)])
+    pulse_program['period'][:-1] = rng.randint(4, 400, n_instructions - 1)
+    pulse_program['reps'][:-1] = rng.randint(1, 10, n_instructions - 1)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        for fresh in [True, False]:
+            if not fresh:
+                changed = rng.choice(n_instructions - 1, n_changed, replace=False)
+                pulse_program['period'][changed] += 1
+            write_shot_file(path, pulse_program)
+            n_commands = len(worker.pineblaster.commands)
+            start_time = time.perf_counter()
+            worker.transition_to_buffered('pineblaster', path, {}, fresh)
+            duration = time.perf_counter() - start_time
+            n_commands = len(worker.pineblaster.commands) - n_commands
+            description = 'fresh' if fresh else '%d changed' % n_changed
+            print(
+                '%d instructions, %s: %d commands in %.3f s'
+                % (n_instructions, description, n_commands, duration)
+            )
+            program = worker.pineblaster.program
+            assert [program[i] for i in range(n_instructions)] == pulse_program.tolist()
+            worker.start_run()
+            while not worker.status_monitor():
+                pass
+            worker.transition_to_manual()
+
+        write_shot_file(path, pulse_program)
+        worker.transition_to_buffered('pineblaster', path, {}, False)
+        n_commands = len(worker.pineblaster.commands)
+        start_time = time.perf_counter()
+        worker.abort_transition_to_buffered()
+        duration = time.perf_counter() - start_time
+        n_greetings = worker.pineblaster.commands[n_commands:].count(b'hello')
+        print('abort: %.3f s, %d greetings' % (duration, n_greetings))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,149 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pseudoclock_completion.py                             #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Run shots on a NarwhalPulseGenWorker, using MockNarwhalPulseGenSerial in place of
+the device, and on a DummyPseudoclockWorker, calling check_if_done as the tab does until
+it reports the shot is done. Measure how long after the actual end of the run each shot
+is reported done, compared with the previous wall clock estimate from the stop time,
+which ignores time spent in waits and so reports shots with waits done too early. That
+shots, including aborted ones, are never reported done early by the current
+implementations is tested in tests/test_pseudoclock_completion.py.
+
+Usage: python pseudoclock_completion.py [shot_duration] [wait_duration]"""
+
+import os
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+
+from labscript_devices.DummyPseudoclock.blacs_workers import DummyPseudoclockWorker
+from labscript_devices.NarwhalPulseGen import transcode
+from labscript_devices.NarwhalPulseGen.testing.mock_narwhal import make_worker
+
+N_SHOTS = 3
+
+
+def check_if_done_previous(self):
+    """The previous implementation of check_if_done in both workers, for comparison"""
+    # Wait up to 1 second for the shot to be done, returning True if it is
+    # or False if not.
+    if getattr(self, 'start_time', None) is None:
+        self.start_time = time.time()
+    timeout = min(self.start_time + self.stop_time - time.time(), 1)
+    if timeout < 0:
+        return True
+    time.sleep(timeout)
+    return self.start_time + self.stop_time < time.time()
+
+
+def write_shot_file(path, device_name, shot_duration, n_waits):
+    """Write a shot file for a master pseudoclock ticking at 1 MHz for shot_duration,
+    in a loop with n_waits instructions that wait for a trigger before it"""
+    n_ticks = int(round(shot_duration * 1e6))
+    instructions = np.zeros(n_waits + 4, dtype=transcode.instruction_dtype)
+    instructions['address'] = np.arange(len(instructions))
+    instructions['duration'] = 1
+    instructions['stop_and_wait'][1 : n_waits + 1] = True
+    instructions['duration'][-3:-1] = 50
+    instructions['state'][-3] = 1
+    instructions['goto_address'][-2] = len(instructions) - 3
+    instructions['goto_counter'][-2] = n_ticks - 1
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('devices/%s/PULSE_PROGRAM' % device_name, data=instructions)
+        labscript_utils.properties.set_device_properties(
+            f,
+            device_name,
+            {'is_master_pseudoclock': True, 'stop_time': shot_duration},
+        )
+
+
+def make_dummy_worker():
+    """Return an initialised DummyPseudoclockWorker, without starting a worker
+    process"""
+    worker = object.__new__(DummyPseudoclockWorker)
+    worker.device_name = 'dummy'
+    worker.init()
+    return worker
+
+
+def run_shot(worker, path, device_name, end_time):
+    """Run a shot as the tab does, and return how long after the end of the run, as
+    given by end_time(), it was reported done, and the number of check_if_done calls"""
+    worker.transition_to_buffered(device_name, path, {}, True)
+    worker.start_run()
+    n_calls = 0
+    while True:
+        n_calls += 1
+        if worker.check_if_done():
+            break
+    detection_time = time.perf_counter() - end_time()
+    worker.transition_to_manual()
+    return detection_time, n_calls
+
+
+def run_shots(worker, path, device_name, end_time):
+    results = [run_shot(worker, path, device_name, end_time) for _ in range(N_SHOTS)]
+    detection_times, n_calls = zip(*results)
+    return np.array(detection_times), max(n_calls)
+
+
+def report(description, detection_times, n_calls):
+    print(
+        '%s: reported done %.1f ms to %.1f ms after the end of the run, '
+        'with up to %d check_if_done calls'
+        % (description, detection_times.min() * 1e3, detection_times.max() * 1e3, n_calls)
+    )
+
+
+def main(shot_duration=1.5, wait_duration=0.3):
+    shot_duration, wait_duration = float(shot_duration), float(wait_duration)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        # A Narwhal PulseGen shot with a wait, reported done from the device:
+        write_shot_file(path, 'narwhal', shot_duration, n_waits=1)
+        worker = make_worker()
+        worker.ser.wait_duration = wait_duration
+        device = worker.ser
+        end_time = lambda: device.run_end_time
+        detection_times, n_calls = run_shots(worker, path, 'narwhal', end_time)
+        report('narwhal, device notification', detection_times, n_calls)
+
+        worker.check_if_done = types.MethodType(check_if_done_previous, worker)
+        results = []
+        for _ in range(N_SHOTS):
+            worker.start_time = None
+            results.append(run_shot(worker, path, 'narwhal', end_time))
+            # Let the run actually finish, else the next shot's trigger is ignored:
+            time.sleep(max(device.run_end_time - time.perf_counter(), 0))
+        detection_times, n_calls = zip(*results)
+        detection_times, n_calls = np.array(detection_times), max(n_calls)
+        report('narwhal, previous wall clock estimate', detection_times, n_calls)
+
+        # A shot on the dummy pseudoclock, which has no waits:
+        write_shot_file(path, 'dummy', shot_duration, n_waits=0)
+        worker = make_dummy_worker()
+        end_time = lambda: worker.pseudoclock.end_time
+        detection_times, n_calls = run_shots(worker, path, 'dummy', end_time)
+        report('dummy, simulated state machine', detection_times, n_calls)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,94 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pseudoclock_merge.py                                  #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time merging pseudoclock instructions into the PULSE_PROGRAM of the DummyPseudoclock
+and PineBlaster with clock_traces.reduce_instructions, and check the result is identical to that of merging them one at a
+time in a Python loop, as was done previously.
+
+Usage: python pseudoclock_merge.py [n_ticks]
+
+where n_ticks is the number of clock ticks in the instructions, each of which is a
+single tick of a fine-grained ramp."""
+
+import sys
+import time
+
+import numpy as np
+
+from labscript_devices.clock_traces import reduce_instructions
+from labscript_devices.DummyPseudoclock.labscript_devices import DummyPseudoclock
+from labscript_devices.PineBlaster import PineBlaster
+
+
+def make_clock(n_ticks, seed=0):
+    """Return pseudoclock instructions in the format produced by labscript, consisting
+    mostly of single ticks, with runs of equal periods, and occasional waits"""
+    rng = np.random.RandomState(seed)
+    # Periods in units of 25ns, changing every few ticks on average:
+    periods = np.repeat(
+        rng.randint(4, 400, n_ticks), rng.geometric(0.3, n_ticks)
+    )[:n_ticks]
+    clock = []
+    t = 0
+    for i, period in enumerate(periods):
+        step = period * 25e-9
+        clock.append({'start': t, 'reps': 1, 'step': step, 'enabled_clocks': []})
+        t += step
+        if i % 100000 == 99999:
+            clock.append('WAIT')
+    return clock
+
+
+def reduce_instructions_loop(clock, clock_resolution):
+    """The previous implementation of the merge, for comparison"""
+    reduced_instructions = []
+    for instruction in clock:
+        if instruction == 'WAIT':
+            reduced_instructions.append({'period': 0, 'reps': 1})
+            continue
+        reps = instruction['reps']
+        period = int(round(instruction['step'] / clock_resolution))
+        if reduced_instructions and reduced_instructions[-1]['period'] == period:
+            reduced_instructions[-1]['reps'] += reps
+        else:
+            reduced_instructions.append({'period': period, 'reps': reps})
+    reduced_instructions.append({'period': 0, 'reps': 0})
+    dtypes = [('period', int), ('reps', int)]
+    pulse_program = np.zeros(len(reduced_instructions), dtype=dtypes)
+    for i, instruction in enumerate(reduced_instructions):
+        pulse_program[i]['period'] = instruction['period']
+        pulse_program[i]['reps'] = instruction['reps']
+    return pulse_program
+
+
+def main(n_ticks=1000000):
+    clock = make_clock(int(n_ticks))
+    for cls in [DummyPseudoclock, PineBlaster]:
+        start_time = time.perf_counter()
+        expected = reduce_instructions_loop(clock, cls.clock_resolution)
+        loop_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        pulse_program = reduce_instructions(clock, cls.clock_resolution)
+        vectorised_time = time.perf_counter() - start_time
+        assert pulse_program.dtype == expected.dtype
+        assert np.array_equal(pulse_program, expected)
+        # An empty clock gives only the stop instruction:
+        empty_program = reduce_instructions([], cls.clock_resolution)
+        assert np.array_equal(empty_program, expected[-1:])
+        print(
+            '%s: %d instructions to %d: loop %.3f s, vectorised %.3f s'
+            % (cls.__name__, len(clock), len(pulse_program), loop_time, vectorised_time)
+        )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,141 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pseudoclock_runviewer_traces.py                       #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time the runviewer parsers of the DummyPseudoclock, PineBlaster and
+CiceroOpalKellyXEM3001 constructing the clock trace of a shot, and measure their peak
+memory use, with and without decimating the trace to a maximum number of points, as
+set by the max_clock_trace_points option in the [runviewer] section of the labconfig.
+
+Usage: python pseudoclock_runviewer_traces.py [n_ticks] [max_points]"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+
+from labscript_devices.CiceroOpalKellyXEM3001 import RunviewerClass as CiceroParser
+from labscript_devices.DummyPseudoclock.runviewer_parsers import DummyPseudoclockParser
+from labscript_devices.PineBlaster import RunviewerClass as PineBlasterParser
+
+N_INSTRUCTIONS = 1000
+
+
+def make_device(name, clock_line_port):
+    """Return a stand-in for the runviewer connection table entry of a pseudoclock
+    device with one clock line, with no child devices"""
+    clock_line = SimpleNamespace(parent_port=clock_line_port, child_list={})
+    pseudoclock = SimpleNamespace(child_list={name + '_clock_line': clock_line})
+    return SimpleNamespace(name=name, child_list={name + '_pseudoclock': pseudoclock})
+
+
+def write_shot_file(path, n_ticks, seed=0):
+    """Write a shot file with pulse programs of N_INSTRUCTIONS instructions totalling
+    n_ticks ticks, with a wait halfway, for each device"""
+    rng = np.random.RandomState(seed)
+    periods = rng.randint(4, 400, N_INSTRUCTIONS)
+    reps = np.full(N_INSTRUCTIONS, n_ticks // N_INSTRUCTIONS)
+    reps[-1] += n_ticks - reps.sum()
+    half = N_INSTRUCTIONS // 2
+    with h5py.File(path, 'w') as f:
+        # DummyPseudoclock and PineBlaster: a wait has period 0 and reps 1, and the stop
+        # instruction period 0 and reps 0:
+        pulse_program = np.zeros(
+            N_INSTRUCTIONS + 2, dtype=[('period', int), ('reps', int)]
+        )
+        pulse_program['period'][:half] = periods[:half]
+        pulse_program['reps'][:half] = reps[:half]
+        pulse_program[half] = (0, 1)
+        pulse_program['period'][half + 1 : -1] = periods[half:]
+        pulse_program['reps'][half + 1 : -1] = reps[half:]
+        for name in ['dummy', 'pineblaster']:
+            f.create_dataset('devices/%s/PULSE_PROGRAM' % name, data=pulse_program)
+
+        # Cicero: a wait has reps 0:
+        dtypes = [('on_period', np.int64), ('off_period', np.int64), ('reps', np.int64)]
+        pulse_program = np.zeros(N_INSTRUCTIONS + 1, dtype=dtypes)
+        pulse_program['on_period'][:half] = periods[:half] // 2
+        pulse_program['off_period'][:half] = periods[:half] - periods[:half] // 2
+        pulse_program['reps'][:half] = reps[:half]
+        pulse_program[half] = (99, 3, 0)
+        pulse_program['on_period'][half + 1 :] = periods[half:] // 2
+        pulse_program['off_period'][half + 1 :] = periods[half:] - periods[half:] // 2
+        pulse_program['reps'][half + 1 :] = reps[half:]
+        f.create_dataset('devices/cicero/PULSE_PROGRAM', data=pulse_program)
+        properties = {'trigger_delay': 1e-6, 'wait_delay': 2.5e-6}
+        labscript_utils.properties.set_device_properties(f, 'cicero', properties)
+        connection_table = np.array(
+            [(b'cicero', labscript_utils.properties.serialise({'clock_frequency': 40e6}))],
+            dtype=[('name', 'S256'), ('properties', 'S2048')],
+        )
+        f.create_dataset('connection table', data=connection_table)
+
+
+def parse(parser_class, path, device, max_points):
+    """Return the clock trace produced by the parser, the time taken and the peak
+    memory allocated"""
+    parser = parser_class(path, device)
+    parser.max_points = max_points
+    traces = {}
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    parser.get_traces(lambda name, trace, *args: traces.update({name: trace}))
+    duration = time.perf_counter() - start_time
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    trace, = traces.values()
+    return trace, duration, peak_memory
+
+
+def main(n_ticks=10000000, max_points=6000):
+    n_ticks, max_points = int(n_ticks), int(max_points)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        write_shot_file(path, n_ticks)
+        devices = [
+            (DummyPseudoclockParser, make_device('dummy', 'internal')),
+            (PineBlasterParser, make_device('pineblaster', 'internal')),
+            (CiceroParser, make_device('cicero', 'Clock Out')),
+        ]
+        for parser_class, device in devices:
+            (times, states), duration, peak_memory = parse(
+                parser_class, path, device, None
+            )
+            assert len(times) == 2 * n_ticks
+            assert np.all(np.diff(times) > 0)
+            print(
+                '%s: %d points in %.3f s, peak memory %.0f MB'
+                % (device.name, len(times), duration, peak_memory / 1e6)
+            )
+            (decimated_times, _), duration, peak_memory = parse(
+                parser_class, path, device, max_points
+            )
+            assert len(decimated_times) <= max_points
+            # The decimated trace consists of a subset of the ticks:
+            assert np.all(np.isin(decimated_times, times))
+            print(
+                '%s, decimated: %d points in %.3f s, peak memory %.2f MB'
+                % (device.name, len(decimated_times), duration, peak_memory / 1e6)
+            )
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
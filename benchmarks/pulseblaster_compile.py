@@ -0,0 +1,398 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pulseblaster_compile.py                               #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Compile a shot for a PulseBlaster with labscript, with pulses on the direct outputs,
+DDS updates, a clock line ticking, a ramp, a wait and a long delay, producing a pulse
+program of about n_instructions instructions. Time PulseBlaster.convert_to_pb_inst and
+write_pb_inst_to_h5 compared with their previous implementations, which built each
+instruction as a dictionary, and check that both produce byte-identical PULSE_PROGRAM
+datasets.
+
+Usage: python pulseblaster_compile.py [n_instructions]"""
+
+import os
+import sys
+import tempfile
+import time
+
+import labscript_utils.h5_lock
+import h5py
+import numpy as np
+from labscript import LabscriptError, config
+
+from labscript_devices.PulseBlaster import PulseBlaster, PulseBlasterDDS
+
+PULSE_DURATION = 1e-5
+RAMP_RATE = 1e5
+# Longer than PulseBlaster.long_delay, so that it needs a LONG_DELAY instruction:
+LONG_DELAY = 60
+
+
+def convert_to_pb_inst_previous(self, dig_outputs, dds_outputs, freqs, amps, phases):
+    """The previous implementation of PulseBlaster.convert_to_pb_inst, for comparison"""
+    pb_inst = []
+
+    # index to keep track of where in output.raw_output the
+    # pulseblaster flags are coming from
+    # starts at -1 because the internal flag should always tick on the first instruction and be
+    # incremented (to 0) before it is used to index any arrays
+    i = -1
+    # index to record what line number of the pulseblaster hardware
+    # instructions we're up to:
+    j = 0
+    # We've delegated the initial two instructions off to BLACS, which
+    # can ensure continuity with the state of the front panel. Thus
+    # these two instructions don't actually do anything:
+    flags = [0]*self.n_flags
+    freqregs = [0]*2
+    ampregs = [0]*2
+    phaseregs = [0]*2
+    dds_enables = [0]*2
+    phase_resets = [0]*2
+
+    pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets': phase_resets,
+                    'flags': ''.join([str(flag) for flag in flags]), 'instruction': 'STOP',
+                    'data': 0, 'delay': 10.0/self.clock_limit*1e9})
+    pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets': phase_resets,
+                    'flags': ''.join([str(flag) for flag in flags]), 'instruction': 'STOP',
+                    'data': 0, 'delay': 10.0/self.clock_limit*1e9})
+    j += 2
+
+    flagstring = '0'*self.n_flags # So that this variable is still defined if the for loop has no iterations
+    for k, instruction in enumerate(self.pseudoclock.clock):
+        if instruction == 'WAIT':
+            # This is a wait instruction. Repeat the last instruction but with a 100ns delay and a WAIT op code:
+            wait_instruction = pb_inst[-1].copy()
+            wait_instruction['delay'] = 100
+            wait_instruction['instruction'] = 'WAIT'
+            wait_instruction['data'] = 0
+            pb_inst.append(wait_instruction)
+            j += 1
+            continue
+
+        flags = [0]*self.n_flags
+        # The registers below are ones, not zeros, so that we don't
+        # use the BLACS-inserted initial instructions. Instead
+        # unused DDSs have a 'zero' in register one for freq, amp
+        # and phase.
+        freqregs = [1]*2
+        ampregs = [1]*2
+        phaseregs = [1]*2
+        dds_enables = [0]*2
+        phase_resets = [0]*2
+
+        # This flag indicates whether we need a full clock tick, or are just updating an internal output
+        only_internal = True
+        # find out which clock flags are ticking during this instruction
+        for clock_line in instruction['enabled_clocks']:
+            if clock_line == self._direct_output_clock_line:
+                # advance i (the index keeping track of internal clockline output)
+                i += 1
+            else:
+                flag_index = int(clock_line.connection.split()[1])
+                flags[flag_index] = 1
+                # We are not just using the internal clock line
+                only_internal = False
+
+        for output in dig_outputs:
+            flagindex = int(output.connection.split()[1])
+            flags[flagindex] = int(output.raw_output[i])
+        for output in dds_outputs:
+            ddsnumber = int(output.connection.split()[1])
+            freqregs[ddsnumber] = freqs[ddsnumber][output.frequency.raw_output[i]]
+            ampregs[ddsnumber] = amps[ddsnumber][output.amplitude.raw_output[i]]
+            phaseregs[ddsnumber] = phases[ddsnumber][output.phase.raw_output[i]]
+            dds_enables[ddsnumber] = output.gate.raw_output[i]
+            if isinstance(output, PulseBlasterDDS):
+                phase_resets[ddsnumber] = output.phase_reset.raw_output[i]
+
+        flagstring = ''.join([str(flag) for flag in flags])
+
+        if instruction['reps'] > 1048576:
+            raise LabscriptError('Pulseblaster cannot support more than 1048576 loop iterations. ' +
+                                  str(instruction['reps']) +' were requested at t = ' + str(instruction['start']) + '. '+
+                                 'This can be fixed easily enough by using nested loops. If it is needed, ' +
+                                 'please file a feature request at' +
+                                 'http://redmine.physics.monash.edu.au/projects/labscript.')
+
+        if not only_internal:
+            if self.pulse_width == 'symmetric':
+                high_time = instruction['step']/2
+            else:
+                high_time = self.pulse_width
+            # High time cannot be longer than self.long_delay (~57 seconds for a
+            # 75MHz core clock freq). If it is, clip it to self.long_delay. In this
+            # case we are not honouring the requested symmetric or fixed pulse
+            # width. To do so would be possible, but would consume more pulseblaster
+            # instructions, so we err on the side of fewer instructions:
+            high_time = min(high_time, self.long_delay)
+
+            # Low time is whatever is left:
+            low_time = instruction['step'] - high_time
+
+            # Do we need to insert a LONG_DELAY instruction to create a delay this
+            # long?
+            n_long_delays, remaining_low_time =  divmod(low_time, self.long_delay)
+
+            # If the remainder is too short to be output, add self.long_delay to it.
+            # self.long_delay was constructed such that adding self.min_delay to it
+            # is still not too long for a single instruction:
+            if n_long_delays and remaining_low_time < self.min_delay:
+                n_long_delays -= 1
+                remaining_low_time += self.long_delay
+
+            # The start loop instruction, Clock edges are high:
+            pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
+                            'flags': flagstring, 'instruction': 'LOOP',
+                            'data': instruction['reps'], 'delay': high_time*1e9})
+
+            for clock_line in instruction['enabled_clocks']:
+                if clock_line != self._direct_output_clock_line:
+                    flag_index = int(clock_line.connection.split()[1])
+                    flags[flag_index] = 0
+
+            flagstring = ''.join([str(flag) for flag in flags])
+
+            # The long delay instruction, if any. Clock edges are low:
+            if n_long_delays:
+                pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
+                            'flags': flagstring, 'instruction': 'LONG_DELAY',
+                            'data': int(n_long_delays), 'delay': self.long_delay*1e9})
+
+            # Remaining low time. Clock edges are low:
+            pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
+                            'flags': flagstring, 'instruction': 'END_LOOP',
+                            'data': j, 'delay': remaining_low_time*1e9})
+
+            # Two instructions were used in the case of there being no LONG_DELAY,
+            # otherwise three. This increment is done here so that the j referred
+            # to in the previous line still refers to the LOOP instruction.
+            j += 3 if n_long_delays else 2
+        else:
+            # We only need to update a direct output, so no need to tick the clocks.
+
+            # Do we need to insert a LONG_DELAY instruction to create a delay this
+            # long?
+            n_long_delays, remaining_delay =  divmod(instruction['step'], self.long_delay)
+            # If the remainder is too short to be output, add self.long_delay to it.
+            # self.long_delay was constructed such that adding self.min_delay to it
+            # is still not too long for a single instruction:
+            if n_long_delays and remaining_delay < self.min_delay:
+                n_long_delays -= 1
+                remaining_delay += self.long_delay
+
+            if n_long_delays:
+                pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
+                            'flags': flagstring, 'instruction': 'LONG_DELAY',
+                            'data': int(n_long_delays), 'delay': self.long_delay*1e9})
+
+            pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
+                            'flags': flagstring, 'instruction': 'CONTINUE',
+                            'data': 0, 'delay': remaining_delay*1e9})
+
+            j += 2 if n_long_delays else 1
+
+    if self.programming_scheme == 'pb_start/BRANCH':
+        # This is how we stop the pulse program. We branch from the last
+        # instruction to the zeroth, which BLACS has programmed in with
+        # the same values and a WAIT instruction. The PulseBlaster then
+        # waits on instuction zero, which is a state ready for either
+        # further static updates or buffered mode.
+        pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
+                        'flags': flagstring, 'instruction': 'BRANCH',
+                        'data': 0, 'delay': 10.0/self.clock_limit*1e9})
+    elif self.programming_scheme == 'pb_stop_programming/STOP':
+        # An ordinary stop instruction. This has the downside that the PulseBlaster might
+        # (on some models) reset its output to zero momentarily until BLACS calls program_manual, which
+        # it will for this programming scheme. However it is necessary when the PulseBlaster has
+        # repeated triggers coming to it, such as a 50Hz/60Hz line trigger. We can't have it sit
+        # on a WAIT instruction as above, or it will trigger and run repeatedly when that's not what
+        # we wanted.
+        pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
+                        'flags': flagstring, 'instruction': 'STOP',
+                        'data': 0, 'delay': 10.0/self.clock_limit*1e9})
+    else:
+        raise AssertionError('Invalid programming scheme %s'%str(self.programming_scheme))
+
+    if len(pb_inst) > self.max_instructions:
+        raise LabscriptError("The Pulseblaster memory cannot store more than {:d} instuctions, but the PulseProgram contains {:d} instructions.".format(self.max_instructions, len(pb_inst)))
+
+    return pb_inst
+
+
+def write_pb_inst_to_h5_previous(self, pb_inst, hdf5_file):
+    """The previous implementation of PulseBlaster.write_pb_inst_to_h5, for comparison"""
+    # OK now we squeeze the instructions into a numpy array ready for writing to hdf5:
+    pb_dtype = [('freq0', np.int32), ('phase0', np.int32), ('amp0', np.int32),
+                ('dds_en0', np.int32), ('phase_reset0', np.int32),
+                ('freq1', np.int32), ('phase1', np.int32), ('amp1', np.int32),
+                ('dds_en1', np.int32), ('phase_reset1', np.int32),
+                ('flags', np.int32), ('inst', np.int32),
+                ('inst_data', np.int32), ('length', np.float64)]
+    pb_inst_table = np.empty(len(pb_inst),dtype = pb_dtype)
+    for i,inst in enumerate(pb_inst):
+        flagint = int(inst['flags'][::-1],2)
+        instructionint = self.pb_instructions[inst['instruction']]
+        dataint = inst['data']
+        delaydouble = inst['delay']
+        freq0 = inst['freqs'][0]
+        freq1 = inst['freqs'][1]
+        phase0 = inst['phases'][0]
+        phase1 = inst['phases'][1]
+        amp0 = inst['amps'][0]
+        amp1 = inst['amps'][1]
+        en0 = inst['enables'][0]
+        en1 = inst['enables'][1]
+        phase_reset0 = inst['phase_resets'][0]
+        phase_reset1 = inst['phase_resets'][1]
+
+        pb_inst_table[i] = (freq0,phase0,amp0,en0,phase_reset0,freq1,phase1,amp1,en1,phase_reset1, flagint,
+                            instructionint, dataint, delaydouble)
+
+    # Okay now write it to the file:
+    group = hdf5_file['/devices/'+self.name]
+    group.create_dataset('PULSE_PROGRAM', compression=config.compression,data = pb_inst_table)
+    self.set_property('stop_time', self.stop_time, location='device_properties')
+
+
+def convert_to_pb_inst_previous_registers(self, dig_outputs, dds_outputs, freqs, amps, phases):
+    """Call convert_to_pb_inst_previous with the registers PulseBlaster.generate_registers
+    now returns, which are arrays of the register of each value of each DDS output,
+    converted to the dictionaries of the register of each distinct value that it
+    previously returned"""
+    dicts = {}, {}, {}
+    for output in dds_outputs:
+        i = int(output.connection.split()[1])
+        for result, quantity, registers in zip(
+            dicts,
+            [output.frequency, output.amplitude, output.phase],
+            [freqs, amps, phases],
+        ):
+            result[i] = dict(zip(quantity.raw_output, registers[i]))
+    return convert_to_pb_inst_previous(self, dig_outputs, dds_outputs, *dicts)
+
+
+def compile_shot(path, n_instructions, convert_to_pb_inst, write_pb_inst_to_h5):
+    """Compile the shot using the given implementations of convert_to_pb_inst and
+    write_pb_inst_to_h5, returning the time spent in them"""
+    from labscript import (
+        labscript_init,
+        labscript_cleanup,
+        start,
+        stop,
+        wait,
+        AnalogOut,
+        ClockLine,
+        DDS,
+        DigitalOut,
+    )
+    from labscript_devices.DummyIntermediateDevice import DummyIntermediateDevice
+
+    durations = []
+
+    def timed(method):
+        def wrapper(*args):
+            start_time = time.perf_counter()
+            result = method(*args)
+            durations.append(time.perf_counter() - start_time)
+            return result
+
+        return wrapper
+
+    methods = PulseBlaster.convert_to_pb_inst, PulseBlaster.write_pb_inst_to_h5
+    PulseBlaster.convert_to_pb_inst = timed(convert_to_pb_inst)
+    PulseBlaster.write_pb_inst_to_h5 = timed(write_pb_inst_to_h5)
+    try:
+        labscript_init(path, new=True, overwrite=True)
+        # Waits without a wait monitor require the STOP programming scheme:
+        pulseblaster = PulseBlaster(
+            'pulseblaster',
+            programming_scheme='pb_stop_programming/STOP',
+            max_instructions=2 * n_instructions,
+        )
+        clock_line = ClockLine('clock_line', pulseblaster.pseudoclock, 'flag 0')
+        dummy = DummyIntermediateDevice('dummy', clock_line)
+        analog_out = AnalogOut('analog_out', dummy, 'ao0')
+        outputs = [
+            DigitalOut('do%d' % i, pulseblaster.direct_outputs, 'flag %d' % i)
+            for i in range(1, 12)
+        ]
+        dds0 = PulseBlasterDDS('dds0', pulseblaster.direct_outputs, 'dds 0')
+        dds1 = DDS('dds1', pulseblaster.direct_outputs, 'dds 1')
+        # Most instructions are pulses on the direct outputs, with one instruction for
+        # each edge, or two where the clock line also ticks:
+        n_pulses = n_instructions // 2
+        start()
+        t = 0
+        dds0.enable(t)
+        dds1.enable(t)
+        for i in range(n_pulses):
+            outputs[i % len(outputs)].go_high(t)
+            if i % 10 == 0:
+                analog_out.constant(t, (i % 1000) / 1000)
+                dds0.setfreq(t, 10e6 + 1e3 * (i % 100))
+                dds1.setamp(t, (i % 20) / 20)
+            if i % 100 == 0:
+                dds0.hold_phase(t)
+                dds1.setphase(t, i % 360)
+            t += PULSE_DURATION
+            outputs[i % len(outputs)].go_low(t)
+            if i % 100 == 0:
+                dds0.release_phase(t)
+            t += PULSE_DURATION
+        ramp_duration = 0.01
+        analog_out.ramp(t, ramp_duration, 0, 1, RAMP_RATE)
+        t += ramp_duration
+        wait('wait', t)
+        t += 1e-3
+        outputs[0].go_high(t)
+        t += LONG_DELAY
+        analog_out.constant(t, 2)
+        outputs[0].go_low(t)
+        dds1.disable(t)
+        t += 1e-3
+        stop(t)
+    finally:
+        PulseBlaster.convert_to_pb_inst, PulseBlaster.write_pb_inst_to_h5 = methods
+        labscript_cleanup()
+    return sum(durations)
+
+
+def main(n_instructions=100000):
+    n_instructions = int(n_instructions)
+    paths = []
+    try:
+        results = []
+        for description, convert_to_pb_inst, write_pb_inst_to_h5 in [
+            ('previous', convert_to_pb_inst_previous_registers, write_pb_inst_to_h5_previous),
+            ('vectorised', PulseBlaster.convert_to_pb_inst, PulseBlaster.write_pb_inst_to_h5),
+        ]:
+            fd, path = tempfile.mkstemp(suffix='.h5')
+            os.close(fd)
+            paths.append(path)
+            duration = compile_shot(path, n_instructions, convert_to_pb_inst, write_pb_inst_to_h5)
+            with h5py.File(path, 'r') as f:
+                pulse_program = f['devices/pulseblaster/PULSE_PROGRAM'][:]
+            results.append((description, pulse_program, duration))
+        (_, expected, _), (_, pulse_program, _) = results
+        assert pulse_program.dtype == expected.dtype
+        assert pulse_program.tobytes() == expected.tobytes()
+        print('%d instructions, PULSE_PROGRAM identical' % len(pulse_program))
+        for description, _, duration in results:
+            print('%s: %.3f s' % (description, duration))
+    finally:
+        for path in paths:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
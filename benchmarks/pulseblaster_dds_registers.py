@@ -0,0 +1,272 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pulseblaster_dds_registers.py                         #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time PulseBlaster.generate_registers on both DDSs ramping randomly through close to
+the maximum number of distinct frequencies, amplitudes and phases the registers can
+hold, including looking up the register of every value as convert_to_pb_inst does.
+Compare with the previous implementation, which built Python sets and dicts of the
+values and looked the registers up from those, and check the register tables of both
+give back every value. Then check that exceeding a register limit is an error.
+
+Usage: python pulseblaster_dds_registers.py [n_samples]
+
+where n_samples is the number of values of each output of each DDS."""
+
+import sys
+import time
+import types
+from types import SimpleNamespace
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+from labscript import LabscriptError, config
+
+from labscript_devices.PulseBlaster import PulseBlaster
+
+# Distinct values of each output, close to the register limits of 1024, 1024 and 128:
+N_VALUES = {'frequency': 1000, 'amplitude': 1000, 'phase': 120}
+N_RAMPS = 200
+
+
+def generate_registers_previous(self, hdf5_file, dds_outputs):
+    """The previous implementation of PulseBlaster.generate_registers, for comparison"""
+    ampdicts = {}
+    phasedicts = {}
+    freqdicts = {}
+    group = hdf5_file['/devices/'+self.name]
+    dds_dict = {}
+    for output in dds_outputs:
+        num = int(output.connection.split()[1])
+        dds_dict[num] = output
+    for num in [0,1]:
+
+        if num in dds_dict:
+            output = dds_dict[num]
+
+            # Ensure that amplitudes are within bounds:
+            if any(output.amplitude.raw_output > 1)  or any(output.amplitude.raw_output < 0):
+                raise LabscriptError('%s %s '%(output.amplitude.description, output.amplitude.name) +
+                                  'can only have values between 0 and 1, ' +
+                                  'the limit imposed by %s.'%output.name)
+
+            # Ensure that frequencies are within bounds:
+            if any(output.frequency.raw_output > 150e6 )  or any(output.frequency.raw_output < 0):
+                raise LabscriptError('%s %s '%(output.frequency.description, output.frequency.name) +
+                                  'can only have values between 0Hz and and 150MHz, ' +
+                                  'the limit imposed by %s.'%output.name)
+
+            # Ensure that phase wraps around:
+            output.phase.raw_output %= 360
+
+            amps = set(output.amplitude.raw_output)
+            phases = set(output.phase.raw_output)
+            freqs = set(output.frequency.raw_output)
+        else:
+            # If the DDS is unused, it will use the following values
+            # for the whole experimental run:
+            amps = set([0])
+            phases = set([0])
+            freqs = set([0])
+
+        if len(amps) > 1024:
+            raise LabscriptError('%s dds%d can only support 1024 amplitude registers, and %s have been requested.'%(self.name, num, str(len(amps))))
+        if len(phases) > 128:
+            raise LabscriptError('%s dds%d can only support 128 phase registers, and %s have been requested.'%(self.name, num, str(len(phases))))
+        if len(freqs) > 1024:
+            raise LabscriptError('%s dds%d can only support 1024 frequency registers, and %s have been requested.'%(self.name, num, str(len(freqs))))
+
+        # start counting at 1 to leave room for the dummy instruction,
+        # which BLACS will fill in with the state of the front
+        # panel:
+        ampregs = range(1,len(amps)+1)
+        freqregs = range(1,len(freqs)+1)
+        phaseregs = range(1,len(phases)+1)
+
+        ampdicts[num] = dict(zip(amps,ampregs))
+        freqdicts[num] = dict(zip(freqs,freqregs))
+        phasedicts[num] = dict(zip(phases,phaseregs))
+
+        # The zeros are the dummy instructions:
+        freq_table = np.array([0] + list(freqs), dtype = np.float64) / 1e6 # convert to MHz
+        amp_table = np.array([0] + list(amps), dtype = np.float32)
+        phase_table = np.array([0] + list(phases), dtype = np.float64)
+
+        subgroup = group.create_group('DDS%d'%num)
+        subgroup.create_dataset('FREQ_REGS', compression=config.compression, data = freq_table)
+        subgroup.create_dataset('AMP_REGS', compression=config.compression, data = amp_table)
+        subgroup.create_dataset('PHASE_REGS', compression=config.compression, data = phase_table)
+
+    return freqdicts, ampdicts, phasedicts
+
+
+def lookup_registers_previous(registers, values):
+    """The previous implementation of PulseBlaster._lookup_registers, which mapped an
+    array of values to their register numbers, given a dict of registers as returned by
+    generate_registers_previous()"""
+    keys = np.array(list(registers.keys()))
+    regs = np.array(list(registers.values()), dtype=np.int32)
+    order = np.argsort(keys)
+    return regs[order][np.searchsorted(keys[order], values)]
+
+
+def random_ramps(rng, values, n_samples):
+    """Return n_samples of ramps between random values, taking the values in between
+    from those given"""
+    ramp_ends = np.sort(rng.choice(np.arange(1, n_samples), N_RAMPS - 1, replace=False))
+    ramp_ends = np.concatenate([[0], ramp_ends, [n_samples - 1]])
+    endpoints = rng.randint(0, len(values), len(ramp_ends))
+    # Ramp through every value at least once in the longest ramp, if it is long enough:
+    longest = np.argmax(np.diff(ramp_ends))
+    endpoints[longest : longest + 2] = 0, len(values) - 1
+    indices = np.interp(np.arange(n_samples), ramp_ends, endpoints)
+    return values[np.round(indices).astype(int)]
+
+
+def make_dds_outputs(n_samples, n_values=N_VALUES, seed=0):
+    """Return stand-ins for the two DDS outputs of a PulseBlaster, each ramping through
+    the given numbers of distinct frequencies, amplitudes and phases"""
+    rng = np.random.RandomState(seed)
+    outputs = []
+    for i in range(2):
+        quantities = {}
+        for name, high in [('frequency', 150e6), ('amplitude', 1), ('phase', 360)]:
+            if name == 'phase':
+                # Phases on a grid that wrapping around preserves exactly:
+                values = np.sort(rng.choice(np.arange(0, high, 0.5), n_values[name], replace=False))
+            else:
+                values = np.sort(rng.uniform(0, high, n_values[name]))
+            raw_output = random_ramps(rng, values, n_samples)
+            if name == 'phase':
+                # Some phases are only the same once wrapped around:
+                raw_output += 360 * rng.randint(0, 2, n_samples)
+            quantities[name] = SimpleNamespace(
+                name='dds%d_%s' % (i, name), description=name, raw_output=raw_output
+            )
+        outputs.append(SimpleNamespace(name='dds%d' % i, connection='dds %d' % i, **quantities))
+    return outputs
+
+
+def copy_outputs(outputs):
+    """Copy the outputs, since generate_registers wraps their phases in place"""
+    return [
+        SimpleNamespace(
+            name=output.name,
+            connection=output.connection,
+            **{
+                name: SimpleNamespace(
+                    name=getattr(output, name).name,
+                    description=getattr(output, name).description,
+                    raw_output=getattr(output, name).raw_output.copy(),
+                )
+                for name in ['frequency', 'amplitude', 'phase']
+            }
+        )
+        for output in outputs
+    ]
+
+
+def make_device():
+    """Return a PulseBlaster, as far as generate_registers needs one"""
+    device = object.__new__(PulseBlaster)
+    device.name = 'pulseblaster'
+    return device
+
+
+def generate_registers(generate, lookup, outputs):
+    """Generate the registers into an in-memory hdf5 file, look up the register of every
+    value, and return the register tables and registers of each output, and the time
+    taken"""
+    with h5py.File('registers.h5', 'w', driver='core', backing_store=False) as f:
+        f.create_group('devices/pulseblaster')
+        start_time = time.perf_counter()
+        freqs, amps, phases = generate(f, outputs)
+        registers = {}
+        for output in outputs:
+            num = int(output.connection.split()[1])
+            for field, quantity, output_registers in [
+                ('FREQ', output.frequency, freqs),
+                ('AMP', output.amplitude, amps),
+                ('PHASE', output.phase, phases),
+            ]:
+                registers[num, field] = lookup(output_registers[num], quantity.raw_output)
+        duration = time.perf_counter() - start_time
+        tables = {
+            (num, field): f['devices/pulseblaster/DDS%d/%s_REGS' % (num, field)][:]
+            for num in range(2)
+            for field in ['FREQ', 'AMP', 'PHASE']
+        }
+    return tables, registers, duration
+
+
+def check_registers(tables, registers, outputs):
+    """Check the register of every value of every output holds that value, with
+    frequencies in MHz"""
+    for output in outputs:
+        num = int(output.connection.split()[1])
+        for field, quantity, scale, dtype in [
+            ('FREQ', output.frequency, 1e6, np.float64),
+            ('AMP', output.amplitude, 1, np.float32),
+            ('PHASE', output.phase, 1, np.float64),
+        ]:
+            expected = (quantity.raw_output / scale).astype(dtype)
+            assert np.array_equal(tables[num, field][registers[num, field]], expected), (num, field)
+            # Register 0 is left for the dummy instruction:
+            assert registers[num, field].min() == 1
+
+
+def main(n_samples=1000000):
+    n_samples = int(n_samples)
+    device = make_device()
+    outputs = make_dds_outputs(n_samples)
+    results = []
+    for description, generate, lookup in [
+        (
+            'previous',
+            types.MethodType(generate_registers_previous, device),
+            lookup_registers_previous,
+        ),
+        ('np.unique', device.generate_registers, lambda registers, values: registers),
+    ]:
+        copied_outputs = copy_outputs(outputs)
+        tables, registers, duration = generate_registers(generate, lookup, copied_outputs)
+        check_registers(tables, registers, copied_outputs)
+        results.append((description, tables, duration))
+
+    (_, expected_tables, _), (_, tables, _) = results
+    for key, table in tables.items():
+        assert np.array_equal(table, np.sort(expected_tables[key])), key
+    for field, name in [('FREQ', 'frequency'), ('AMP', 'amplitude'), ('PHASE', 'phase')]:
+        assert len(tables[0, field]) - 1 == N_VALUES[name], field
+
+    # One register too many is an error:
+    for name, limit in [('frequency', 1024), ('amplitude', 1024), ('phase', 128)]:
+        n_values = dict(N_VALUES, **{name: limit + 1})
+        try:
+            with h5py.File('registers.h5', 'w', driver='core', backing_store=False) as f:
+                f.create_group('devices/pulseblaster')
+                device.generate_registers(f, make_dds_outputs(n_samples, n_values))
+        except LabscriptError as e:
+            assert '%d %s registers' % (limit, name) in str(e), str(e)
+        else:
+            raise AssertionError('%d %s registers not rejected' % (limit + 1, name))
+
+    print(
+        '2 DDSs, %d samples each, %s distinct frequencies, amplitudes and phases'
+        % (n_samples, '/'.join(str(len(tables[0, field]) - 1) for field in ['FREQ', 'AMP', 'PHASE']))
+    )
+    for description, _, duration in results:
+        print('%s: %.3f s' % (description, duration))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,265 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pulseblaster_flag_traces.py                           #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Compare the memory used by PulseBlasterParser.get_traces with that of the previous
+implementation, which stored the value of every output during every instruction
+executed, on a pulse program in which a clock line on flag 0 ticks throughout, flag 1
+changes every 1000 instructions, the other flags never change and the DDSs change every
+10000 instructions. Check that the traces of both have the same changes at the same
+times.
+
+Usage: python pulseblaster_flag_traces.py [n_rows]"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from labscript_devices.PulseBlaster import PulseBlaster, PulseBlasterParser
+from labscript_devices.testing.runviewer_devices import make_pulseblaster_device
+
+
+def get_traces_previous(self, add_trace, parent=None):
+    """The previous implementation of PulseBlasterParser.get_traces, for comparison"""
+    if parent is None:
+        # we're the master pseudoclock, software triggered. So we don't have to worry about trigger delays, etc
+        pass
+        
+    # get the pulse program
+    with h5py.File(self.path, 'r') as f:
+        pulse_program = f['devices/%s/PULSE_PROGRAM'%self.name][:]
+        # slow_clock_flag = eval(f['devices/%s'%self.name].attrs['slow_clock'])
+        dds = {}
+        for i in range(self.num_dds):
+            dds[i] = {}
+            for reg in ['FREQ', 'AMP', 'PHASE']:
+                dds[i][reg] = f['devices/%s/DDS%d/%s_REGS'%(self.name, i, reg)][:]
+    
+    # ignore the first 2 instructions, they are dummy instructions for BLACS
+    pulse_program = pulse_program[2:]
+    inst = pulse_program['inst']
+    
+    # Each instruction is executed the number of times of its enclosing loop, if
+    # any. Loops are not nested, and each END_LOOP's inst_data is the index of its
+    # LOOP instruction. Group the instructions into blocks of consecutive
+    # instructions that are repeated together: each loop, and each instruction
+    # not in a loop.
+    loop_ends = np.flatnonzero(inst == 3) # END_LOOP
+    loop_starts = pulse_program['inst_data'][loop_ends] - 2
+    in_loop = np.zeros(len(pulse_program) + 1, dtype=np.int64)
+    np.add.at(in_loop, loop_starts, 1)
+    np.add.at(in_loop, loop_ends + 1, -1)
+    in_loop = np.cumsum(in_loop[:-1]) > 0
+    block_starts = np.flatnonzero(~in_loop)
+    block_starts = np.union1d(block_starts, loop_starts)
+    block_lengths = np.diff(np.append(block_starts, len(pulse_program)))
+    block_repeats = np.ones(len(block_starts), dtype=np.int64)
+    is_loop = in_loop[block_starts]
+    block_repeats[is_loop] = pulse_program['inst_data'][block_starts[is_loop]]
+    
+    # The index of the instruction being executed at each point in time, with each
+    # block's instructions tiled by its number of repeats:
+    n_executed = block_lengths * block_repeats
+    executed_start = np.cumsum(n_executed) - n_executed
+    offset = np.arange(n_executed.sum()) - np.repeat(executed_start, n_executed)
+    executed = np.repeat(block_starts, n_executed) + offset % np.repeat(block_lengths, n_executed)
+    
+    # The duration of each instruction. A LONG_DELAY's length is multiplied by its
+    # inst_data.
+    durations = pulse_program['length']*1.0e-9
+    long_delays = inst == 7 # LONG_DELAY
+    durations[long_delays] *= pulse_program['inst_data'][long_delays]
+    waits = (inst == 8) & ~in_loop # WAIT
+    if parent is not None:
+        #TODO: Offset next time by trigger delay is not master pseudoclock
+        durations[waits] += PulseBlaster.trigger_delay
+    
+    # The time at which each instruction begins, and the stop time:
+    t0 = 0. if parent is None else PulseBlaster.trigger_delay # Offset by initial trigger of parent
+    times = np.cumsum(np.concatenate([[t0], durations[executed]]))
+    clock = times[:-1]
+    for t in clock[waits[executed]]:
+        print('Wait at %.9f'%t)
+    print('Stop time: %.9f'%times[-1])
+    
+    # The value of each output during each instruction:
+    values = {}
+    flag_values = (pulse_program['flags'][:, np.newaxis] >> np.arange(self.num_flags)) & 1
+    for i in range(self.num_flags):
+        values['flag %d'%i] = flag_values[:, i].astype(int)
+    for i in range(self.num_dds):
+        values['dds %d_freq'%i] = dds[i]['FREQ'][pulse_program['freq%d'%i]]
+        values['dds %d_phase'%i] = dds[i]['PHASE'][pulse_program['phase%d'%i]]
+        amps = dds[i]['AMP'][pulse_program['amp%d'%i]]
+        values['dds %d_amp'%i] = np.where(pulse_program['dds_en%d'%i], amps, 0)
+    
+    # now build the traces. Only those of outputs in use are built, since each is
+    # as long as the number of instructions executed:
+    to_return = {}
+    def get_trace(connection):
+        if connection not in to_return:
+            to_return[connection] = (clock, values[connection][executed])
+        return to_return[connection]
+    
+    # if slow_clock_flag is not None:
+        # to_return['slow clock'] = to_return['flag %d'%slow_clock_flag[0]]
+        
+    clocklines_and_triggers = {}
+    for pseudoclock_name, pseudoclock in self.device.child_list.items():
+        for clock_line_name, clock_line in pseudoclock.child_list.items():
+            if clock_line.parent_port == 'internal':
+                parent_device_name = '%s.direct_outputs'%self.name
+                for internal_device_name, internal_device in clock_line.child_list.items():
+                    for channel_name, channel in internal_device.child_list.items():
+                        if channel.device_class == 'Trigger':
+                            clocklines_and_triggers[channel_name] = get_trace(channel.parent_port)
+                            add_trace(channel_name, get_trace(channel.parent_port), parent_device_name, channel.parent_port)
+                        else:
+                            if channel.device_class == 'DDS':
+                                for subchnl_name, subchnl in channel.child_list.items():
+                                    connection = '%s_%s'%(channel.parent_port, subchnl.parent_port)
+                                    if connection in values:
+                                        add_trace(subchnl.name, get_trace(connection), parent_device_name, connection)
+                            else:
+                                add_trace(channel_name, get_trace(channel.parent_port), parent_device_name, channel.parent_port)
+            else:
+                clocklines_and_triggers[clock_line_name] = get_trace(clock_line.parent_port)
+                add_trace(clock_line_name, get_trace(clock_line.parent_port), self.name, clock_line.parent_port)
+        
+    return clocklines_and_triggers
+
+
+def make_pulse_program(n_rows, seed=0):
+    """Return a pulse program of n_rows instructions, in groups of a LOOP, an instruction
+    within the loop, an END_LOOP and an instruction outside the loop, with random
+    repeats, lengths and clock line states, and a LONG_DELAY and a few WAITs"""
+    inst = PulseBlaster.pb_instructions
+    rng = np.random.RandomState(seed)
+    n_groups = (n_rows - 3) // 4
+    pulse_program = np.zeros(2 + 4 * n_groups + 1, dtype=PulseBlaster.pb_dtype)
+    pulse_program['inst'][:2] = inst['STOP']
+    pulse_program['length'][:2] = 100
+    loop_rows = 2 + 4 * np.arange(n_groups)
+    pulse_program['inst'][loop_rows] = inst['LOOP']
+    pulse_program['inst_data'][loop_rows] = rng.randint(1, 4, n_groups)
+    pulse_program['inst'][loop_rows + 2] = inst['END_LOOP']
+    pulse_program['inst_data'][loop_rows + 2] = loop_rows
+    pulse_program['inst'][-1] = inst['STOP']
+
+    rows = slice(2, None)
+    n = len(pulse_program) - 2
+    index = np.arange(n)
+    pulse_program['length'][rows] = rng.randint(100, 1000, n)
+    pulse_program['flags'][rows] = (
+        rng.randint(0, 2, n) | ((index // 1000) % 2) << 1 | 0b10100100000
+    )
+    for i in range(2):
+        for field in ['freq', 'amp', 'phase']:
+            pulse_program['%s%d' % (field, i)][rows] = 1 + (index // 10000) % 100
+        pulse_program['dds_en%d' % i][rows] = (index // 10000) % 2
+
+    outside_rows = loop_rows + 3
+    pulse_program['inst'][outside_rows[n_groups // 2]] = inst['LONG_DELAY']
+    pulse_program['inst_data'][outside_rows[n_groups // 2]] = 3
+    pulse_program['length'][outside_rows[n_groups // 2]] = 1e9
+    pulse_program['inst'][outside_rows[:: max(n_groups // 4, 1)][1:]] = inst['WAIT']
+    return pulse_program
+
+
+def changes(trace):
+    """Return the points of a trace at which its value changes, along with its first
+    and last points"""
+    times, values = trace
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:-1] = values[1:-1] != values[:-2]
+    return times[keep], values[keep]
+
+
+def get_traces(parser, get_traces):
+    """Return the traces get_traces adds, the time taken and the peak memory allocated,
+    discarding what it prints"""
+    traces = {}
+
+    def add_trace(name, trace, parent_device_name, connection):
+        traces[name] = trace
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_traces(add_trace)
+    duration = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return traces, duration, peak
+
+
+def trace_size(traces):
+    """The total size of the distinct arrays in the traces"""
+    arrays = {id(array): array for trace in traces.values() for array in trace}
+    return sum(array.nbytes for array in arrays.values())
+
+
+def main(n_rows=1000000):
+    n_rows = int(n_rows)
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        pulse_program = make_pulse_program(n_rows)
+        with h5py.File(path, 'w') as f:
+            group = f.create_group('devices/pulseblaster')
+            group.create_dataset('PULSE_PROGRAM', data=pulse_program)
+            for i in range(2):
+                for reg in ['FREQ', 'AMP', 'PHASE']:
+                    group.create_dataset('DDS%d/%s_REGS' % (i, reg), data=np.arange(101.0))
+        parser = PulseBlasterParser(path, make_pulseblaster_device('pulseblaster'))
+        results = []
+        for description, method in [
+            ('previous', types.MethodType(get_traces_previous, parser)),
+            ('change points', parser.get_traces),
+        ]:
+            results.append((description,) + get_traces(parser, method))
+    finally:
+        os.unlink(path)
+
+    (_, expected, _, _), (_, traces, _, _) = results
+    assert traces.keys() == expected.keys()
+    for name in expected:
+        times, values = traces[name]
+        expected_times, expected_values = changes(expected[name])
+        assert np.array_equal(values, expected_values), name
+        assert np.allclose(times, expected_times, rtol=0, atol=1e-9), name
+
+    n_points = len(expected['clock_line'][0])
+    print('%d instructions, %d executed, %d traces' % (len(pulse_program), n_points, len(traces)))
+    for description, traces, duration, peak in results:
+        print(
+            '%s: %d points, traces %.1f MB, peak memory %.1f MB, %.2f s'
+            % (
+                description,
+                sum(len(trace[0]) for trace in traces.values()),
+                trace_size(traces) / 1e6,
+                peak / 1e6,
+                duration,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
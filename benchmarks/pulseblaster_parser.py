@@ -0,0 +1,100 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/pulseblaster_parser.py                                #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time PulseBlasterParser.get_traces on a synthetic pulse program of clock ticks with
+high loop counts, such as a compiled shot with long, finely sampled ramps produces.
+
+Usage: python pulseblaster_parser.py [n_ticks] [reps]
+
+where n_ticks is the number of LOOP/END_LOOP pairs in the program and reps is the loop
+count of each."""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import labscript_utils.h5_lock
+import h5py
+
+from labscript_devices.PulseBlaster import PulseBlaster, PulseBlasterParser
+from labscript_devices.testing.runviewer_devices import make_pulseblaster_device
+
+
+def make_pulse_program(n_ticks, reps):
+    """Return a pulse program of n_ticks clock ticks of reps repetitions each, with a
+    LONG_DELAY and a WAIT partway through. This is the pulse program
+    PulseBlaster.convert_to_pb_inst would produce for a clock line ticking on flag 0
+    whilst the direct outputs on the other flags and the DDSs change every tick."""
+    inst = PulseBlaster.pb_instructions
+    # Each tick is a LOOP/END_LOOP pair, with a LONG_DELAY between them for the middle
+    # tick. Then a WAIT and a STOP:
+    rows_per_tick = np.full(n_ticks, 2)
+    rows_per_tick[n_ticks // 2] = 3
+    loop_rows = 2 + np.cumsum(rows_per_tick) - rows_per_tick
+    end_loop_rows = loop_rows + rows_per_tick - 1
+    pulse_program = np.zeros(2 + rows_per_tick.sum() + 2, dtype=PulseBlaster.pb_dtype)
+
+    pulse_program['inst'][:2] = inst['STOP']
+    pulse_program['length'][:2] = 100
+    ticks = np.arange(n_ticks)
+    for rows, flags, inst_name, inst_data in [
+        (loop_rows, (ticks % 2048) << 1 | 1, 'LOOP', reps),
+        (end_loop_rows, (ticks % 2048) << 1, 'END_LOOP', loop_rows),
+    ]:
+        pulse_program['inst'][rows] = inst[inst_name]
+        pulse_program['inst_data'][rows] = inst_data
+        pulse_program['flags'][rows] = flags
+        pulse_program['length'][rows] = 500
+        for i in range(2):
+            for field in ['freq', 'amp', 'phase']:
+                pulse_program['%s%d' % (field, i)][rows] = 1 + ticks % 100
+            pulse_program['dds_en%d' % i][rows] = ticks % 2
+
+    long_delay_row = loop_rows[n_ticks // 2] + 1
+    pulse_program[long_delay_row] = pulse_program[long_delay_row + 1]
+    pulse_program['inst'][long_delay_row] = inst['LONG_DELAY']
+    pulse_program['inst_data'][long_delay_row] = 3
+    pulse_program['length'][long_delay_row] = 1e9
+
+    for row, inst_name in [(-2, 'WAIT'), (-1, 'STOP')]:
+        pulse_program[row] = pulse_program[end_loop_rows[-1]]
+        pulse_program['inst'][row] = inst[inst_name]
+        pulse_program['inst_data'][row] = 0
+    return pulse_program
+
+
+def main(n_ticks=10000, reps=100):
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    try:
+        with h5py.File(path, 'w') as f:
+            group = f.create_group('devices/pulseblaster')
+            group.create_dataset('PULSE_PROGRAM', data=make_pulse_program(n_ticks, reps))
+            for i in range(2):
+                for reg in ['FREQ', 'AMP', 'PHASE']:
+                    group.create_dataset('DDS%d/%s_REGS' % (i, reg), data=np.arange(101.0))
+        parser = PulseBlasterParser(path, make_pulseblaster_device('pulseblaster'))
+        start_time = time.perf_counter()
+        parser.get_traces(lambda *args: None)
+        duration = time.perf_counter() - start_time
+        print(
+            '%d ticks of %d reps (%d instructions executed): %.3f s'
+            % (n_ticks, reps, 2 * n_ticks * reps, duration)
+        )
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
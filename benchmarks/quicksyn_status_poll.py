@@ -0,0 +1,66 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/quicksyn_status_poll.py                               #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time the status polling cycle of QuickSynWorker, that is, a call to check_status and
+one to check_remote_values, using MockQuickSynSerial in place of the device.
+
+Usage: python quicksyn_status_poll.py [n_polls] [latency]
+
+where latency is the time in seconds the device takes to respond to each command."""
+
+import sys
+import time
+
+import serial
+
+from labscript_devices.PhaseMatrixQuickSyn import QuickSynWorker
+from labscript_devices.testing.mock_quicksyn import MockQuickSynSerial
+
+
+def make_worker(latency):
+    """Return an initialised QuickSynWorker connected to a MockQuickSynSerial, without
+    starting a worker process"""
+    worker = object.__new__(QuickSynWorker)
+    worker.address = 'COM1'
+    Serial = serial.Serial
+    serial.Serial = lambda *args, **kwargs: MockQuickSynSerial(
+        *args, latency=latency, **kwargs
+    )
+    try:
+        worker.init()
+    finally:
+        serial.Serial = Serial
+    return worker
+
+
+def main(n_polls=20, latency=0.005):
+    worker = make_worker(float(latency))
+    start_time = time.perf_counter()
+    for _ in range(int(n_polls)):
+        status = worker.check_status()
+        values = worker.check_remote_values()
+    duration = (time.perf_counter() - start_time) / int(n_polls)
+    assert status['temperature'] == worker.connection.temperature
+    assert values['dds 0']['freq'] == worker.connection.freq / 1000
+    print('%.1f ms per status poll' % (duration * 1e3))
+
+    start_time = time.perf_counter()
+    worker.program_manual({'dds 0': {'freq': 2e9, 'gate': 1}})
+    duration = time.perf_counter() - start_time
+    assert worker.connection.freq == 2e12 and worker.connection.output == 1
+    print('%.1f ms per program_manual' % (duration * 1e3))
+    print('%d commands dropped' % worker.connection.dropped_commands)
+    assert worker.connection.dropped_commands == 0
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
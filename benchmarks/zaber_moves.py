@@ -0,0 +1,99 @@
+#####################################################################
+#                                                                   #
+# /benchmarks/zaber_moves.py                                        #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+"""Time ZaberWorker.program_manual moving a number of stages, using MockZaberInterface
+in place of the stages, compared to moving the stages one at a time, and count the
+position queries made whilst waiting for the stages to arrive. Then time a move that
+cannot complete in time timing out, and moving stages whose speeds are unknown. That
+the stages move concurrently, that moves time out, and that the stages are queried
+only a few times, backing off between the minimum and maximum poll intervals, is
+tested in tests/test_ZaberStageController_moves.py.
+
+Usage: python zaber_moves.py [n_stages] [distance] [speed] [settling_time]
+
+where distance is in steps, speed is in steps per second and settling_time is in
+seconds."""
+
+import contextlib
+import io
+import sys
+import time
+
+from labscript_devices.ZaberStageController.blacs_workers import ZaberWorker
+
+
+def make_worker(n_stages, speed, settling_time, speed_units=9.375):
+    """Return a ZaberWorker using a MockZaberInterface, without starting a worker
+    process"""
+    worker = object.__new__(ZaberWorker)
+    worker.mock = True
+    worker.com_port = 'COM1'
+    worker.child_connections = ['device %d' % (i + 1) for i in range(n_stages)]
+    worker.speed_units = {c: speed_units for c in worker.child_connections}
+    worker.init()
+    worker.controller.speed = speed
+    worker.controller.settling_time = settling_time
+    return worker
+
+
+def main(n_stages=4, distance=100000, speed=200000, settling_time=0.1):
+    n_stages, distance, speed = int(n_stages), int(distance), float(speed)
+    settling_time = float(settling_time)
+    worker = make_worker(n_stages, speed, settling_time)
+    controller = worker.controller
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        for connection in worker.child_connections:
+            controller.move(int(connection.split()[1]), distance)
+        sequential_time = time.perf_counter() - start_time
+
+        values = {connection: 0 for connection in worker.child_connections}
+        controller.position_queries.clear()
+        start_time = time.perf_counter()
+        positions = worker.program_manual(values)
+        concurrent_time = time.perf_counter() - start_time
+    assert positions == values
+    print(
+        '%d stages moving %d steps at %d steps/s, settling in %.3f s: '
+        'one at a time %.3f s, concurrently %.3f s'
+        % (n_stages, distance, speed, settling_time, sequential_time, concurrent_time)
+    )
+    # Less the queries by check_remote_values() after the move:
+    queries = max(controller.position_queries.values()) - 1
+    print('At most %d position queries per stage whilst waiting' % queries)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        controller.start_move(1, distance)
+    start_time = time.perf_counter()
+    try:
+        controller.wait_until_moved({1: distance}, timeout=0.1 * distance / speed)
+    except TimeoutError as e:
+        print('Timed out after %.3f s: %s' % (time.perf_counter() - start_time, e))
+
+    # Stages of a series whose speed units are not known:
+    worker = make_worker(n_stages, speed, settling_time, speed_units=None)
+    controller = worker.controller
+    values = {connection: distance for connection in worker.child_connections}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        positions = worker.program_manual(values)
+        duration = time.perf_counter() - start_time
+    assert positions == values
+    queries = max(controller.position_queries.values()) - 1
+    print(
+        'Unknown speeds: moved concurrently in %.3f s, with at most %d position '
+        'queries per stage whilst waiting' % (duration, queries)
+    )
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
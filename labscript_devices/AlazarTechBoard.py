@@ -197,7 +197,7 @@ class GuilessTab(DeviceTab):
 # Helper functions that don't need to be class methods
 def find_nearest_internal_clock(array, value):
     if not isinstance(array, np.ndarray):
-        array = np.array(array)
+        array = np.array(list(array))
     ix = np.abs(array - value).argmin()
     return array[ix]
 
@@ -303,6 +303,12 @@ class GuilessWorker(Worker):
             board.num_channels, board.memorysize_samples, board.bits_per_sample))
         board.abortAsyncRead()
 
+        # DMA buffers are allocated as needed and kept for reuse in later shots, since
+        # allocating and page-locking them takes a significant part of the transition
+        # time. self.buffers is the part of the pool in use by the current shot.
+        self.buffer_pool = []
+        self.buffers = []
+
         # Multiprocessing init
         self.acquisition_queue = Queue()
         self.acquisition_thread = threading.Thread(
@@ -478,19 +484,15 @@ class GuilessWorker(Worker):
                                       self.samplesPerBuffer)
         print('Acquiring for {:5.3f}s generates {:5.3f} MS ({:5.3f} MB total)'.format(
             atsparam['acquisition_duration'], self.samplesPerAcquisition/1e6, memoryPerAcquisition/self.oneM))
-        print('Buffers are {:5.3f} MS and {:d} bytes. Allocating {:d} buffers... '.format(
+        print('Buffers are {:5.3f} MS and {:d} bytes. Using {:d} buffers... '.format(
             self.samplesPerBuffer/1e6, self.bytesPerBuffer, self.buffersPerAcquisition), end='')
         self.board.setRecordSize(0, self.samplesPerBuffer)
 
         # Allocate buffers
         # We know that disk can't keep up, so we preallocate all buffers
         sample_type = ctypes.c_uint16  # It's 16bit, let's not stuff around
-        self.buffers = []
-        for i in range(self.buffersPerAcquisition):
-            self.buffers.append(ats.DMABuffer(
-                sample_type, self.bytesPerBuffer))
-            #print('{:d} '.format(i),end="")
-        print('done.')
+        self.buffers = self.allocate_buffers(
+            sample_type, self.bytesPerBuffer, self.buffersPerAcquisition)
 
         # This works but ADMA_ALLOC_BUFFERS is questionable because we have allocated the buffers (well atsapi.py buffer class has)
         acqflags = ats.ADMA_TRIGGERED_STREAMING | ats.ADMA_ALLOC_BUFFERS | ats.ADMA_FIFO_ONLY_STREAMING
@@ -507,14 +509,35 @@ class GuilessWorker(Worker):
         self.acquisition_queue.put('start')
         return {}  # ? Check this
 
+    # Returns n_buffers DMA buffers of bytes_per_buffer bytes from the buffer pool, allocating
+    # only as many new buffers as the pool is short of. Buffers already in the pool are reused
+    # as is, without being zeroed, since every buffer in use is filled by the board before it
+    # is read. If the buffer size has changed, the pool is freed and allocated afresh.
+    def allocate_buffers(self, sample_type, bytes_per_buffer, n_buffers):
+        if self.buffer_pool and self.buffer_pool[0].size_bytes != bytes_per_buffer:
+            self.free_buffers()
+        n_reused = min(n_buffers, len(self.buffer_pool))
+        while len(self.buffer_pool) < n_buffers:
+            self.buffer_pool.append(ats.DMABuffer(sample_type, bytes_per_buffer))
+        print('allocated {:d}, reused {:d}.'.format(n_buffers - n_reused, n_reused))
+        return self.buffer_pool[:n_buffers]
+
+    def free_buffers(self):
+        print("Freeing {:d} buffers... ".format(len(self.buffer_pool)), end="")
+        for buf in self.buffer_pool:
+            buf.__exit__()
+        self.buffer_pool = []
+        self.buffers = []
+        print('done.')
+
     # This becomes a long-running thread which fills the buffers allocated in the main thread.
-    # Buffers are saved and freed in transition_to_manual().
+    # Buffers are saved in transition_to_manual(), and returned to the pool for the next shot.
     def acquisition_loop(self):
         while True:
             command = self.acquisition_queue.get()
             assert command == 'start'
             #print("acquisition thread: starting new acquisition")
-            start = time.clock()               # Keep track of when acquisition started
+            start = time.perf_counter()        # Keep track of when acquisition started
             # This is a fresh trip through the acquisition loop, no exception has occurred yet!
             self.acquisition_exception = None
             self.acquisition_done.clear()      # I don't understand why this is needed here!
@@ -558,7 +581,7 @@ class GuilessWorker(Worker):
 
     def to_volts(self, zeroToFullScale, buf):
         offset = float(2**(self.bitsPerSample-1))
-        return (np.asfarray(buf, np.float32)-offset)/offset * zeroToFullScale * 0.001
+        return (np.asarray(buf, dtype=np.float32)-offset)/offset * zeroToFullScale * 0.001
 
     # This helper function waits for the acquisition_loop thread to finish the acquisition,
     # either successfully or after an exception.
@@ -618,11 +641,8 @@ class GuilessWorker(Worker):
                         self.atsparam['chB_input_range'], bufferData[1: lastI: self.channelCount])
                 samplesToProcess -= self.samplesPerBuffer
                 start += self.samplesPerBuffer
-        print("Freeing buffers... ", end="")
-        for buf in self.buffers:
-            buf.__exit__()
+        # The buffers stay in the pool for the next shot, and are freed at shutdown:
         self.buffers = []
-        print('done.')
         return True
 
     def abort(self):
@@ -644,9 +664,12 @@ class GuilessWorker(Worker):
     def shutdown(self):
         if self.aborting:
             print('Shutdown requested during abort; waiting 10 seconds.')
-            start = time.clock()
-            while self.aborting and time.clock() - start < 10:
+            start = time.perf_counter()
+            while self.aborting and time.perf_counter() - start < 10:
                 time.sleep(0.5)
         if self.aborting:
             print('Proceeding in lieu of complete abort.')
+        # Ensure the board is no longer transferring into the buffers before freeing them:
+        self.board.abortAsyncRead()
+        self.free_buffers()
         return
\ No newline at end of file
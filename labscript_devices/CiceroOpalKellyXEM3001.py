@@ -13,6 +13,7 @@
 
 from labscript import Device, PseudoclockDevice, Pseudoclock, ClockLine, config, LabscriptError, set_passed_properties, compiler, IntermediateDevice, WaitMonitor, DigitalOut
 from labscript_devices import runviewer_parser, BLACS_tab, BLACS_worker, labscript_device
+from labscript_devices.clock_traces import clock_trace, max_points_for
 
 import numpy as np
 import labscript_utils.h5_lock, h5py
@@ -22,11 +23,6 @@ from labscript_utils.connections import _ensure_str
 #
 # Helper functions
 #
-def int_to_bytes(n, m):
-    # converts the integer n to m bytes in Big Endian format
-    out = [(n>>(i*8))&0xFF for i in range(m-1,-1,-1)]
-    return out
-    
 def bits_to_int(m, *args):
     # converts a set of sequences of bits (aka a set of ints), each of length m, to a single integer. first entry in args is least significant
     total = 0
@@ -34,33 +30,26 @@ def bits_to_int(m, *args):
         total += byte << (m*i)
     return total
     
-def add_instruction_to_bytearray(data, instruction, on, off, reps):
-    on_period = int_to_bytes(on, 6)
-    off_period = int_to_bytes(off, 6)
-    reps = int_to_bytes(reps, 4)
-    
-    offset = 16*instruction
-    
-    # Now convert to little endian format with 16-bit words
-    # Bytes 0-5 are for on_period (in multiples of clock period)
-    data[offset+0] = on_period[1]
-    data[offset+1] = on_period[0]
-    data[offset+2] = on_period[3]
-    data[offset+3] = on_period[2]
-    data[offset+4] = on_period[5]
-    data[offset+5] = on_period[4]
-    # Bytes 6-11 are for on_period (in multiples of clock period)
-    data[offset+6] = off_period[1]
-    data[offset+7] = off_period[0]
-    data[offset+8] = off_period[3]
-    data[offset+9] = off_period[2]
-    data[offset+10] = off_period[5]
-    data[offset+11] = off_period[4]
-    # Bytes 12-15 are for number of reps
-    data[offset+12] = reps[1]
-    data[offset+13] = reps[0]
-    data[offset+14] = reps[3]
-    data[offset+15] = reps[2]   
+# Each instruction is 16 bytes, consisting of 16-bit little endian words: three for the
+# on period and three for the off period (in multiples of the clock period), and two
+# for the number of reps, each with the most significant word first:
+instruction_dtype = np.dtype([
+    ('on_period', '<u2', 3),
+    ('off_period', '<u2', 3),
+    ('reps', '<u2', 2),
+])
+
+def instructions_to_bytes(pulse_program):
+    # converts a pulse program with on_period, off_period and reps fields to the bytes
+    # written to the FPGA, all instructions at once
+    data = np.zeros(len(pulse_program), dtype=instruction_dtype)
+    for name in ['on_period', 'off_period', 'reps']:
+        values = pulse_program[name].astype(np.uint64)
+        n_words = instruction_dtype[name].shape[0]
+        for i in range(n_words):
+            shift = np.uint64(16*(n_words - 1 - i))
+            data[name][:, i] = (values >> shift) & np.uint64(0xFFFF)
+    return bytearray(data.tobytes())
     
         
 # Define a CiceroOpalKellyXEM3001Clock that only accepts one child clockline
@@ -261,6 +250,9 @@ class RunviewerClass(object):
         self.path = path
         self.name = device.name
         self.device = device
+        # If not None, the maximum number of points in the clock trace, of which only
+        # every nth tick is then included:
+        self.max_points = max_points_for(device)
         
             
     def get_traces(self, add_trace, clock=None):
@@ -283,30 +275,28 @@ class RunviewerClass(object):
         
         clock_frequency = connection_table_properties['clock_frequency']
 
-        time = []
-        states = []
         trigger_index = 0
         # t = 0 if clock is None else clock_ticks[trigger_index]+device_properties['trigger_delay']
         # trigger_index += 1
         t = 0
-               
-        for row in pulse_program:
-            if row['reps'] == 0: # WAIT
+        
+        # Get the start time of each instruction:
+        start_times = np.zeros(len(pulse_program))
+        on_periods = pulse_program['on_period']/clock_frequency
+        off_periods = pulse_program['off_period']/clock_frequency
+        rows = zip((on_periods + off_periods).tolist(), pulse_program['reps'].tolist())
+        for i, (period, reps) in enumerate(rows):
+            start_times[i] = t
+            if reps == 0: # WAIT
                 if clock is not None:
                     t = clock_ticks[trigger_index]+device_properties['trigger_delay']
                     trigger_index += 1
                 else:
                     t += device_properties['wait_delay']
             else:    
-                for i in range(row['reps']):
-                    time.append(t)
-                    states.append(1)
-                    t += row['on_period']/clock_frequency
-                    time.append(t)
-                    states.append(0)
-                    t += row['off_period']/clock_frequency
+                t += reps*period
         
-        clock = (np.array(time), np.array(states))
+        clock = clock_trace(start_times, on_periods, off_periods, pulse_program['reps'], max_points=self.max_points)
         
         clocklines_and_triggers = {}
         for pseudoclock_name, pseudoclock in self.device.child_list.items():
@@ -430,6 +420,14 @@ class CiceroOpalKellyXEM3001Tab(DeviceTab):
 
 @BLACS_worker        
 class CiceroOpalKellyXEM3001Worker(Worker):
+    # The interval at which the tab calls status_monitor. If the device reaches a wait
+    # or the end of the shot sooner than this, status_monitor waits for it to do so
+    # before returning, rather than the tab only noticing on a later call:
+    event_lookahead = 0.1
+    # Interval at which to read the status whilst the device is expected to be
+    # finishing the shot imminently:
+    end_poll_interval = 0.001
+
     def init(self):
         global h5py; import labscript_utils.h5_lock, h5py
         # global serial; import serial
@@ -451,6 +449,9 @@ class CiceroOpalKellyXEM3001Worker(Worker):
         self.wait_table = None
         self.measured_waits = None
         self.h5_file = None
+        self.event_samples = None
+        self.samples_generated = 0
+        self.next_read_time = None
     
         self.current_value = 0
     
@@ -509,6 +510,15 @@ class CiceroOpalKellyXEM3001Worker(Worker):
             # main data
             group = hdf5_file['devices/%s'%device_name]
             pulse_program = group['PULSE_PROGRAM'][:]
+            # The number of samples generated when the device reaches each wait
+            # (instructions with zero reps) and the end of the shot. Whilst the device
+            # is not in a wait, how long it will take to reach the next of these is
+            # known, and there is no need to read its status in the meantime:
+            samples = (pulse_program['on_period'] + pulse_program['off_period']) * pulse_program['reps']
+            total_samples = numpy.cumsum(samples)
+            self.event_samples = numpy.append(total_samples[pulse_program['reps'] == 0], total_samples[-1:])
+            self.samples_generated = 0
+            self.next_read_time = None
             device_properties = labscript_utils.properties.get(hdf5_file, device_name, 'device_properties')
             self.connection_table_properties = labscript_utils.properties.get(hdf5_file, device_name, 'connection_table_properties')
             self.is_master_pseudoclock = device_properties['is_master_pseudoclock']
@@ -532,10 +542,7 @@ class CiceroOpalKellyXEM3001Worker(Worker):
         if self.wait_table is not None and not self.is_master_pseudoclock:
             raise RuntimeError('Something has gone wrong in labscript. You should not be able to configure this device as the wait monitor while it is a secondary pseudoclock. Please contact the developers on the mailing list.')
                 
-        # Create empty data array
-        data = bytearray(len(pulse_program)*16)
-        for i, instruction in enumerate(pulse_program):
-            add_instruction_to_bytearray(data, i, instruction['on_period'], instruction['off_period'], instruction['reps'])
+        data = instructions_to_bytes(pulse_program)
         
         # program the FPGA
         assert self.dev.WriteToPipeIn(0x80, data) == len(data)
@@ -553,14 +560,29 @@ class CiceroOpalKellyXEM3001Worker(Worker):
         assert self.dev.ActivateTriggerIn(0x40,0) == self.dev.NoError
     
     def status_monitor(self):
-        def ReadU32(addr):
-            lo = self.dev.GetWireOutValue(addr)
-            hi = self.dev.GetWireOutValue(addr+1)
-            vx = (hi << 16) | lo
-            return vx
-        
+        # Read the status of the device when it may have reached a wait or the end of
+        # the shot since it was last read, or whenever we are called if it is in a
+        # wait, the duration of which is not known in advance. If it will reach one
+        # before we are next called, wait until then and read the status again, so
+        # that the tab is notified promptly:
+        deadline = time.monotonic() + self.event_lookahead
+        while True:
+            if self.next_read_time is not None:
+                if self.next_read_time > deadline:
+                    return False
+                delay = self.next_read_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if self.read_status():
+                return True
+            if self.next_read_time is None:
+                return False
+
+    def read_status(self):
         # update the status monitors
         self.dev.UpdateWireOuts()
+        read_time = time.monotonic()
+        master_samples_generated = bits_to_int(16, self.dev.GetWireOutValue(0x22), self.dev.GetWireOutValue(0x23))
                 
         #   WAIT ANALYSIS CODE: 
         #       If this device has a wait monitor attached
@@ -584,11 +606,6 @@ class CiceroOpalKellyXEM3001Worker(Worker):
         #       send ZMQ all_waits_finished event when all waits have happened.
         #       self.all_waits_finished.post(self.h5_file)
         if self.wait_table is not None and self.current_wait < len(self.wait_table):
-            # master_samples_generated_1 = self.dev.GetWireOutValue(0x22)
-            # master_samples_generated_2 = self.dev.GetWireOutValue(0x23)
-            # master_samples_generated = (master_samples_generated_2 << 16) + master_samples_generated_1
-            
-            master_samples_generated = bits_to_int(16, self.dev.GetWireOutValue(0x22), self.dev.GetWireOutValue(0x23))
             self.logger.debug('Master samples generated: %d'%master_samples_generated)
         
             clock_frequency = self.connection_table_properties['clock_frequency']
@@ -625,7 +642,25 @@ class CiceroOpalKellyXEM3001Worker(Worker):
         # check the status bits
         status = self.dev.GetWireOutValue(0x25)
         assert not status & 2	# aborted
-        return status & 1		# finished
+        if status & 1:			# finished
+            return True
+        
+        # Work out when to next read the status. If the device has generated samples
+        # since the last read and is not at a wait, it is running, and will reach the
+        # next wait or the end of the shot after generating the remaining samples:
+        running = master_samples_generated > self.samples_generated and master_samples_generated not in self.event_samples
+        self.samples_generated = master_samples_generated
+        if not running:
+            self.next_read_time = None
+            return False
+        upcoming_samples = self.event_samples[self.event_samples > master_samples_generated]
+        if len(upcoming_samples):
+            clock_frequency = self.connection_table_properties['clock_frequency']
+            self.next_read_time = read_time + (upcoming_samples[0] - master_samples_generated)/clock_frequency
+        else:
+            # Past the last sample, but not yet reporting that it has finished:
+            self.next_read_time = read_time + self.end_poll_interval
+        return False
         
     def transition_to_manual(self):
         #       Save wait data if there were waits and this was the wait monitor
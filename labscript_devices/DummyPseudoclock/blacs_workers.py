@@ -11,12 +11,71 @@
 #                                                                   #
 #####################################################################
 import time
+import threading
 import labscript_utils.h5_lock
 import h5py
 from blacs.tab_base_classes import Worker
 import labscript_utils.properties as properties
 
+class SimulatedPseudoclock(object):
+    '''A state machine standing in for pseudoclock hardware. It is armed with the duration of a shot, runs for
+    that long once started, and then reports itself done, as the status of a real pseudoclock would.'''
+    IDLE = 'idle'
+    ARMED = 'armed'
+    RUNNING = 'running'
+    DONE = 'done'
+
+    def __init__(self):
+        self.state = self.IDLE
+        self.duration = None
+        self.start_time = None
+        self.end_time = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._timer = None
+
+    def arm(self, duration):
+        self.stop()
+        with self._lock:
+            self.duration = duration
+            self.state = self.ARMED
+
+    def start(self):
+        with self._lock:
+            if self.state != self.ARMED:
+                raise RuntimeError('Cannot start a pseudoclock that is %s' % self.state)
+            self.state = self.RUNNING
+            self.start_time = time.perf_counter()
+            self.end_time = self.start_time + self.duration
+            self._timer = threading.Timer(self.duration, self._finish)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _finish(self):
+        with self._lock:
+            if self.state == self.RUNNING:
+                self.state = self.DONE
+                self._done.set()
+
+    def wait_until_done(self, timeout=None):
+        '''Wait up to timeout seconds for the run to end, returning True if it has or False if not'''
+        return self._done.wait(timeout)
+
+    def stop(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._done.clear()
+            self.state = self.IDLE
+            self.start_time = None
+            self.end_time = None
+
+
 class DummyPseudoclockWorker(Worker):
+    def init(self):
+        self.pseudoclock = SimulatedPseudoclock()
+
     def program_manual(self, values):
         return {}
 
@@ -25,21 +84,19 @@ class DummyPseudoclockWorker(Worker):
         with h5py.File(h5file, 'r') as f:
             props = properties.get(f, self.device_name, 'device_properties')
             self.stop_time = props.get('stop_time', None) # stop_time may be absent if we are not the master pseudoclock
+        self.pseudoclock.arm(self.stop_time)
         return {}
-    
+
+    def start_run(self):
+        self.pseudoclock.start()
+
     def check_if_done(self):
         # Wait up to 1 second for the shot to be done, returning True if it is
         # or False if not.
-        if getattr(self, 'start_time', None) is None:
-            self.start_time = time.time()
-        timeout = min(self.start_time + self.stop_time - time.time(), 1)
-        if timeout < 0:
-            return True
-        time.sleep(timeout)
-        return self.start_time + self.stop_time < time.time()
+        return self.pseudoclock.wait_until_done(timeout=1)
 
     def transition_to_manual(self):
-        self.start_time = None
+        self.pseudoclock.stop()
         self.stop_time = None
         return True
 
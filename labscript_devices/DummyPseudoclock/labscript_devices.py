@@ -16,7 +16,7 @@
 # in a connection table or experiment.
 
 from labscript import PseudoclockDevice, Pseudoclock, ClockLine, config, LabscriptError
-import numpy as np
+from labscript_devices.clock_traces import reduce_instructions
 
 class _DummyPseudoclock(Pseudoclock):    
     def add_device(self, device):
@@ -77,40 +77,18 @@ class DummyPseudoclock(PseudoclockDevice):
         PseudoclockDevice.generate_code(self, hdf5_file)
         group = self.init_device_group(hdf5_file)
 
-        # Compress clock instructions with the same period
-        # This will halve the number of instructions roughly,
-        # since the DummyPseudoclock does not have a 'slow clock'
-        reduced_instructions = []
-        for instruction in self.pseudoclock.clock:
-            if instruction == 'WAIT':
-                # The following period and reps indicates a wait instruction
-                reduced_instructions.append({'period': 0, 'reps': 1})
-                continue
-            reps = instruction['reps']
-            # period is in quantised units:
-            period = int(round(instruction['step'] / self.clock_resolution))
-            if reduced_instructions and reduced_instructions[-1]['period'] == period:
-                reduced_instructions[-1]['reps'] += reps
-            else:
-                reduced_instructions.append({'period': period, 'reps': reps})
-        # The following period and reps indicates a stop instruction:
-        reduced_instructions.append({'period': 0, 'reps': 0})
-        if len(reduced_instructions) > self.max_instructions:
+        pulse_program = reduce_instructions(self.pseudoclock.clock, self.clock_resolution)
+        if len(pulse_program) > self.max_instructions:
             raise LabscriptError(
                 "%s %s has too many instructions. It has %d and can only support %d"
                 % (
                     self.description,
                     self.name,
-                    len(reduced_instructions),
+                    len(pulse_program),
                     self.max_instructions,
                 )
             )
         # Store these instructions to the h5 file:
-        dtypes = [('period', int), ('reps', int)]
-        pulse_program = np.zeros(len(reduced_instructions), dtype=dtypes)
-        for i, instruction in enumerate(reduced_instructions):
-            pulse_program[i]['period'] = instruction['period']
-            pulse_program[i]['reps'] = instruction['reps']
         group.create_dataset(
             'PULSE_PROGRAM', compression=config.compression, data=pulse_program
         )
@@ -2,6 +2,8 @@ import labscript_utils.h5_lock  # noqa: F401
 import h5py
 import numpy as np
 
+from labscript_devices.clock_traces import clock_trace, max_points_for
+
 
 class DummyPseudoclockParser(object):
     clock_resolution = 25e-9
@@ -12,6 +14,9 @@ class DummyPseudoclockParser(object):
         self.path = path
         self.name = device.name
         self.device = device
+        # If not None, the maximum number of points in the clock trace, of which only
+        # every nth tick is then included:
+        self.max_points = max_points_for(device)
 
     def get_traces(self, add_trace, clock=None):
         if clock is not None:
@@ -28,31 +33,32 @@ class DummyPseudoclockParser(object):
         with h5py.File(self.path, 'r') as f:
             pulse_program = f[f'devices/{self.name}/PULSE_PROGRAM'][:]
 
-        time = []
-        states = []
         trigger_index = 0
         t = 0 if clock is None else clock_ticks[trigger_index] + self.trigger_delay
         trigger_index += 1
 
-        clock_factor = self.clock_resolution / 2.0
-
-        for row in pulse_program:
-            if row['period'] == 0:
+        # Get the start time of each instruction:
+        start_times = np.zeros(len(pulse_program))
+        periods = pulse_program['period'] * self.clock_resolution
+        rows = zip(periods.tolist(), pulse_program['reps'].tolist())
+        for i, (period, reps) in enumerate(rows):
+            start_times[i] = t
+            if period == 0:
                 # special case
-                if row['reps'] == 1:  # WAIT
+                if reps == 1:  # WAIT
                     if clock is not None:
                         t = clock_ticks[trigger_index] + self.trigger_delay
                         trigger_index += 1
                     else:
                         t += self.wait_delay
             else:
-                for i in range(row['reps']):
-                    for j in range(1, -1, -1):
-                        time.append(t)
-                        states.append(j)
-                        t += row['period'] * clock_factor
+                t += reps * period
 
-        clock = (np.array(time), np.array(states))
+        # Waits and the stop instruction produce no clock ticks:
+        reps = np.where(periods == 0, 0, pulse_program['reps'])
+        clock = clock_trace(
+            start_times, periods / 2, periods / 2, reps, max_points=self.max_points
+        )
 
         clocklines_and_triggers = {}
         for pseudoclock_name, pseudoclock in self.device.child_list.items():
@@ -24,7 +24,7 @@ import numpy as np
 
 from qtutils import UiLoader, inmain_decorator
 import qtutils.icons
-from qtutils.qt import QtWidgets, QtGui, QtCore
+from qtutils.qt import QtWidgets, QtCore
 import pyqtgraph as pg
 
 from blacs.tab_base_classes import define_state, MODE_MANUAL
@@ -33,6 +33,8 @@ from blacs.device_base_class import DeviceTab
 import labscript_utils.properties
 from labscript_utils.ls_zprocess import ZMQServer
 
+from .image_buffer import SharedImageReader
+
 
 
 
@@ -48,7 +50,8 @@ def exp_av(av_old, data_new, dt, tau):
 
 class ImageReceiver(ZMQServer):
     """ZMQServer that receives images on a zmq.REP socket, replies 'ok', and updates the
-    image widget and fps indicator"""
+    image widget and fps indicator. Images are either sent in the message, or are in
+    shared memory described by the metadata in the message."""
 
     def __init__(self, image_view, label_fps):
         ZMQServer.__init__(self, port=None, dtype='multipart')
@@ -57,17 +60,25 @@ class ImageReceiver(ZMQServer):
         self.last_frame_time = None
         self.frame_rate = None
         self.update_event = None
+        self.shared_images = SharedImageReader()
 
     @inmain_decorator(wait_for_return=True)
     def handler(self, data):
+        md = json.loads(data[0])
+        if 'shm_name' in md:
+            # Attach to the shared memory before acknowledging, so that it remains
+            # valid even if the worker replaces it with a larger one:
+            self.shared_images.attach(md['shm_name'])
         # Acknowledge immediately so that the worker process can begin acquiring the
         # next frame. This increases the possible frame rate since we may render a frame
         # whilst acquiring the next, but does not allow us to accumulate a backlog since
         # only one call to this method may occur at a time.
         self.send([b'ok'])
-        md = json.loads(data[0])
-        image = np.frombuffer(memoryview(data[1]), dtype=md['dtype'])
-        image = image.reshape(md['shape'])
+        if 'shm_name' in md:
+            image = self.shared_images.read(md)
+        else:
+            image = np.frombuffer(memoryview(data[1]), dtype=md['dtype'])
+            image = image.reshape(md['shape'])
         if len(image.shape) == 3 and image.shape[0] == 1:
             # If only one image given as a 3D array, convert to 2D array:
             image = image.reshape(image.shape[1:])
@@ -102,9 +113,13 @@ class ImageReceiver(ZMQServer):
         # and not for the Qt event loop as a whole. In any case, this seems to fix it.
         # Manually calling this is usually a sign of bad coding, but I think it is the
         # right solution to this problem. This solves issue #36.
-        QtGui.QApplication.instance().sendPostedEvents()
+        QtWidgets.QApplication.instance().sendPostedEvents()
         return self.NO_RESPONSE
 
+    def shutdown(self):
+        ZMQServer.shutdown(self)
+        self.shared_images.close()
+
 
 class IMAQdxCameraTab(DeviceTab):
     # Subclasses may override this if all they do is replace the worker class with a
@@ -142,7 +157,7 @@ class IMAQdxCameraTab(DeviceTab):
         layout.addWidget(self.ui)
         self.image = pg.ImageView()
         self.image.setSizePolicy(
-            QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Expanding
+            QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding
         )
         self.ui.horizontalLayout.addWidget(self.image)
         self.ui.pushButton_stop.hide()
@@ -261,7 +276,7 @@ class IMAQdxCameraTab(DeviceTab):
 
     def on_copy_clicked(self, button):
         text = self.attributes_dialog.plainTextEdit.toPlainText()
-        clipboard = QtGui.QApplication.instance().clipboard()
+        clipboard = QtWidgets.QApplication.instance().clipboard()
         clipboard.setText(text)
 
     def on_reset_rate_clicked(self):
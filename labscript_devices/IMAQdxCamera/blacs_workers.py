@@ -19,6 +19,8 @@ import sys
 from time import perf_counter
 from blacs.tab_base_classes import Worker
 import threading
+from queue import Queue, Empty
+from collections import Counter
 import numpy as np
 from labscript_utils import dedent
 import labscript_utils.h5_lock
@@ -30,6 +32,8 @@ from labscript_utils.ls_zprocess import Context
 from labscript_utils.shared_drive import path_to_local
 from labscript_utils.properties import set_attributes
 
+from .image_buffer import SharedImageWriter, shared_memory
+
 # Don't import nv yet so as not to throw an error, allow worker to run as a dummy
 # device, or for subclasses to import this module to inherit classes without requiring
 # nivision
@@ -242,6 +246,123 @@ class IMAQdx_Camera(object):
         nv.IMAQdxCloseCamera(self.imaqdx)
 
 
+class ShotImageWriter(list):
+    """List of the images acquired during a shot, that saves each image to the shot
+    file in a background thread as soon as it is appended, so that compression and
+    writing happen whilst the shot is still running. Images are matched up with the
+    expected exposures in order of exposure time and saved to
+    <image_path>/<name>/<frametype>. Call finish() to wait for all images to be
+    written."""
+
+    def __init__(self, h5_filepath, image_path, exposures):
+        list.__init__(self)
+        self.h5_filepath = h5_filepath
+        self.image_path = image_path
+        self.exposures = np.sort(exposures, order='t')
+        # The number of exposures with each name and frametype. Where there is more
+        # than one, their images are saved as an array in a single dataset:
+        self.counts = Counter(
+            (exposure['name'], exposure['frametype']) for exposure in self.exposures
+        )
+        self.n_written = 0
+        self.written = set()
+        self.error = None
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self.mainloop, daemon=True)
+        self.thread.start()
+
+    def append(self, image):
+        list.append(self, image)
+        self.queue.put(image)
+
+    def extend(self, images):
+        for image in images:
+            self.append(image)
+
+    def mainloop(self):
+        while True:
+            # Write all images that are waiting, opening the file only once:
+            images = [self.queue.get()]
+            while True:
+                try:
+                    images.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            # None is put to the queue last, by finish():
+            done = images[-1] is None
+            images = [image for image in images if image is not None]
+            if images and self.error is None:
+                try:
+                    with h5py.File(self.h5_filepath, 'r+') as f:
+                        image_group = f.require_group(self.image_path)
+                        for image in images:
+                            self.write_image(image_group, image)
+                except Exception as e:
+                    # Raised in the main thread by finish():
+                    self.error = e
+            if done:
+                break
+
+    def write_image(self, image_group, image):
+        if self.n_written >= len(self.exposures):
+            # More images than expected exposures. Ignore them.
+            return
+        exposure = self.exposures[self.n_written]
+        name, frametype = exposure['name'], exposure['frametype']
+        print(f"Saving frame {name}/{frametype}.")
+        group = image_group.require_group(name)
+        if self.counts[(name, frametype)] == 1:
+            self.create_image_dataset(group, frametype, data=image)
+        else:
+            if frametype not in group:
+                self.create_image_dataset(
+                    group,
+                    frametype,
+                    shape=(0,) + image.shape,
+                    maxshape=(None,) + image.shape,
+                    chunks=(1,) + image.shape,
+                )
+            dset = group[frametype]
+            dset.resize(len(dset) + 1, axis=0)
+            dset[-1] = image
+        self.n_written += 1
+        self.written.add((name, frametype))
+
+    @staticmethod
+    def create_image_dataset(group, name, **kwargs):
+        dset = group.create_dataset(name, dtype='uint16', compression='gzip', **kwargs)
+        # Specify this dataset should be viewed as an image
+        dset.attrs['CLASS'] = np.bytes_('IMAGE')
+        dset.attrs['IMAGE_VERSION'] = np.bytes_('1.2')
+        dset.attrs['IMAGE_SUBCLASS'] = np.bytes_('IMAGE_GRAYSCALE')
+        dset.attrs['IMAGE_WHITE_IS_ZERO'] = np.uint8(0)
+        return dset
+
+    def finish(self):
+        """Wait for all images appended so far to be written. Then save an empty
+        dataset for any expected exposure that had no images. Raise any exception that
+        occurred in the writer thread."""
+        self.stop()
+        if self.error is not None:
+            raise self.error
+        missing = [key for key in self.counts if key not in self.written]
+        if not missing:
+            return
+        with h5py.File(self.h5_filepath, 'r+') as f:
+            image_group = f.require_group(self.image_path)
+            for name, frametype in missing:
+                group = image_group.require_group(name)
+                self.create_image_dataset(group, frametype, data=np.array([]))
+
+    def stop(self):
+        """Wait for the writer thread to finish writing images appended so far, and
+        stop it"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
 class IMAQdxCameraWorker(Worker):
     # Subclasses may override this if their interface class takes only the serial number
     # as an instantiation argument, otherwise they may reimplement get_camera():
@@ -269,6 +390,11 @@ class IMAQdxCameraWorker(Worker):
         self.image_socket.connect(
             f'tcp://{self.parent_host}:{self.image_receiver_port}'
         )
+        # Send images to the parent via shared memory if we can, otherwise over zmq:
+        if shared_memory is not None and not getattr(self, 'is_remote', False):
+            self.image_writer = SharedImageWriter()
+        else:
+            self.image_writer = None
 
     def get_camera(self):
         """Return an instance of the camera interface class. Subclasses may override
@@ -314,10 +440,16 @@ class IMAQdxCameraWorker(Worker):
 
     def _send_image_to_parent(self, image):
         """Send the image to the GUI to display. This will block if the parent process
-        is lagging behind in displaying frames, in order to avoid a backlog."""
-        metadata = dict(dtype=str(image.dtype), shape=image.shape)
-        self.image_socket.send_json(metadata, zmq.SNDMORE)
-        self.image_socket.send(image, copy=False)
+        is lagging behind in displaying frames, in order to avoid a backlog. If
+        possible, the image is written to shared memory and only its metadata is sent
+        over self.image_socket."""
+        if self.image_writer is not None:
+            metadata = self.image_writer.write(image)
+            self.image_socket.send_json(metadata)
+        else:
+            metadata = dict(dtype=str(image.dtype), shape=image.shape)
+            self.image_socket.send_json(metadata, zmq.SNDMORE)
+            self.image_socket.send(image, copy=False)
         response = self.image_socket.recv()
         assert response == b'ok', response
 
@@ -397,7 +529,10 @@ class IMAQdxCameraWorker(Worker):
             self.attributes_to_save = None
         print(f"Configuring camera for {self.n_images} images.")
         self.camera.configure_acquisition(continuous=False, bufferCount=self.n_images)
-        self.images = []
+        # Images are saved to the shot file by the writer as they are acquired:
+        self.images = ShotImageWriter(
+            self.h5_filepath, self.get_image_path(), self.exposures
+        )
         self.acquisition_thread = threading.Thread(
             target=self.camera.grab_multiple,
             args=(self.n_images, self.images),
@@ -406,6 +541,13 @@ class IMAQdxCameraWorker(Worker):
         self.acquisition_thread.start()
         return {}
 
+    def get_image_path(self):
+        """Use orientation for image path, device_name if orientation unspecified"""
+        if self.orientation is not None:
+            return 'images/' + self.orientation
+        else:
+            return 'images/' + self.device_name
+
     def transition_to_manual(self):
         if self.h5_filepath is None:
             print('No camera exposures in this shot.\n')
@@ -427,15 +569,11 @@ class IMAQdxCameraWorker(Worker):
         print("Stopping acquisition.")
         self.camera.stop_acquisition()
 
-        print(f"Saving {len(self.images)}/{len(self.exposures)} images.")
+        print(f"Waiting for {len(self.images)}/{len(self.exposures)} images to be saved.")
+        self.images.finish()
 
         with h5py.File(self.h5_filepath, 'r+') as f:
-            # Use orientation for image path, device_name if orientation unspecified
-            if self.orientation is not None:
-                image_path = 'images/' + self.orientation
-            else:
-                image_path = 'images/' + self.device_name
-            image_group = f.require_group(image_path)
+            image_group = f.require_group(self.get_image_path())
             image_group.attrs['camera'] = self.device_name
 
             # Save camera attributes to the HDF5 file:
@@ -445,34 +583,6 @@ class IMAQdxCameraWorker(Worker):
             # Whether we failed to get all the expected exposures:
             image_group.attrs['failed_shot'] = len(self.images) != len(self.exposures)
 
-            # key the images by name and frametype. Allow for the case of there being
-            # multiple images with the same name and frametype. In this case we will
-            # save an array of images in a single dataset.
-            images = {
-                (exposure['name'], exposure['frametype']): []
-                for exposure in self.exposures
-            }
-
-            # Iterate over expected exposures, sorted by acquisition time, to match them
-            # up with the acquired images:
-            self.exposures.sort(order='t')
-            for image, exposure in zip(self.images, self.exposures):
-                images[(exposure['name'], exposure['frametype'])].append(image)
-
-            # Save images to the HDF5 file:
-            for (name, frametype), imagelist in images.items():
-                data = imagelist[0] if len(imagelist) == 1 else np.array(imagelist)
-                print(f"Saving frame(s) {name}/{frametype}.")
-                group = image_group.require_group(name)
-                dset = group.create_dataset(
-                    frametype, data=data, dtype='uint16', compression='gzip'
-                )
-                # Specify this dataset should be viewed as an image
-                dset.attrs['CLASS'] = np.string_('IMAGE')
-                dset.attrs['IMAGE_VERSION'] = np.string_('1.2')
-                dset.attrs['IMAGE_SUBCLASS'] = np.string_('IMAGE_GRAYSCALE')
-                dset.attrs['IMAGE_WHITE_IS_ZERO'] = np.uint8(0)
-
         # If the images are all the same shape, send them to the GUI for display:
         try:
             image_block = np.stack(self.images)
@@ -503,6 +613,8 @@ class IMAQdxCameraWorker(Worker):
             self.acquisition_thread = None
             self.camera.stop_acquisition()
         self.camera._abort_acquisition = False
+        if self.images is not None:
+            self.images.stop()
         self.images = None
         self.n_images = None
         self.attributes_to_save = None
@@ -529,3 +641,5 @@ class IMAQdxCameraWorker(Worker):
         if self.continuous_thread is not None:
             self.stop_continuous()
         self.camera.close()
+        if self.image_writer is not None:
+            self.image_writer.close()
@@ -0,0 +1,112 @@
+#####################################################################
+#                                                                   #
+# /labscript_devices/IMAQdxCamera/image_buffer.py                   #
+#                                                                   #
+# Copyright 2019, Monash University and contributors                #
+#                                                                   #
+# This file is part of labscript_devices, in the labscript suite    #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+
+"""Shared-memory transport of images from a camera worker to its BLACS tab. The worker
+writes each image into a ring buffer of slots in a block of shared memory and sends
+only a small metadata message to the tab, which copies the image out of the slot.
+
+Shared memory requires Python 3.8+, and the worker and tab being on the same host. When
+either is not the case, images are sent over zmq instead."""
+
+import os
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+
+class SharedImageWriter(object):
+    """Ring buffer of image slots in a block of shared memory, for the worker to write
+    images into. The block is replaced with a larger one if an image does not fit in a
+    slot.
+
+    Two slots suffice provided the reader attaches to the shared memory and replies to
+    the worker before reading from a slot, and handles one message at a time: the
+    worker may then write the next image into the other slot whilst the reader copies
+    the previous one, but cannot get further ahead than that."""
+
+    n_slots = 2
+
+    def __init__(self):
+        self.shm = None
+        self.slot_size = 0
+        self.next_slot = 0
+
+    def write(self, image):
+        """Copy the image into the next slot and return a dict of metadata the reader
+        needs to find it"""
+        if self.shm is None or image.nbytes > self.slot_size:
+            self.close()
+            # Shared memory of zero size is not allowed:
+            self.slot_size = max(image.nbytes, 1)
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=self.n_slots * self.slot_size
+            )
+        offset = self.next_slot * self.slot_size
+        self.next_slot = (self.next_slot + 1) % self.n_slots
+        slot = np.ndarray(image.shape, image.dtype, buffer=self.shm.buf, offset=offset)
+        slot[...] = image
+        del slot
+        return dict(
+            dtype=str(image.dtype),
+            shape=image.shape,
+            shm_name=self.shm.name,
+            offset=offset,
+        )
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            self.slot_size = 0
+            self.next_slot = 0
+
+
+class SharedImageReader(object):
+    """Reads images written by a SharedImageWriter in another process"""
+
+    def __init__(self):
+        self.shm = None
+
+    def attach(self, shm_name):
+        """Attach to the named shared memory, if not already attached"""
+        if self.shm is not None and self.shm.name == shm_name:
+            return
+        self.close()
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        if os.name == 'posix':
+            # The writer owns the shared memory. Prevent this process's resource
+            # tracker from unlinking it when this process exits:
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+    def read(self, metadata):
+        """Return a copy of the image described by the metadata, which must be in the
+        shared memory currently attached to"""
+        slot = np.ndarray(
+            metadata['shape'],
+            metadata['dtype'],
+            buffer=self.shm.buf,
+            offset=metadata['offset'],
+        )
+        return slot.copy()
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
@@ -196,4 +196,4 @@ class NI_DAQmxTab(DeviceTab):
 
         # Set the capabilities of this device
         self.supports_remote_value_check(False)
-        self.supports_smart_programming(False)
+        self.supports_smart_programming(True)
@@ -11,8 +11,10 @@
 #                                                                   #
 #####################################################################
 import sys
+import os
 import time
 import threading
+import tempfile
 from PyDAQmx import *
 from PyDAQmx.DAQmxConstants import *
 from PyDAQmx.DAQmxTypes import *
@@ -41,6 +43,18 @@ class NI_DAQmxOutputWorker(Worker):
         # Reset Device: clears previously added routes etc. Note: is insufficient for
         # some devices, which require power cycling to truly reset.
         DAQmxResetDevice(self.MAX_name)
+        # Buffered output tasks are kept after each shot, along with the output table
+        # they were programmed with, and are reused if the next shot's table is the
+        # same. The data written to static tasks is also kept, since it must be
+        # written again each time they are started:
+        self.smart_cache = {
+            'AO_table': None,
+            'AO_task': None,
+            'AO_data': None,
+            'DO_table': None,
+            'DO_task': None,
+            'DO_data': None,
+        }
         self.start_manual_mode_tasks()
 
     def stop_tasks(self):
@@ -55,6 +69,30 @@ class NI_DAQmxOutputWorker(Worker):
 
     def shutdown(self):
         self.stop_tasks()
+        self.clear_cached_task('AO')
+        self.clear_cached_task('DO')
+
+    def clear_cached_task(self, name):
+        """Clear the buffered 'AO' or 'DO' task kept from a previous shot, if any, so
+        that the next shot creates and programs a new one"""
+        task = self.smart_cache[name + '_task']
+        if task is not None:
+            task.ClearTask()
+        self.smart_cache[name + '_task'] = None
+        self.smart_cache[name + '_table'] = None
+        self.smart_cache[name + '_data'] = None
+
+    def output_table_unchanged(self, name, table):
+        """Return whether there is a buffered 'AO' or 'DO' task kept from a previous
+        shot that was programmed with the given output table"""
+        cached_table = self.smart_cache[name + '_table']
+        return (
+            cached_table is not None
+            and self.smart_cache[name + '_task'] is not None
+            and cached_table.dtype == table.dtype
+            and cached_table.shape == table.shape
+            and (cached_table == table).all()
+        )
 
     def check_version(self):
         """Check the version of PyDAQmx is high enough to avoid a known bug"""
@@ -163,21 +201,18 @@ class NI_DAQmxOutputWorker(Worker):
         else:
             DAQmxDisconnectTerms(self.clock_terminal, self.clock_mirror_terminal)
 
-    def program_buffered_DO(self, DO_table):
-        """Create the DO task and program in the DO table for a shot. Return a
-        dictionary of the final values of each channel in use"""
+    def program_buffered_DO(self, DO_table, fresh=True):
+        """Create the DO task and program in the DO table for a shot, or reuse the DO
+        task from the previous shot if fresh is False and the DO table is unchanged.
+        Return a dictionary of the final values of each channel in use"""
         if DO_table is None:
+            self.clear_cached_task('DO')
             return {}
-        self.DO_task = Task()
         written = int32()
         ports = DO_table.dtype.names
 
         final_values = {}
         for port_str in ports:
-            # Add each port to the task:
-            con = '%s/%s' % (self.MAX_name, port_str)
-            self.DO_task.CreateDOChan(con, "", DAQmx_Val_ChanForAllLines)
-
             # Collect the final values of the lines on this port:
             port_final_value = DO_table[port_str][-1]
             for line in range(self.ports[port_str]["num_lines"]):
@@ -185,17 +220,32 @@ class NI_DAQmxOutputWorker(Worker):
                 line_final_value = bool((1 << line) & port_final_value)
                 final_values['%s/line%d' % (port_str, line)] = int(line_final_value)
 
-        # Convert DO table to a regular array and ensure it is C continguous:
-        DO_table = np.ascontiguousarray(
-            structured_to_unstructured(DO_table, dtype=np.uint32)
-        )
+        reuse_task = not fresh and self.output_table_unchanged('DO', DO_table)
+        if reuse_task:
+            # The task already has its channels and, unless static, its timing and
+            # data. self.DO_all_zero is also as it was for the previous shot.
+            self.DO_task = self.smart_cache['DO_task']
+            DO_data = self.smart_cache['DO_data']
+        else:
+            self.clear_cached_task('DO')
+            self.DO_task = Task()
+            self.smart_cache['DO_task'] = self.DO_task
+            for port_str in ports:
+                # Add each port to the task:
+                con = '%s/%s' % (self.MAX_name, port_str)
+                self.DO_task.CreateDOChan(con, "", DAQmx_Val_ChanForAllLines)
+
+            # Convert DO table to a regular array and ensure it is C continguous:
+            DO_data = np.ascontiguousarray(
+                structured_to_unstructured(DO_table, dtype=np.uint32)
+            )
 
-        # Check if DOs are all zero for the whole shot. If they are this triggers a
-        # bug in NI-DAQmx that throws a cryptic error for buffered output. In this
-        # case, run it as a non-buffered task.
-        self.DO_all_zero = not np.any(DO_table)
-        if self.DO_all_zero:
-            DO_table = DO_table[0:1]
+            # Check if DOs are all zero for the whole shot. If they are this triggers a
+            # bug in NI-DAQmx that throws a cryptic error for buffered output. In this
+            # case, run it as a non-buffered task.
+            self.DO_all_zero = not np.any(DO_data)
+            if self.DO_all_zero:
+                DO_data = DO_data[0:1]
 
         if self.static_DO or self.DO_all_zero:
             # Static DO. Start the task and write data, no timing configuration.
@@ -207,16 +257,18 @@ class NI_DAQmxOutputWorker(Worker):
                 False,  # autostart
                 10.0,  # timeout
                 DAQmx_Val_GroupByScanNumber,
-                DO_table,
+                DO_data,
                 written,
                 None,
             )
-        else:
+            # Only the first sample is needed if the task is reused:
+            DO_data = DO_data[0:1]
+        elif not reuse_task:
             # We use all but the last sample (which is identical to the second last
             # sample) in order to ensure there is one more clock tick than there are
             # samples. This is required by some devices to determine that the task has
             # completed.
-            npts = len(DO_table) - 1
+            npts = len(DO_data) - 1
 
             # Set up timing:
             self.DO_task.CfgSampClkTiming(
@@ -234,53 +286,79 @@ class NI_DAQmxOutputWorker(Worker):
                 False,  # autostart
                 10.0,  # timeout
                 DAQmx_Val_GroupByScanNumber,
-                DO_table[:-1], # All but the last sample as mentioned above
+                DO_data[:-1], # All but the last sample as mentioned above
                 written,
                 None,
             )
 
+            # The data is already in the task's buffer, no need to keep it:
+            DO_data = None
+
             # Go!
             self.DO_task.StartTask()
+        else:
+            # Go! Restarting a stopped finite task regenerates its buffer from the
+            # start, so there is no need to write the data again.
+            self.DO_task.StartTask()
 
+        # The task can be reused in the next shot now that it is fully programmed:
+        self.smart_cache['DO_table'] = DO_table
+        self.smart_cache['DO_data'] = DO_data
         return final_values
 
-    def program_buffered_AO(self, AO_table):
+    def program_buffered_AO(self, AO_table, fresh=True):
+        """Create the AO task and program in the AO table for a shot, or reuse the AO
+        task from the previous shot if fresh is False and the AO table is unchanged.
+        Return a dictionary of the final values of each channel in use"""
         if AO_table is None:
+            self.clear_cached_task('AO')
             return {}
-        self.AO_task = Task()
         written = int32()
-        channels = ', '.join(self.MAX_name + '/' + c for c in AO_table.dtype.names)
-        self.AO_task.CreateAOVoltageChan(
-            channels, "", self.Vmin, self.Vmax, DAQmx_Val_Volts, None
-        )
 
         # Collect the final values of the analog outs:
         final_values = dict(zip(AO_table.dtype.names, AO_table[-1]))
 
-        # Convert AO table to a regular array and ensure it is C continguous:
-        AO_table = np.ascontiguousarray(
-            structured_to_unstructured(AO_table, dtype=np.float64)
-        )
+        reuse_task = not fresh and self.output_table_unchanged('AO', AO_table)
+        if reuse_task:
+            # The task already has its channels and, unless static, its timing and
+            # data. self.AO_all_zero is also as it was for the previous shot.
+            self.AO_task = self.smart_cache['AO_task']
+            AO_data = self.smart_cache['AO_data']
+        else:
+            self.clear_cached_task('AO')
+            self.AO_task = Task()
+            self.smart_cache['AO_task'] = self.AO_task
+            channels = ', '.join(self.MAX_name + '/' + c for c in AO_table.dtype.names)
+            self.AO_task.CreateAOVoltageChan(
+                channels, "", self.Vmin, self.Vmax, DAQmx_Val_Volts, None
+            )
 
-        # Check if AOs are all zero for the whole shot. If they are this triggers a
-        # bug in NI-DAQmx that throws a cryptic error for buffered output. In this
-        # case, run it as a non-buffered task.
-        self.AO_all_zero = not np.any(AO_table)
-        if self.AO_all_zero:
-            AO_table = AO_table[0:1]
+            # Convert AO table to a regular array and ensure it is C continguous:
+            AO_data = np.ascontiguousarray(
+                structured_to_unstructured(AO_table, dtype=np.float64)
+            )
+
+            # Check if AOs are all zero for the whole shot. If they are this triggers a
+            # bug in NI-DAQmx that throws a cryptic error for buffered output. In this
+            # case, run it as a non-buffered task.
+            self.AO_all_zero = not np.any(AO_data)
+            if self.AO_all_zero:
+                AO_data = AO_data[0:1]
 
         if self.static_AO or self.AO_all_zero:
             # Static AO. Start the task and write data, no timing configuration.
             self.AO_task.StartTask()
             self.AO_task.WriteAnalogF64(
-                1, True, 10.0, DAQmx_Val_GroupByChannel, AO_table, written, None
+                1, True, 10.0, DAQmx_Val_GroupByChannel, AO_data, written, None
             )
-        else:
+            # Only the first sample is needed if the task is reused:
+            AO_data = AO_data[0:1]
+        elif not reuse_task:
             # We use all but the last sample (which is identical to the second last
             # sample) in order to ensure there is one more clock tick than there are
             # samples. This is required by some devices to determine that the task has
             # completed.
-            npts = len(AO_table) - 1
+            npts = len(AO_data) - 1
 
             # Set up timing:
             self.AO_task.CfgSampClkTiming(
@@ -297,14 +375,24 @@ class NI_DAQmxOutputWorker(Worker):
                 False,  # autostart
                 10.0,  # timeout
                 DAQmx_Val_GroupByScanNumber,
-                AO_table[:-1],  # All but the last sample as mentioned above
+                AO_data[:-1],  # All but the last sample as mentioned above
                 written,
                 None,
             )
 
+            # The data is already in the task's buffer, no need to keep it:
+            AO_data = None
+
             # Go!
             self.AO_task.StartTask()
+        else:
+            # Go! Restarting a stopped finite task regenerates its buffer from the
+            # start, so there is no need to write the data again.
+            self.AO_task.StartTask()
 
+        # The task can be reused in the next shot now that it is fully programmed:
+        self.smart_cache['AO_table'] = AO_table
+        self.smart_cache['AO_data'] = AO_data
         return final_values
 
     def transition_to_buffered(self, device_name, h5file, initial_values, fresh):
@@ -321,8 +409,8 @@ class NI_DAQmxOutputWorker(Worker):
         self.set_mirror_clock_terminal_connected(True)
 
         # Program the output tasks and retrieve the final values of each output:
-        DO_final_values = self.program_buffered_DO(DO_table)
-        AO_final_values = self.program_buffered_AO(AO_table)
+        DO_final_values = self.program_buffered_DO(DO_table, fresh)
+        AO_final_values = self.program_buffered_AO(AO_table, fresh)
 
         final_values = {}
         final_values.update(DO_final_values)
@@ -337,8 +425,8 @@ class NI_DAQmxOutputWorker(Worker):
 
     def transition_to_manual(self, abort=False):
         # Stop output tasks and call program_manual. Only call StopTask if not aborting.
-        # Otherwise results in an error if output was incomplete. If aborting, call
-        # ClearTask only.
+        # Otherwise results in an error if output was incomplete. Stopped tasks are kept
+        # for reuse in the next shot. If aborting, call ClearTask only.
         npts = uInt64()
         samples = uInt64()
         tasks = []
@@ -367,12 +455,14 @@ class NI_DAQmxOutputWorker(Worker):
                         msg = 'Stopping %s at sample %d of %d'
                         self.logger.info(msg, name, current, total)
                 task.StopTask()
-            task.ClearTask()
+            else:
+                self.clear_cached_task(name)
 
         # Remove the mirroring of the clock terminal, if applicable:
         self.set_mirror_clock_terminal_connected(False)
 
-        # Set up manual mode tasks again:
+        # Set up manual mode tasks again. These may use the same channels as the
+        # stopped buffered tasks, which do not reserve them until they are restarted:
         self.start_manual_mode_tasks()
         if abort:
             # Reprogram the initial states:
@@ -406,6 +496,10 @@ class NI_DAQmxAcquisitionWorker(Worker):
         self.buffered_rate = None
         self.buffered_chans = None
 
+        # Temporary HDF5 file that acquired data is streamed to during a shot:
+        self.staging_file = None
+        self.staging_filepath = None
+
         # Hard coded for now. Perhaps we will add functionality to enable
         # and disable inputs in manual mode, and adjust the rate:
         self.manual_mode_chans = ['ai%d' % i for i in range(self.num_AI)]
@@ -421,6 +515,7 @@ class NI_DAQmxAcquisitionWorker(Worker):
     def shutdown(self):
         if self.task is not None:
             self.stop_task()
+        self.close_staging_file()
 
     def read(self, task_handle, event_type, num_samples, callback_data=None):
         """Called as a callback by DAQmx while task is running. Also called by us to get
@@ -440,11 +535,14 @@ class NI_DAQmxAcquisitionWorker(Worker):
                 samples_read,
                 None,
             )
-            # Select only the data read, and downconvert to 32 bit:
-            data = self.read_array[: int(samples_read.value), :].astype(np.float32)
+            # Select only the data read:
+            data = self.read_array[: int(samples_read.value), :]
             if self.buffered_mode:
-                # Append to the list of acquired data:
-                self.acquired_data.append(data)
+                # Append to the staging dataset. h5py downconverts to 32 bit as it
+                # writes:
+                n_acquired = self.acquired_data.shape[0]
+                self.acquired_data.resize(n_acquired + len(data), axis=0)
+                self.acquired_data[n_acquired:] = data
             else:
                 # TODO: Send it to the broker thingy.
                 pass
@@ -454,8 +552,8 @@ class NI_DAQmxAcquisitionWorker(Worker):
         """Set up a task that acquires data with a callback every MAX_READ_PTS points or
         MAX_READ_INTERVAL seconds, whichever is faster. NI DAQmx calls callbacks in a
         separate thread, so this method returns, but data acquisition continues until
-        stop_task() is called. Data is appended to self.acquired_data if
-        self.buffered_mode=True, or (TODO) sent to the [whatever the AI server broker is
+        stop_task() is called. Data is appended to the staging dataset
+        self.acquired_data if self.buffered_mode=True, or (TODO) sent to the [whatever the AI server broker is
         called] if self.buffered_mode=False."""
 
         if self.task is not None:
@@ -509,6 +607,33 @@ class NI_DAQmxAcquisitionWorker(Worker):
             self.task = None
             self.read_array = None
 
+    def open_staging_file(self, chans):
+        """Create a temporary HDF5 file with a resizable dataset that acquired data
+        is appended to as it arrives, so that a whole shot's worth of data need not be
+        held in memory"""
+        fd, self.staging_filepath = tempfile.mkstemp(
+            prefix='%s_' % self.device_name, suffix='.h5'
+        )
+        os.close(fd)
+        self.staging_file = h5py.File(self.staging_filepath, 'w')
+        self.acquired_data = self.staging_file.create_dataset(
+            'acquired_data',
+            shape=(0, len(chans)),
+            maxshape=(None, len(chans)),
+            chunks=(self.MAX_READ_PTS, len(chans)),
+            dtype=np.float32,
+        )
+
+    def close_staging_file(self):
+        """Close and delete the staging file, if any"""
+        self.acquired_data = None
+        if self.staging_file is not None:
+            self.staging_file.close()
+            self.staging_file = None
+        if self.staging_filepath is not None:
+            os.remove(self.staging_filepath)
+            self.staging_filepath = None
+
     def transition_to_buffered(self, device_name, h5file, initial_values, fresh):
         self.logger.debug('transition_to_buffered')
 
@@ -527,7 +652,8 @@ class NI_DAQmxAcquisitionWorker(Worker):
             self.buffered_chans = sorted(set(chans), key=split_conn_AI)
         self.h5_file = h5file
         self.buffered_rate = device_properties['acquisition_rate']
-        self.acquired_data = []
+        if self.buffered_chans is not None:
+            self.open_staging_file(self.buffered_chans)
         # Stop the manual mode task and start the buffered mode task:
         self.stop_task()
         self.buffered_mode = True
@@ -549,7 +675,7 @@ class NI_DAQmxAcquisitionWorker(Worker):
         self.start_task(self.manual_mode_chans, self.manual_mode_rate)
 
         if abort:
-            self.acquired_data = None
+            self.close_staging_file()
             self.buffered_chans = None
             self.h5_file = None
             self.buffered_rate = None
@@ -560,20 +686,19 @@ class NI_DAQmxAcquisitionWorker(Worker):
             data_group.create_group(self.device_name)
             waits_in_use = len(hdf5_file['waits']) > 0
 
-        if self.buffered_chans is not None and not self.acquired_data:
+        if self.buffered_chans is not None and not len(self.acquired_data):
+            self.close_staging_file()
             msg = """No data was acquired. Perhaps the acquisition task was not
                 triggered to start, is the device connected to a pseudoclock?"""
             raise RuntimeError(dedent(msg))
-        # Concatenate our chunks of acquired data and recast them as a structured
-        # array with channel names:
-        if self.acquired_data:
+        # Read the measurements out of the staging dataset, one acquisition at a time:
+        if self.acquired_data is not None:
             start_time = time.time()
-            dtypes = [(chan, np.float32) for chan in self.buffered_chans]
-            raw_data = np.concatenate(self.acquired_data).view(dtypes)
-            raw_data = raw_data.reshape((len(raw_data),))
-            self.acquired_data = None
+            try:
+                self.extract_measurements(self.acquired_data, waits_in_use)
+            finally:
+                self.close_staging_file()
             self.buffered_chans = None
-            self.extract_measurements(raw_data, waits_in_use)
             self.h5_file = None
             self.buffered_rate = None
             msg = 'data written, time taken: %ss' % str(time.time() - start_time)
@@ -584,6 +709,9 @@ class NI_DAQmxAcquisitionWorker(Worker):
         return True
 
     def extract_measurements(self, raw_data, waits_in_use):
+        """Write the acquisitions to the shot file. raw_data is a 2D array (or h5py
+        dataset) of acquired samples with one column per channel in
+        self.buffered_chans"""
         self.logger.debug('extract_measurements')
         if waits_in_use:
             # There were waits in this shot. We need to wait until the other process has
@@ -630,7 +758,8 @@ class NI_DAQmxAcquisitionWorker(Worker):
                 t_i = t0 + i_start / self.buffered_rate
                 t_f = t0 + i_end / self.buffered_rate
                 times = np.linspace(t_i, t_f, i_end - i_start + 1, endpoint=True)
-                values = raw_data[connection][i_start : i_end + 1]
+                column = self.buffered_chans.index(connection)
+                values = raw_data[i_start : i_end + 1, column]
                 dtypes = [('t', np.float64), ('values', np.float32)]
                 data = np.empty(len(values), dtype=dtypes)
                 data['t'] = times
@@ -6,6 +6,19 @@ import labscript_utils.properties as properties
 from labscript_utils import dedent
 
 
+def unpack_lines(port_vals, lines):
+    """Return a 2D float array with one row for each of the given lines, of that
+    line's digital values extracted from the packed port values port_vals. All lines are
+    unpacked in a single pass."""
+    port_vals = np.ascontiguousarray(port_vals, dtype=port_vals.dtype.newbyteorder('<'))
+    port_bytes = port_vals.view(np.uint8).reshape(-1, port_vals.dtype.itemsize)
+    bits = np.unpackbits(port_bytes, axis=1)
+    # np.unpackbits puts the most significant bit of each byte first:
+    lines = np.array(lines, dtype=int)
+    columns = 8 * (lines // 8) + 7 - lines % 8
+    return np.ascontiguousarray(bits[:, columns].T, dtype=float)
+
+
 class NI_DAQmxParser(object):
     def __init__(self, path, device):
         self.path = path
@@ -44,28 +57,42 @@ class NI_DAQmxParser(object):
 
         times, clock_value = clock[0], clock[1]
 
-        clock_indices = np.where((clock_value[1:] - clock_value[:-1]) == 1)[0] + 1
-        # If initial clock value is 1, then this counts as a rising edge (clock should
-        # be 0 before experiment) but this is not picked up by the above code. So we
-        # insert it!
-        if clock_value[0] == 1:
-            clock_indices = np.insert(clock_indices, 0, 0)
-        clock_ticks = times[clock_indices]
+        # Rising edges of the clock. The clock should be 0 before the experiment, so if
+        # the initial clock value is 1, this counts as a rising edge too:
+        rising_edges = np.empty(len(clock_value), dtype=bool)
+        rising_edges[0] = clock_value[0] == 1
+        rising_edges[1:] = np.diff(clock_value) == 1
+        clock_ticks = times[rising_edges]
+
+        # Only outputs that something is connected to need traces:
+        connections_in_use = set(
+            channel.parent_port for channel in self.device.child_list.values()
+        )
 
         traces = {}
 
         if DO_table is not None:
             ports_in_use = DO_table.dtype.names
             for port_str in ports_in_use:
-                for line in range(ports[port_str]["num_lines"]):
-                    # Extract each digital value from the packed bits:
-                    line_vals = (((1 << line) & DO_table[port_str]) != 0).astype(float)
+                lines = [
+                    line
+                    for line in range(ports[port_str]["num_lines"])
+                    if '%s/line%d' % (port_str, line) in connections_in_use
+                ]
+                if not lines:
+                    continue
+                port_vals = DO_table[port_str]
+                if static_DO:
+                    port_vals = port_vals[:1]
+                for line, line_vals in zip(lines, unpack_lines(port_vals, lines)):
                     if static_DO:
                         line_vals = np.full(len(clock_ticks), line_vals[0])
                     traces['%s/line%d' % (port_str, line)] = (clock_ticks, line_vals)
 
         if AO_table is not None:
             for chan in AO_table.dtype.names:
+                if chan not in connections_in_use:
+                    continue
                 vals = AO_table[chan]
                 if static_AO:
                     vals = np.full(len(clock_ticks), vals[0])
@@ -0,0 +1,301 @@
+#####################################################################
+#                                                                   #
+# /NI_DAQmx/testing/mock_daqmx.py                                   #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""A stand-in for PyDAQmx, for exercising the NI_DAQmx BLACS workers without hardware
+or the NI-DAQmx drivers installed. To use it, put the stand-in PyDAQmx modules in
+sys.modules before importing the workers, so that they use MockTask in place of
+PyDAQmx.Task:
+
+    import sys
+    from labscript_devices.NI_DAQmx.testing import mock_daqmx
+    sys.modules.update(mock_daqmx.pydaqmx_modules())
+    from labscript_devices.NI_DAQmx import blacs_workers
+
+Analog input tasks produce synthetic samples (a sine wave per channel) at their
+configured sample rate, calling their registered every-N-samples callback from a
+separate thread, as DAQmx does. Output tasks keep the data written to them.
+
+Calls to each DAQmx method, summed over all tasks, are counted in MockTask.calls, with
+task creation counted as 'Task'. Tests can use this to check what work was done, e.g.
+that a worker reused a task rather than creating and programming a new one:
+
+    MockTask.reset_calls()
+    worker.transition_to_buffered(device_name, h5file, initial_values, fresh=False)
+    assert MockTask.calls['Task'] == 0
+    assert MockTask.calls['WriteAnalogF64'] == 0"""
+
+import collections
+import ctypes
+import functools
+import itertools
+import threading
+import time
+from types import ModuleType, SimpleNamespace
+
+import numpy as np
+
+_task_handles = itertools.count(1)
+
+
+def _counted(method):
+    """Decorator to count calls to a MockTask method in MockTask.calls"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        MockTask.calls[method.__name__] += 1
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class MockTask(object):
+    # Frequency of the synthetic sine wave on each analog input channel:
+    SIGNAL_FREQUENCY = 50.0
+
+    # Number of calls to each method, summed over all instances:
+    calls = collections.Counter()
+
+    @classmethod
+    def reset_calls(cls):
+        cls.calls.clear()
+
+    def __init__(self):
+        MockTask.calls['Task'] += 1
+        self.taskHandle = SimpleNamespace(value=next(_task_handles))
+        self.AI_chans = []
+        self.AO_chans = []
+        self.DO_chans = []
+        # Data written to an output task, and the number of samples of it:
+        self.written_data = None
+        self.samples_written = 0
+        self.running = False
+        self.rate = None
+        self.callback = None
+        self.samples_per_callback = None
+        self.realtime = True
+        # Number of samples acquired but not yet read, and the total acquired:
+        self.samples_available = 0
+        self.samples_acquired = 0
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @_counted
+    def CreateAIVoltageChan(self, physical_channel, *args):
+        self.AI_chans.append(physical_channel)
+
+    @_counted
+    def CreateAOVoltageChan(self, physical_channel, *args):
+        self.AO_chans.extend(c.strip() for c in physical_channel.split(','))
+
+    @_counted
+    def CreateDOChan(self, lines, *args):
+        self.DO_chans.append(lines)
+
+    @_counted
+    def CfgSampClkTiming(self, source, rate, active_edge, sample_mode, samps_per_chan):
+        self.rate = rate
+
+    @_counted
+    def CfgDigEdgeStartTrig(self, trigger_source, trigger_edge):
+        pass
+
+    @_counted
+    def RegisterEveryNSamplesEvent(
+        self, event_type, n_samples, options, callback, callback_data
+    ):
+        self.samples_per_callback = n_samples
+        self.callback = callback
+
+    @_counted
+    def StartTask(self):
+        if self.running:
+            raise RuntimeError('Task is already running')
+        self.running = True
+        # A new event, so that the acquisition thread of a previous run stops even if
+        # it has not yet noticed that its event was set:
+        self.stopping = threading.Event()
+        if self.AI_chans and self.callback is not None:
+            self.thread = threading.Thread(
+                target=self._acquire, args=(self.stopping,), daemon=True
+            )
+            self.thread.start()
+
+    def _acquire(self, stopping):
+        """Make samples available at the sample rate (or as fast as possible if
+        self.realtime is False), calling the callback every samples_per_callback
+        samples"""
+        interval = self.samples_per_callback / self.rate
+        next_time = time.perf_counter() + interval
+        while not stopping.is_set():
+            if self.realtime:
+                stopping.wait(max(0, next_time - time.perf_counter()))
+                next_time += interval
+                if stopping.is_set():
+                    break
+            with self.lock:
+                self.samples_available += self.samples_per_callback
+                self.samples_acquired += self.samples_per_callback
+            self.callback(self.taskHandle.value, None, self.samples_per_callback, None)
+
+    @_counted
+    def ReadAnalogF64(
+        self,
+        num_samps_per_chan,
+        timeout,
+        fill_mode,
+        read_array,
+        array_size_in_samps,
+        samps_per_chan_read,
+        reserved,
+    ):
+        n_chans = len(self.AI_chans)
+        with self.lock:
+            if num_samps_per_chan == -1:
+                num_samps_per_chan = self.samples_available
+            n = min(num_samps_per_chan, self.samples_available, len(read_array))
+            # Index of the first sample being read:
+            start = self.samples_acquired - self.samples_available
+            self.samples_available -= n
+        t = (start + np.arange(n)) / self.rate
+        phases = 2 * np.pi * np.arange(n_chans) / max(n_chans, 1)
+        data = np.sin(2 * np.pi * self.SIGNAL_FREQUENCY * t[:, None] + phases)
+        read_array[:n, :n_chans] = data
+        samps_per_chan_read.value = n
+
+    def _write(self, num_samps_per_chan, write_array, samps_per_chan_written):
+        self.written_data = np.array(write_array[:num_samps_per_chan])
+        self.samples_written = num_samps_per_chan
+        samps_per_chan_written.value = num_samps_per_chan
+
+    @_counted
+    def WriteAnalogF64(
+        self,
+        num_samps_per_chan,
+        auto_start,
+        timeout,
+        data_layout,
+        write_array,
+        samps_per_chan_written,
+        reserved,
+    ):
+        self._write(num_samps_per_chan, write_array, samps_per_chan_written)
+
+    @_counted
+    def WriteDigitalU32(
+        self,
+        num_samps_per_chan,
+        auto_start,
+        timeout,
+        data_layout,
+        write_array,
+        samps_per_chan_written,
+        reserved,
+    ):
+        self._write(num_samps_per_chan, write_array, samps_per_chan_written)
+
+    @_counted
+    def WaitUntilTaskDone(self, timeout):
+        pass
+
+    @_counted
+    def GetWriteCurrWritePos(self, value):
+        value.value = self.samples_written
+
+    @_counted
+    def GetWriteTotalSampPerChanGenerated(self, value):
+        # Output tasks generate all their samples instantly:
+        value.value = self.samples_written
+
+    @_counted
+    def StopTask(self):
+        # Don't join the acquisition thread: the caller may hold a lock that a
+        # callback in progress is waiting on. Callbacks after this point are for a
+        # stopped task, which the workers ignore.
+        self.running = False
+        self.stopping.set()
+
+    @_counted
+    def ClearTask(self):
+        self.running = False
+        self.stopping.set()
+
+
+# The values of the NI-DAQmx constants used by the workers, from NIDAQmx.h:
+CONSTANTS = {
+    'DAQmx_Val_Acquired_Into_Buffer': 1,
+    'DAQmx_Val_ChanForAllLines': 1,
+    'DAQmx_Val_ContSamps': 10123,
+    'DAQmx_Val_DoNotInvertPolarity': 0,
+    'DAQmx_Val_FiniteSamps': 10178,
+    'DAQmx_Val_GroupByChannel': 0,
+    'DAQmx_Val_GroupByScanNumber': 1,
+    'DAQmx_Val_Low': 10214,
+    'DAQmx_Val_LowFreq1Ctr': 10105,
+    'DAQmx_Val_Period': 10256,
+    'DAQmx_Val_RSE': 10083,
+    'DAQmx_Val_Rising': 10280,
+    'DAQmx_Val_Seconds': 10364,
+    'DAQmx_Val_Task_Commit': 3,
+    'DAQmx_Val_Volts': 10348,
+}
+
+TYPES = {
+    'int32': ctypes.c_int32,
+    'uInt32': ctypes.c_uint32,
+    'uInt64': ctypes.c_uint64,
+    'float64': ctypes.c_double,
+    'bool32': ctypes.c_uint32,
+}
+
+# The version of NI-DAQmx reported:
+NIDAQMX_VERSION = (20, 1, 0)
+
+
+def _set_version_part(index):
+    def get_version(value):
+        value.value = NIDAQMX_VERSION[index]
+        return 0
+
+    return get_version
+
+
+def _no_op(*args):
+    return 0
+
+
+def pydaqmx_modules():
+    """Return a dict of stand-ins for the PyDAQmx package and the submodules of it
+    that the workers import, keyed by module name, for putting in sys.modules. Tasks
+    are MockTasks, and the functions not belonging to a task do nothing, other than
+    report NIDAQMX_VERSION as the version of NI-DAQmx."""
+    constants = ModuleType('PyDAQmx.DAQmxConstants')
+    vars(constants).update(CONSTANTS)
+    types = ModuleType('PyDAQmx.DAQmxTypes')
+    vars(types).update(TYPES)
+    callback = ModuleType('PyDAQmx.DAQmxCallBack')
+    # MockTask calls the callback directly, so it need not be wrapped as a C function:
+    callback.DAQmxEveryNSamplesEventCallbackPtr = lambda function: function
+    pydaqmx = ModuleType('PyDAQmx')
+    for module in [constants, types, callback]:
+        setattr(pydaqmx, module.__name__.split('.')[-1], module)
+        vars(pydaqmx).update(
+            (name, value) for name, value in vars(module).items() if name[0] != '_'
+        )
+    pydaqmx.Task = MockTask
+    pydaqmx.DAQmxGetSysNIDAQMajorVersion = _set_version_part(0)
+    pydaqmx.DAQmxGetSysNIDAQMinorVersion = _set_version_part(1)
+    pydaqmx.DAQmxGetSysNIDAQUpdateVersion = _set_version_part(2)
+    for name in ['DAQmxResetDevice', 'DAQmxConnectTerms', 'DAQmxDisconnectTerms']:
+        setattr(pydaqmx, name, _no_op)
+    modules = [pydaqmx, constants, types, callback]
+    return {module.__name__: module for module in modules}
@@ -8,6 +8,7 @@ class NarwhalPulseGenTab(DeviceTab):
 
     @define_state(MODE_BUFFERED, True)
     def start_run(self, notify_queue):
+        yield (self.queue_work(self.primary_worker, 'start_run'))
         self.wait_until_done(notify_queue)
 
     @define_state(MODE_BUFFERED, True)
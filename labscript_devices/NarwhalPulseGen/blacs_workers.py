@@ -9,12 +9,18 @@ import serial.tools.list_ports
 import numpy as np
 from . import transcode
 import time as systime
-import struct
 
 class NarwhalPulseGenWorker(Worker):
     '''See p151 of Phils thesis for full explanation'''
+    # How long to wait for the device to confirm it has received uploaded instructions:
+    upload_timeout = 1
+    # How long each call to check_if_done waits for the device to report the end of the run:
+    done_timeout = 1
+
     def init(self):
         print(self.usbport)
+        self.smart_cache = None
+        self.receive_buffer = bytearray()
         self.ser = serial.Serial()
         self.ser.baudrate = 12000000
         self.ser.port = self.usbport
@@ -50,6 +56,7 @@ class NarwhalPulseGenWorker(Worker):
         if self.ser.isOpen():
             try:
                 self.ser.flushInput() #flush input buffer, discarding all its contents
+                self.receive_buffer.clear()
                 self.ser.flushOutput()#flush output buffer, aborting current output
                 print('Serial port connected to Narwhal PulseGen...')
             except Exception as e1:
@@ -77,24 +84,42 @@ class NarwhalPulseGenWorker(Worker):
 
     def _get_message(self, timeout=0.0, print_all_messages=False):
         ''' This returns the first message in the pipe, or None if there is none within the pipe
-        by the time it times out. If timeout=None, this blocks until it reads a message'''
+        by the time it times out. If timeout=None, this blocks until it reads a message.
+        Bytes are read from the serial port in chunks of as many as are waiting, into a receive buffer from which
+        messages are framed. Part of a message that has not fully arrived by the timeout is kept for the next call.'''
         t0 = systime.time()
-        self.ser.timeout = timeout
-        byte_message_identifier = self.ser.read(1)
-        if byte_message_identifier != b'':
-            message_identifier, = struct.unpack('B', byte_message_identifier)
-            if message_identifier not in transcode.msgin_decodeinfo.keys():
-                print('The computer read a an invalid message identifier.')
+        while True:
+            identifier, message = self._frame_message()
+            if identifier is not None:
+                if print_all_messages:
+                    print(message)
+                return identifier, message
+            if timeout is None:
+                self.ser.timeout = None
+            else:
+                self.ser.timeout = max(timeout - (systime.time() - t0), 0.0)
+            # Block for at most one byte, and take everything else that has arrived with it:
+            chunk = self.ser.read(max(self.ser.in_waiting, 1))
+            if not chunk:
                 return None, None
+            self.receive_buffer += chunk
+
+    def _frame_message(self):
+        ''' Removes the first complete message from the receive buffer and returns its identifier and decoded
+        contents, or None, None if there is no complete message in it.'''
+        buffer = self.receive_buffer
+        while buffer:
+            message_identifier = buffer[0]
+            if message_identifier not in transcode.msgin_decodeinfo:
+                print('The computer read a an invalid message identifier.')
+                del buffer[:1]
+                continue
+            message_length = transcode.msgin_decodeinfo[message_identifier]['message_length']
+            if len(buffer) < message_length:
+                break
+            byte_message = bytes(buffer[1:message_length])
+            del buffer[:message_length]
             decode_function = transcode.msgin_decodeinfo[message_identifier]['decode_function']
-            if timeout:
-                self.ser.timeout = max(timeout - (systime.time() - t0), 0.0)    # sets the timeout to read the rest of the message to be the specified timeout, minus whatever time has been used up so far.
-            byte_message = self.ser.read(transcode.msgin_decodeinfo[message_identifier]['message_length'] - 1)
-            if byte_message_identifier == b'':
-                print('The computer read a valid message identifier, but the full message didn\'t arrive.')
-                return None, None
-            if print_all_messages:
-                print(decode_function(byte_message))
             return message_identifier, decode_function(byte_message)
         return None, None
 
@@ -143,15 +168,15 @@ class NarwhalPulseGenWorker(Worker):
         self.write_to_serial(command)
 
     def write_device_options(self, final_ram_address=None, run_mode=None, trigger_mode=None, trigger_time=None, notify_on_main_trig=None, trigger_length=None):
-        command = transcode.encode_device_options(final_ram_address=None, run_mode=None, trigger_mode=None, trigger_time=None, notify_on_main_trig=None, trigger_length=None)
+        command = transcode.encode_device_options(final_ram_address=final_ram_address, run_mode=run_mode, trigger_mode=trigger_mode, trigger_time=trigger_time, notify_on_main_trig=notify_on_main_trig, trigger_length=trigger_length)
         self.write_to_serial(command)
 
     def write_powerline_trigger_options(self, trigger_on_powerline=None, powerline_trigger_delay=None):
-        command = transcode.encode_powerline_trigger_options(trigger_on_powerline=None, powerline_trigger_delay=None)
+        command = transcode.encode_powerline_trigger_options(trigger_on_powerline=trigger_on_powerline, powerline_trigger_delay=powerline_trigger_delay)
         self.write_to_serial(command)
 
     def write_action(self, enable=None, trigger_now=False, request_state=False, reset_output_coordinator=False, disable_after_current_run=False, notify_when_current_run_finished=False, request_powerline_state=False):
-        command = transcode.encode_action(enable=None, trigger_now=False, request_state=False, reset_output_coordinator=False, disable_after_current_run=False, notify_when_current_run_finished=False, request_powerline_state=False)
+        command = transcode.encode_action(enable=enable, trigger_now=trigger_now, request_state=request_state, reset_output_coordinator=reset_output_coordinator, disable_after_current_run=disable_after_current_run, notify_when_current_run_finished=notify_when_current_run_finished, request_powerline_state=request_powerline_state)
         self.write_to_serial(command)
 
     def write_general_debug(self, message):
@@ -164,7 +189,8 @@ class NarwhalPulseGenWorker(Worker):
 
     def write_instructions(self, instructions):
         ''' "instructions" are the encoded timing instructions that will be loaded into the pulse generator memeory.
-        These instructions must be generated using the transcode.encode_instruction function. 
+        These instructions must be generated using the transcode.encode_instruction function, or the transcode.encode_instructions
+        function for a whole table of instructions at once. 
         This function accecpts encoded instructions in the following formats (where each individual instruction is always
         in bytes/bytearray): A single encoded instruction, multiple encoded instructions joined together in a single bytes/bytearray, 
         or a list, tuple, or array of single or multiple encoded instructions.'''
@@ -176,13 +202,31 @@ class NarwhalPulseGenWorker(Worker):
     def write_to_serial(self, command):
         self.ser.write(command)
 
+    def upload_instructions(self, instructions, fresh=True):
+        ''' Loads a table of instructions, as generated by the labscript device, into the pulse generator memory
+        in a single write, skipping any that are unchanged since the last upload unless fresh is True. Then confirms
+        the device has received them all by requesting its state, which it sends after processing them.'''
+        changed = np.ones(len(instructions), dtype=bool)
+        if not fresh and self.smart_cache is not None:
+            n_cached = min(len(instructions), len(self.smart_cache))
+            changed[:n_cached] = instructions[:n_cached] != self.smart_cache[:n_cached]
+        # Invalidate the cache until we know the upload succeeded:
+        self.smart_cache = None
+        self.write_instructions(transcode.encode_instructions(instructions[changed]))
+        self.write_action(request_state=True)
+        devicestate = self.return_on_message_type(transcode.msgin_identifier['devicestate'], timeout=self.upload_timeout)
+        if devicestate is None:
+            raise RuntimeError('Narwhal PulseGen did not respond after uploading instructions.')
+        if devicestate['final_ram_address'] != len(instructions) - 1:
+            raise RuntimeError('Narwhal PulseGen reports a final RAM address of {} after uploading {} instructions.'.format(devicestate['final_ram_address'], len(instructions)))
+        self.smart_cache = instructions
+
     # These are the functions that I have to complete that are defined in labscript.
     #####################################################
     def program_manual(self, values):
         return {}
 
     def transition_to_buffered(self, device_name, h5file, initial_values, fresh):
-        print('boo! transtion to buffered')
         # get stop time:
         with h5py.File(h5file, 'r') as hdf5_file:
             props = properties.get(hdf5_file, device_name, 'device_properties')
@@ -193,32 +237,41 @@ class NarwhalPulseGenWorker(Worker):
             device_properties = labscript_utils.properties.get(hdf5_file, device_name, 'device_properties')
             self.is_master_pseudoclock = device_properties['is_master_pseudoclock']
 
-
+        # The master pseudoclock is started in software by start_run, others by a hardware trigger:
+        trigger_mode = 'software' if self.is_master_pseudoclock else 'hardware'
+        self.write_device_options(final_ram_address=len(pulse_program) - 1, run_mode='single', trigger_mode=trigger_mode, trigger_time=0, notify_on_main_trig=False, trigger_length=1)
+        # Discard any notifications left over from previous runs, so that only this run's end is reported:
+        self.read_all_messages_in_pipe()
+        self.upload_instructions(pulse_program, fresh)
+        # Ask the device to tell us when the run finishes, which check_if_done waits for:
+        self.write_action(enable=True, notify_when_current_run_finished=True)
         return {}
+
+    def start_run(self):
+        if self.is_master_pseudoclock:
+            self.write_action(trigger_now=True)
     
     def transition_to_manual(self):
-        self.start_time = None
         self.stop_time = None
         return True
 
     def check_if_done(self):
-        # Wait up to 1 second for the shot to be done, returning True if it is
-        # or False if not.
-        if getattr(self, 'start_time', None) is None:
-            self.start_time = time.time()
-        timeout = min(self.start_time + self.stop_time - time.time(), 1)
-        if timeout < 0:
-            return True
-        time.sleep(timeout)
-        return self.start_time + self.stop_time < time.time()
+        # Wait up to done_timeout seconds for the device to notify us that the run has finished, returning True if
+        # it has or False if not. Other messages arriving in the meantime are discarded.
+        notification = self.return_on_notification(finished=True, timeout=self.done_timeout)
+        return notification is not None
 
     def shutdown(self):
         return
 
     def abort_buffered(self):
+        # Stop the run, so the device does not carry on and notify us of its end during the next shot:
+        self.write_action(enable=False)
         return self.transition_to_manual()
 
     def abort_transition_to_buffered(self):
+        # The upload may not have completed:
+        self.smart_cache = None
         return True
 
     def check_remote_values(self):
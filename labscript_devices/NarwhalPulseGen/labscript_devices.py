@@ -6,6 +6,7 @@
 
 from labscript import PseudoclockDevice, Pseudoclock, ClockLine, IntermediateDevice, DigitalOut, config, LabscriptError, set_passed_properties
 import numpy as np
+from .transcode import instruction_dtype
 
 
 class NarwhalPulseGenPseudoclock(Pseudoclock):  
@@ -19,12 +20,15 @@ class NarwhalPulseGenPseudoclock(Pseudoclock):
 class NarwhalPulseGen(PseudoclockDevice):
     description = 'Narwhal Devices Pulse Generator - PseudoclockDevice'
     cycle_period = 10e-9
-    clock_limit = 1/cycle_period
+    # A clock tick is a high instruction followed by a low one, each at least one cycle long:
+    clock_limit = 1/(2*cycle_period)
     clock_resolution = cycle_period
     trigger_delay = 2*cycle_period
     wait_delay = trigger_delay
     allowed_children = [NarwhalPulseGenPseudoclock]
     max_instructions = 8192
+    n_outputs = 24
+    max_goto_counter = 2**32 - 1
 
     @set_passed_properties(property_names = {
         'connection_table_properties': ['usbport']}
@@ -84,66 +88,102 @@ class NarwhalPulseGen(PseudoclockDevice):
 
     def convert_to_npg_inst(self, dig_outputs):
         '''
-        The format of the instructions will be a list of dictionaries, each dictioaty will be an instruction
-        Its index in the list will be its address.
-        The instruction dictionary will have the format:
-        instr = {'state'=array(24 ints), 'duration'=1, 'goto_address'=0, 'goto_counter'=0, 'stop_and_wait'=False, 'hardware_trig_out'=False, 'notify_computer'=False, 'powerline_sync'=False}
-        in the state array, the index corresponds to the main output number.
-        the values can be 0=low, 1=high, 2=set_by_blacs (usually for channels that aren't switching)
+        Convert the pseudoclock instructions into a structured array of Narwhal PulseGen instructions with
+        dtype transcode.instruction_dtype. Its index in the array is its address.
+        The state of each instruction is an int, with bit n the state of main output n. Outputs are either
+        direct outputs, or clock lines, which tick on each pseudoclock tick.
+        After an instruction's duration (in cycles) elapses, if its goto_counter is nonzero the device jumps to its
+        goto_address, and does so goto_counter times before continuing on to the next instruction instead.
+        An instruction with stop_and_wait set waits for a trigger before it starts.
+
+        Each pseudoclock instruction in which clock lines tick becomes a loop of two instructions: one with the
+        clock lines high for the first half of the period, and one with them low, which jumps back to the first
+        reps - 1 times. Instructions in which only the direct outputs update are a single instruction.
+        WAITs set stop_and_wait on the instruction following them.
         '''
-
-        '''
-        What would I do:
-        Get a pen and paper and write it out.
-
-        
-        '''
-
-
-
-
-
-        print(dig_outputs)
-        for attr in dir(dig_outputs[0]):
-            print('obj.%s = %r'%(attr, getattr(dig_outputs[0], attr)))
-        print(dig_outputs[0].__dict__)
-        npg_instr = []
-        for k, instruction in enumerate(self.pseudoclock.clock):
-            # print(k, instruction)
-            # print(instruction['enabled_clocks'])
-            print([clockline.name for clockline in instruction['enabled_clocks']])
-            print(instruction)
-            print()
-        i=0
-        for k, instruction in enumerate(self.pseudoclock.clock):
-            # This flag indicates whether we need a full clock tick, or are just updating an internal output
-            only_internal = True
-            # find out which clock flags are ticking during this instruction
-            for clock_line in instruction['enabled_clocks']:
-                if clock_line == self._direct_output_clock_line: 
-                    # advance i (the index keeping track of internal clockline output)
-                    i += 1
-                else:
-                    flag_index = int(clock_line.connection.split()[-1])
-                    # flags[flag_index] = 1
-                    # We are not just using the internal clock line
-                    only_internal = False
-            
-            # for output in dig_outputs:
-            #     flagindex = int(output.connection.split()[1])
-            #     flags[flagindex] = int(output.raw_output[i])
-
-
-        return npg_instr
-
-    def write_npg_inst_to_h5(self, pb_inst, hdf5_file):
-        pb_inst_table = np.empty(len(pb_inst),dtype = np.int)
-        for i,inst in enumerate(pb_inst):
-            pb_inst_table[i] = ((0, 0, 0, 0))
-        # Okay now write it to the file: 
+        clock = self.pseudoclock.clock
+        is_wait = np.array([instruction == 'WAIT' for instruction in clock], dtype=bool)
+        instructions = [instruction for instruction in clock if instruction != 'WAIT']
+        n_inst = len(instructions)
+        steps = np.array([instruction['step'] for instruction in instructions], dtype=np.float64)
+        reps = np.array([instruction['reps'] for instruction in instructions], dtype=np.int64)
+
+        # Which clock lines tick during each instruction, and whether the internal
+        # clockline (the one the direct outputs are clocked by) ticks:
+        clock_mask = np.zeros(n_inst, dtype=np.int64)
+        internal_ticks = np.zeros(n_inst, dtype=bool)
+        for clock_line in self.pseudoclock.child_devices:
+            enabled = np.array([clock_line in instruction['enabled_clocks'] for instruction in instructions], dtype=bool)
+            if clock_line == self._direct_output_clock_line:
+                internal_ticks |= enabled
+            else:
+                clock_mask[enabled] |= 1 << self.output_index(clock_line)
+        ticks = clock_mask != 0
+
+        # index into output.raw_output of the direct outputs for each instruction.
+        # Starts at -1 because the internal clockline always ticks on the first
+        # instruction, incrementing it to 0 before it is used to index any arrays:
+        i = np.cumsum(internal_ticks) - 1
+        dig_mask = 0
+        dig_state = np.zeros(n_inst, dtype=np.int64)
+        for output in dig_outputs:
+            output_index = self.output_index(output)
+            dig_mask |= 1 << output_index
+            dig_state |= np.asarray(output.raw_output, dtype=np.int64)[i] << output_index
+        # Direct outputs take precedence over clock lines:
+        high_state = (clock_mask & ~dig_mask) | dig_state
+        low_state = high_state & ~clock_mask
+
+        periods = np.round(steps / self.cycle_period).astype(np.int64)
+        high_cycles = periods // 2
+        if np.any(reps - 1 > self.max_goto_counter):
+            k = np.argmax(reps - 1 > self.max_goto_counter)
+            raise LabscriptError(f'{self.name} cannot loop more than {self.max_goto_counter + 1} times. ' +
+                                 f'{reps[k]} were requested at t = {instructions[k]["start"]}.')
+
+        # Two instructions for each pseudoclock instruction that ticks, one otherwise:
+        n_rows = np.where(ticks, 2, 1)
+        first_row = np.cumsum(n_rows) - n_rows
+        npg_inst = np.zeros(n_rows.sum(), dtype=instruction_dtype)
+        if len(npg_inst) > self.max_instructions:
+            raise LabscriptError(f'{self.description} {self.name} has too many instructions. ' +
+                                 f'It has {len(npg_inst)} and can only support {self.max_instructions}.')
+        npg_inst['address'] = np.arange(len(npg_inst))
+
+        # Clock lines high, then low for the rest of the period, looping back reps - 1 times:
+        rows = first_row[ticks]
+        npg_inst['state'][rows] = high_state[ticks]
+        npg_inst['duration'][rows] = high_cycles[ticks]
+        npg_inst['state'][rows + 1] = low_state[ticks]
+        npg_inst['duration'][rows + 1] = (periods - high_cycles)[ticks]
+        npg_inst['goto_address'][rows + 1] = rows
+        npg_inst['goto_counter'][rows + 1] = (reps - 1)[ticks]
+        # Direct output updates only:
+        rows = first_row[~ticks]
+        npg_inst['state'][rows] = low_state[~ticks]
+        npg_inst['duration'][rows] = (periods * reps)[~ticks]
+
+        # The instruction following each WAIT waits for a trigger before starting:
+        following_waits = np.cumsum(~is_wait)[is_wait]
+        npg_inst['stop_and_wait'][first_row[following_waits[following_waits < n_inst]]] = True
+        return npg_inst
+
+    def output_index(self, device):
+        '''The index of the main output a DigitalOut or ClockLine is connected to, from its connection, eg 'flag 3'.'''
+        try:
+            index = int(device.connection.split()[-1])
+        except ValueError:
+            index = None
+        if index is None or not 0 <= index < self.n_outputs:
+            raise LabscriptError(f'{device.name} is connected to {self.name} with connection {device.connection}, ' +
+                                 f'which is not a main output. Connections must be of the form \'flag n\', with n from 0 to {self.n_outputs - 1}.')
+        return index
+
+    def write_npg_inst_to_h5(self, npg_inst, hdf5_file):
         group = hdf5_file['/devices/'+self.name]  
-        group.create_dataset('PULSE_PROGRAM', compression=config.compression,data = pb_inst_table)   
-        self.set_property('stop_time', 696969, location='device_properties')
+        group.create_dataset('PULSE_PROGRAM', compression=config.compression, data=npg_inst)
+        self.set_property('is_master_pseudoclock', self.is_master_pseudoclock, location='device_properties')
+        self.set_property('stop_time', self.stop_time, location='device_properties')
 
 class NarwhalPulseGenDirectOutputs(IntermediateDevice):
     description = 'Narwhal Devices Pulse Generator - IntermediateDevice. The parent of any direct DigitalOut devices'
@@ -0,0 +1,234 @@
+'''A stand-in for the serial connection to a Narwhal PulseGen, for exercising NarwhalPulseGenWorker without
+hardware.'''
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import serial
+import serial.tools.list_ports
+
+from labscript_devices.NarwhalPulseGen import transcode
+from labscript_devices.NarwhalPulseGen.blacs_workers import NarwhalPulseGenWorker
+from labscript_devices.testing.mock_serial import MockSerial
+
+
+class MockNarwhalPulseGenSerial(MockSerial):
+    '''A stand-in for the serial connection to a Narwhal PulseGen. Messages written to it are processed by an
+    emulated device, which loads instructions into its memory, records its options, and responds to echoes and
+    requests for its state. Each write takes write_latency seconds, as a USB transfer does, plus the time for its
+    bytes to cross the serial link at the baud rate, as do responses. Once enabled and triggered, by trigger_now or
+    by calling trigger() as a hardware trigger would, the emulated device runs its instructions for as long as they
+    take to execute, plus wait_duration seconds at each instruction that stops and waits, and then notifies the
+    computer if it was asked to when the run finished.'''
+    device_version = b'mock   '
+    cycle_period = 10e-9
+    # How long each wait for a trigger lasts during a run:
+    wait_duration = 0
+    # Length of each message sent to the device, including its identifier:
+    msgout_length = {150:2, 151:19, 152:2, 153:9, 154:12, 155:4, 156:5}
+
+    def __init__(self, port=None, baudrate=12000000, timeout=None, write_latency=125e-6, max_instructions=8192):
+        MockSerial.__init__(self, port, baudrate, timeout)
+        self.write_latency = write_latency
+        # Emulated device state:
+        self.ram = np.zeros(max_instructions, dtype=transcode.instruction_dtype)
+        self.ram['address'] = np.arange(max_instructions)
+        self.final_ram_address = 0
+        self.run_mode = 'single'
+        self.trigger_mode = 'software'
+        self.trigger_time = 0
+        self.trigger_length = 0
+        self.notify_on_main_trig = False
+        self.run_enable = False
+        self.state = 0
+        self.current_address = 0
+        self.notify_when_finished = False
+        self.running = False
+        self.run_start_time = None
+        self.run_end_time = None
+        self.finished_notification = None
+        self.n_triggers = 0
+        self.n_writes = 0
+        self.bytes_written = 0
+        # When the serial link will have carried everything written so far:
+        self.link_free_time = 0
+        self.partial_message = b''
+
+    def write(self, data):
+        data = bytes(data)
+        n_bytes = len(data)
+        self.n_writes += 1
+        self.bytes_written += n_bytes
+        now = time.perf_counter()
+        self.link_free_time = max(self.link_free_time, now) + self.write_latency + self.transfer_time(data)
+        data = self.partial_message + data
+        i = 0
+        while i < len(data):
+            length = self.msgout_length.get(data[i])
+            if length is None:
+                # Invalid identifier, discard it:
+                i += 1
+                continue
+            if i + length > len(data):
+                break
+            self.execute(data[i], data[i + 1:i + length])
+            i += length
+        self.partial_message = data[i:]
+        time.sleep(max(self.link_free_time - time.perf_counter(), 0))
+        return n_bytes
+
+    def transfer_time(self, data):
+        # A start and stop bit per byte:
+        return 10 * len(data) / self.baudrate
+
+    def respond(self, response, send_time=None):
+        if send_time is None:
+            send_time = self.link_free_time
+        return self.queue_response(response, send_time + self.transfer_time(response))
+
+    def run_duration(self):
+        '''The time in seconds a run of the instructions in memory takes, from the trigger to the end of the final
+        instruction. Loops over instructions that contain no loops themselves are counted without stepping through
+        each repetition.'''
+        instructions = self.instructions()
+        durations = instructions['duration'].astype(float)
+        has_goto = instructions['goto_counter'] > 0
+        counters = {}
+        cycles = 0
+        n_waits = 0
+        address = 0
+        while True:
+            instruction = instructions[address]
+            cycles += durations[address]
+            n_waits += int(instruction['stop_and_wait'])
+            goto_address = int(instruction['goto_address'])
+            if instruction['goto_counter']:
+                if address not in counters and goto_address <= address and not has_goto[goto_address:address].any():
+                    # A simple loop, repeat the rest of it all at once:
+                    repetitions = int(instruction['goto_counter'])
+                    cycles += repetitions * durations[goto_address:address + 1].sum()
+                    n_waits += repetitions * int(instructions['stop_and_wait'][goto_address:address + 1].sum())
+                else:
+                    remaining = counters.get(address, int(instruction['goto_counter']))
+                    if remaining:
+                        counters[address] = remaining - 1
+                        address = goto_address
+                        continue
+                    del counters[address]
+            if address >= len(instructions) - 1:
+                return cycles * self.cycle_period + n_waits * self.wait_duration
+            address += 1
+
+    def trigger(self):
+        '''Start a run, if the device is enabled and not already running'''
+        self._update_run()
+        if not self.run_enable or self.running:
+            return
+        self.n_triggers += 1
+        self.running = True
+        self.run_start_time = max(self.link_free_time, time.perf_counter())
+        self.run_end_time = self.run_start_time + self.run_duration()
+        self._schedule_finished_notification()
+
+    def _schedule_finished_notification(self):
+        if self.running and self.notify_when_finished:
+            notification = (
+                bytes([transcode.msgin_identifier['notification']])
+                + self.final_ram_address.to_bytes(2, 'little')
+                + bytes([0b100]) # end of run notify tag
+            )
+            self.finished_notification = self.respond(notification, send_time=self.run_end_time)
+            self.notify_when_finished = False
+
+    def _update_run(self):
+        if self.running and time.perf_counter() >= self.run_end_time:
+            self.running = False
+            self.current_address = self.final_ram_address
+            self.finished_notification = None
+
+    def _stop_run(self):
+        self.running = False
+        if self.finished_notification in self.responses:
+            self.responses.remove(self.finished_notification)
+        self.finished_notification = None
+
+    def execute(self, identifier, message):
+        if identifier == transcode.msgout_identifier['echo']:
+            self.respond(bytes([transcode.msgin_identifier['echo']]) + message + self.device_version)
+        elif identifier == transcode.msgout_identifier['load_ram']:
+            address = int.from_bytes(message[0:2], 'little')
+            tags = message[17]
+            self.ram[address] = (
+                address,
+                int.from_bytes(message[2:5], 'little'),
+                int.from_bytes(message[5:11], 'little'),
+                int.from_bytes(message[11:13], 'little'),
+                int.from_bytes(message[13:17], 'little'),
+                (tags >> 0) & 0b1,
+                (tags >> 1) & 0b1,
+                (tags >> 2) & 0b1,
+                (tags >> 3) & 0b1,
+            )
+        elif identifier == transcode.msgout_identifier['action_request']:
+            tags = message[0]
+            self._update_run()
+            if tags & 0b1:
+                self.run_enable = bool((tags >> 1) & 0b1)
+                if not self.run_enable:
+                    self._stop_run()
+            if (tags >> 6) & 0b1:
+                self.notify_when_finished = True
+            if (tags >> 2) & 0b1:
+                self.trigger()
+            self._schedule_finished_notification()
+            if (tags >> 3) & 0b1:
+                self.respond(self.devicestate())
+        elif identifier == transcode.msgout_identifier['device_options']:
+            tags = message[10]
+            self.final_ram_address = int.from_bytes(message[0:2], 'little')
+            self.trigger_time = int.from_bytes(message[2:9], 'little')
+            self.trigger_length = message[9]
+            self.run_mode = transcode.decode_lookup['run_mode'][(tags >> 0) & 0b1]
+            self.trigger_mode = transcode.decode_lookup['trigger_mode'][(tags >> 1) & 0b11]
+            self.notify_on_main_trig = transcode.decode_lookup['notify_on_main_trig'][(tags >> 3) & 0b1]
+        elif identifier == transcode.msgout_identifier['set_static_state']:
+            self.state = int.from_bytes(message[0:3], 'little')
+
+    def devicestate(self):
+        self._update_run()
+        message = np.zeros(1, dtype=transcode.devicestate_message_dtype)
+        message['identifier'] = transcode.msgin_identifier['devicestate']
+        message['state'] = np.frombuffer(self.state.to_bytes(3, 'little'), dtype=np.uint8)
+        message['final_ram_address'] = self.final_ram_address
+        message['trigger_time'] = np.frombuffer(self.trigger_time.to_bytes(7, 'little'), dtype=np.uint8)
+        message['trigger_length'] = self.trigger_length
+        message['tags'] = (
+            (transcode.encode_lookup['run_mode'][self.run_mode] << 0)
+            | (transcode.encode_lookup['trigger_mode'][self.trigger_mode] << 1)
+            | (int(self.notify_on_main_trig) << 3)
+            | (1 << 4) # internal clock source
+            | (int(self.run_enable) << 5)
+        )
+        message['current_ram_address'] = self.current_address
+        return message.tobytes()
+
+    def instructions(self):
+        '''The instructions in the emulated device's memory, up to its final RAM address'''
+        return self.ram[:self.final_ram_address + 1].copy()
+
+
+def make_worker(usbport='COM1'):
+    '''Return an initialised NarwhalPulseGenWorker connected to a MockNarwhalPulseGenSerial on the given port,
+    without starting a worker process. The emulated device is worker.ser.'''
+    worker = object.__new__(NarwhalPulseGenWorker)
+    worker.usbport = usbport
+    Serial, comports = serial.Serial, serial.tools.list_ports.comports
+    serial.Serial = MockNarwhalPulseGenSerial
+    serial.tools.list_ports.comports = lambda: [
+        SimpleNamespace(device=usbport, description='USB Serial Port (%s)' % usbport)
+    ]
+    try:
+        worker.init()
+    finally:
+        serial.Serial, serial.tools.list_ports.comports = Serial, comports
+    return worker
@@ -67,6 +67,37 @@ def decode_devicestate(message):
     run_enable =            decode_lookup['run_enable'][run_enable_tag]
     return {'state:':state, 'final_ram_address':final_ram_address, 'trigger_time':trigger_time, 'run_mode':run_mode, 'trigger_mode':trigger_mode, 'notify_on_main_trig':notify_on_main_trig, 'trigger_length':trigger_length, 'clock_source':clock_source, 'run_enable':run_enable, 'current_address':current_ram_address}
 
+def decode_devicestates(messages):
+    ''' Decodes a stream of concatenated devicestate messages, each including its 1 byte message identifier: 103,
+    all in one pass. The format of each message is as for decode_devicestate. Returns a structured array with
+    dtype devicestate_dtype, each row of which has the same values as the dictionary decode_devicestate returns
+    for that message.
+    '''
+    message_length = msgin_decodeinfo[msgin_identifier['devicestate']]['message_length']
+    if len(messages) % message_length:
+        raise ValueError('Device state stream of {} bytes is not a whole number of {} byte messages.'.format(len(messages), message_length))
+    raw = np.frombuffer(messages, dtype=devicestate_message_dtype)
+    if np.any(raw['identifier'] != msgin_identifier['devicestate']):
+        raise ValueError('Device state stream contains a message that is not a device state.')
+    tags = raw['tags']
+    decoded = np.zeros(len(raw), dtype=devicestate_dtype)
+    decoded['state'] =                  np.unpackbits(raw['state'], axis=1, bitorder='little')
+    decoded['final_ram_address'] =      raw['final_ram_address']
+    decoded['trigger_time'] =           np.pad(raw['trigger_time'], ((0, 0), (0, 1))).view('<u8')[:, 0]
+    decoded['trigger_length'] =         raw['trigger_length']
+    decoded['run_mode'] =               decode_lookup_array('run_mode')[(tags >> 0) & 0b1]
+    decoded['trigger_mode'] =           decode_lookup_array('trigger_mode')[(tags >> 1) & 0b11]
+    decoded['notify_on_main_trig'] =    decode_lookup_array('notify_on_main_trig')[(tags >> 3) & 0b1]
+    decoded['clock_source'] =           decode_lookup_array('clock_source')[(tags >> 4) & 0b1]
+    decoded['run_enable'] =             decode_lookup_array('run_enable')[(tags >> 5) & 0b1]
+    decoded['current_address'] =        raw['current_ram_address']
+    return decoded
+
+def decode_lookup_array(name):
+    ''' Returns the values of decode_lookup[name] as an array indexed by tag, for decoding tags in bulk.'''
+    lookup = decode_lookup[name]
+    return np.array([lookup[tag] for tag in range(len(lookup))])
+
 def decode_powerlinestate(message):
     ''' Messagein identifier:  1 byte: 105
     Message format:                             BITS USED   FPGA INDEX.
@@ -240,6 +271,27 @@ def encode_instruction(address=0, state=0, duration=1, goto_address=0, goto_coun
     tags =                  struct.pack('<Q', tags)[:1]
     return message_identifier + address + state + duration + goto_address + goto_counter + tags
 
+def encode_instructions(instructions):
+    ''' Encodes a whole table of instructions at once, as if each were passed to encode_instruction and the
+    results concatenated. "instructions" is a structured array with the fields of instruction_dtype, one row
+    per instruction, with the output state of each as an int (LSB=output 0). Returns the 19 bytes per
+    instruction (the 1 byte message identifier: 151, and the 18 byte message) to be written to the device.
+    '''
+    messages = np.zeros(len(instructions), dtype=instruction_message_dtype)
+    messages['identifier'] =    msgout_identifier['load_ram']
+    messages['address'] =       instructions['address']
+    messages['state'] =         np.asarray(instructions['state'], dtype='<u8').reshape(-1, 1).view(np.uint8)[:, :3]
+    messages['duration'] =      np.asarray(instructions['duration'], dtype='<u8').reshape(-1, 1).view(np.uint8)[:, :6]
+    messages['goto_address'] =  instructions['goto_address']
+    messages['goto_counter'] =  instructions['goto_counter']
+    messages['tags'] = (
+        (instructions['stop_and_wait'].astype(np.uint8) << 0)
+        | (instructions['hardware_trig_out'].astype(np.uint8) << 1)
+        | (instructions['notify_computer'].astype(np.uint8) << 2)
+        | (instructions['powerline_sync'].astype(np.uint8) << 3)
+    )
+    return messages.tobytes()
+
 def state_multiformat_to_int(state):
     if isinstance(state, (list, tuple, np.ndarray)):
         state_int = 0
@@ -250,6 +302,53 @@ def state_multiformat_to_int(state):
 
 #########################################################
 # constants
+# Table of instructions for encode_instructions, and the packed format of the messages it produces:
+instruction_dtype = np.dtype([
+    ('address', np.uint16),
+    ('state', np.uint32),
+    ('duration', np.uint64),
+    ('goto_address', np.uint16),
+    ('goto_counter', np.uint32),
+    ('stop_and_wait', bool),
+    ('hardware_trig_out', bool),
+    ('notify_computer', bool),
+    ('powerline_sync', bool)
+    ])
+
+instruction_message_dtype = np.dtype([
+    ('identifier', np.uint8),
+    ('address', '<u2'),
+    ('state', np.uint8, 3),
+    ('duration', np.uint8, 6),
+    ('goto_address', '<u2'),
+    ('goto_counter', '<u4'),
+    ('tags', np.uint8)
+    ])
+
+# Packed format of devicestate messages, and the table decode_devicestates decodes them to:
+devicestate_message_dtype = np.dtype([
+    ('identifier', np.uint8),
+    ('state', np.uint8, 3),
+    ('final_ram_address', '<u2'),
+    ('trigger_time', np.uint8, 7),
+    ('trigger_length', np.uint8),
+    ('tags', np.uint8),
+    ('current_ram_address', '<u2')
+    ])
+
+devicestate_dtype = np.dtype([
+    ('state', np.uint8, 24),
+    ('final_ram_address', np.uint16),
+    ('trigger_time', np.uint64),
+    ('trigger_length', np.uint8),
+    ('run_mode', 'U10'),
+    ('trigger_mode', 'U8'),
+    ('notify_on_main_trig', bool),
+    ('clock_source', 'U8'),
+    ('run_enable', bool),
+    ('current_address', np.uint16)
+    ])
+
 msgin_decodeinfo = {
     100:{'message_length':3, 'decode_function':decode_internal_error},
     101:{'message_length':9, 'decode_function':decode_serialecho},
@@ -12,6 +12,7 @@
 #####################################################################
 
 from labscript_devices import runviewer_parser, BLACS_tab
+from labscript_devices.serial_pipelining import send_commands
 
 from labscript import IntermediateDevice, DDS, StaticDDS, Device, config, LabscriptError, set_passed_properties
 from labscript_utils.unitconversions import NovaTechDDS9mFreqConversion, NovaTechDDS9mAmpConversion
@@ -304,7 +305,8 @@ class NovatechDDS9mWorker(Worker):
         global serial; import serial
         global socket; import socket
         global h5py; import labscript_utils.h5_lock, h5py
-        self.smart_cache = {'STATIC_DATA': None, 'TABLE_DATA': ''}
+        # MANUAL_COMMANDS is the last command sent to set each (channel, subchannel):
+        self.smart_cache = {'STATIC_DATA': None, 'TABLE_DATA': '', 'MANUAL_COMMANDS': {}}
         
         if self.default_baud_rate is not None:
             initial_baud_rate = self.default_baud_rate
@@ -410,8 +412,8 @@ class NovatechDDS9mWorker(Worker):
         return results
         
     def program_manual(self,front_panel_values):
-        # TODO: Optimise this so that only items that have changed are reprogrammed by storing the last programmed values
-        # For each DDS channel,
+        # Only values that have changed since they were last programmed are sent to
+        # the device, see program_static. For each DDS channel,
         for i in range(4):    
             # and for each subchnl in the DDS,
             for subchnl in ['freq','amp','phase']:     
@@ -428,14 +430,22 @@ class NovatechDDS9mWorker(Worker):
             command = b'P%d %u\r\n'%(channel,value*16384/360)
         else:
             raise TypeError(type)
+        # Skip the command if it is the same as the last one sent for this subchannel:
+        if self.smart_cache['MANUAL_COMMANDS'].get((channel, type)) == command:
+            return
         self.connection.write(command)
         if self.connection.readline() != b"OK\r\n":
             raise Exception('Error: Failed to execute command: %s' % command.decode('utf8'))
+        self.smart_cache['MANUAL_COMMANDS'][channel, type] = command
         # Now that a static update has been done, we'd better invalidate the saved STATIC_DATA:
         self.smart_cache['STATIC_DATA'] = None
      
     def transition_to_buffered(self,device_name,h5file,initial_values,fresh):
 
+        # The outputs are about to be set by other means than program_static, so
+        # forget what it last set them to:
+        self.smart_cache['MANUAL_COMMANDS'] = {}
+
         # The "double clutch" trick: switching to table mode and back again, before
         # going into table mode for real, is observed empirically to resolve an
         # off-by-one error in table mode in some circumstances. Presumably it resets the
@@ -471,18 +481,14 @@ class NovatechDDS9mWorker(Worker):
             if fresh or data != self.smart_cache['STATIC_DATA']:
                 self.logger.debug('Static data has changed, reprogramming.')
                 self.smart_cache['STATIC_DATA'] = data
-                self.connection.write(b'F2 %.7f\r\n'%(data['freq2']/10.0**7))
-                self.connection.readline()
-                self.connection.write(b'V2 %u\r\n'%(data['amp2']))
-                self.connection.readline()
-                self.connection.write(b'P2 %u\r\n'%(data['phase2']))
-                self.connection.readline()
-                self.connection.write(b'F3 %.7f\r\n'%(data['freq3']/10.0**7))
-                self.connection.readline()
-                self.connection.write(b'V3 %u\r\n'%data['amp3'])
-                self.connection.readline()
-                self.connection.write(b'P3 %u\r\n'%data['phase3'])
-                self.connection.readline()
+                send_commands(self.connection, [
+                    b'F2 %.7f\r\n'%(data['freq2']/10.0**7),
+                    b'V2 %u\r\n'%(data['amp2']),
+                    b'P2 %u\r\n'%(data['phase2']),
+                    b'F3 %.7f\r\n'%(data['freq3']/10.0**7),
+                    b'V3 %u\r\n'%data['amp3'],
+                    b'P3 %u\r\n'%data['phase3'],
+                ], b'OK\r\n', 'NovaTech DDS9m')
                 
                 # Save these values into final_values so the GUI can
                 # be updated at the end of the run to reflect them:
@@ -498,19 +504,32 @@ class NovatechDDS9mWorker(Worker):
         # Now program the buffered outputs:
         if table_data is not None:
             data = table_data
-            for i, line in enumerate(data):
-                st = time.time()
-                oldtable = self.smart_cache['TABLE_DATA']
+            st = time.time()
+            oldtable = self.smart_cache['TABLE_DATA']
+            # Until programming succeeds, we don't know what is in the device's table:
+            self.smart_cache['TABLE_DATA'] = ''
+            # Which lines of the table differ from the old table, for each DDS:
+            changed = np.ones((len(data), 2), dtype=bool)
+            n_compare = 0 if fresh else min(len(oldtable), len(data))
+            if n_compare:
                 for ddsno in range(2):
-                    if fresh or i >= len(oldtable) or (line['freq%d'%ddsno],line['phase%d'%ddsno],line['amp%d'%ddsno]) != (oldtable[i]['freq%d'%ddsno],oldtable[i]['phase%d'%ddsno],oldtable[i]['amp%d'%ddsno]):
-                        self.connection.write(b't%d %04x %08x,%04x,%04x,ff\r\n'%(ddsno, i,line['freq%d'%ddsno],line['phase%d'%ddsno],line['amp%d'%ddsno]))
-                        self.connection.readline()
-                et = time.time()
-                tt=et-st
-                self.logger.debug('Time spent on line %s: %s'%(i,tt))
+                    changed[:n_compare, ddsno] = False
+                    for name in ['freq%d'%ddsno, 'phase%d'%ddsno, 'amp%d'%ddsno]:
+                        changed[:n_compare, ddsno] |= (
+                            data[name][:n_compare] != oldtable[name][:n_compare]
+                        )
+            commands = []
+            for i, ddsno in zip(*np.nonzero(changed)):
+                line = data[i]
+                commands.append(b't%d %04x %08x,%04x,%04x,ff\r\n'%(ddsno, i,line['freq%d'%ddsno],line['phase%d'%ddsno],line['amp%d'%ddsno]))
+            send_commands(self.connection, commands, b'OK\r\n', 'NovaTech DDS9m')
+            et = time.time()
+            tt=et-st
+            self.logger.debug('Time spent programming %d table entries: %s'%(len(commands),tt))
             # Store the table for future smart programming comparisons:
             try:
-                self.smart_cache['TABLE_DATA'][:len(data)] = data
+                oldtable[:len(data)] = data
+                self.smart_cache['TABLE_DATA'] = oldtable
                 self.logger.debug('Stored new table as subset of old table')
             except: # new table is longer than old table
                 self.smart_cache['TABLE_DATA'] = data
@@ -107,6 +107,7 @@ from blacs.tab_base_classes import MODE_MANUAL, MODE_TRANSITION_TO_BUFFERED, MOD
 from blacs.device_base_class import DeviceTab
 from qtutils import UiLoader
 import os
+import time
 
 @BLACS_tab
 class PhaseMatrixQuickSynTab(DeviceTab):
@@ -199,67 +200,75 @@ class PhaseMatrixQuickSynTab(DeviceTab):
 
 
 class QuickSynWorker(Worker):
+    # The device ignores commands sent whilst it is still processing the previous one.
+    # A query has been processed once its response arrives, after which we wait only
+    # response_interval before sending the next command. Other commands get no
+    # response, so after them we wait command_interval, long enough for the device to
+    # have processed them:
+    command_interval = 0.05
+    response_interval = 0.002
+
     def init(self):
         global serial; import serial
         global h5py; import labscript_utils.h5_lock, h5py
-        global time; import time
     
         baud_rate=115200
         port = self.address
         self.connection = serial.Serial(port, baudrate = baud_rate, timeout=0.1)
         self.connection.readlines()
+        # The time after which the device is ready for the next command:
+        self.ready_time = 0
         
         #check to see if the reference is set to external. If not, make it so! (should we ask the user about this?)
-        self.connection.write(b'ROSC:SOUR?\r')
-        response = self.connection.readline().decode('utf8')
+        response, = self.query('ROSC:SOUR?')
         if response == 'INT\n':
             #ref was set to internal, let's change it to ext
-            self.connection.write(b'ROSC:SOUR EXT\r')
-    
-    def check_remote_values(self):
-        # Get the currently output values:
-
-        results = {'dds 0':{}}
-        line = ''
-        count = 0
+            self.send('ROSC:SOUR EXT')
 
+    def wait_until_ready(self):
+        delay = self.ready_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
 
-        self.connection.write(b'FREQ?\r')
-        line = self.connection.readline().decode('utf8')
+    def send(self, command):
+        """Send a command that gets no response"""
+        self.wait_until_ready()
+        self.connection.write(command.encode('utf8') + b'\r')
+        self.ready_time = time.perf_counter() + self.command_interval
 
-        if line == '':
-            #try again
+    def query(self, *commands):
+        """Send each query as soon as the device has responded to the previous one, and
+        return the list of responses"""
+        responses = []
+        for command in commands:
+            self.wait_until_ready()
+            self.connection.write(command.encode('utf8') + b'\r')
             line = self.connection.readline().decode('utf8')
             if line == '':
-                raise Exception("Device didn't say what its frequncy was :(")
+                #try again
+                line = self.connection.readline().decode('utf8')
+                if line == '':
+                    raise Exception("Device didn't respond to %s :(" % command)
+            self.ready_time = time.perf_counter() + self.response_interval
+            responses.append(line)
+        return responses
+    
+    def check_remote_values(self):
+        # Get the currently output values:
+        results = {'dds 0':{}}
+        freq, gate = self.query('FREQ?', 'OUTP:STAT?')
             
         # Convert mHz to Hz:
-        results['dds 0']['freq'] = float(line)/1000
-
-        # wait a little while first, it doesn't like being asked things too quickly!
-        time.sleep(0.05)
-        self.connection.write(b'OUTP:STAT?\r')
-        line = self.connection.readline().decode('utf8')
-        if line == '':
-            raise Exception("Device didn't say what its status was :(")
-        time.sleep(0.05)    
-            
+        results['dds 0']['freq'] = float(freq)/1000
 
         #get the gate status
-        results['dds 0']['gate'] = 0 if line == 'OFF\n' else 1
-
+        results['dds 0']['gate'] = 0 if gate == 'OFF\n' else 1
 
         return results
     
     def check_status(self):
         results = {}
-        line = ''
-        self.connection.write(b'STAT?\r')
-        line = self.connection.readline().decode('utf8')
-        if line == '':
-            raise Exception("Device didn't say what its status was :(")
-        time.sleep(0.05)    
-            
+        line, temperature = self.query('STAT?', 'DIAG:MEAS? 21')
         
         #get the status and convert to binary, and take off the '0b' header:
         status = bin(int(line,16))[2:]
@@ -289,8 +298,7 @@ class QuickSynWorker(Worker):
         results['lock_recovery'] = int(status[-8])
         
         # now let's check it's temperature!
-        self.connection.write(b'DIAG:MEAS? 21\r')
-        results['temperature'] = float(self.connection.readline().decode('utf8'))
+        results['temperature'] = float(temperature)
         
         # check if the temperature is bad, if it is, raise an exception. Hopefully one day this will be sent to syslog,
         #at which point we'll add some extra magic to segregate into warning and critical temperatures.
@@ -305,16 +313,10 @@ class QuickSynWorker(Worker):
         freq = front_panel_values['dds 0']['freq']
         #program in millihertz:
         freq*=1e3
-        command = 'FREQ %i\r'%freq
-        self.connection.write(command.encode('utf8'))
-        
-        # add some sleep time here since the phasematrix gets grumpy
-        time.sleep(0.05)
-        
+        self.send('FREQ %i'%freq)
         
         gate = front_panel_values['dds 0']['gate']
-        command = 'OUTP:STAT %i\r'%gate
-        self.connection.write(command.encode('utf8'))
+        self.send('OUTP:STAT %i'%gate)
         
         return self.check_remote_values()
         
@@ -339,9 +341,8 @@ class QuickSynWorker(Worker):
             if 'STATIC_DATA' in group:
                 data = group['STATIC_DATA'][:][0]
                 
-        self.connection.write(b'FREQ %i\r'%(data['freq0']))
-        time.sleep(0.05)
-        self.connection.write(b'OUTP:STAT 1')#%i'%(data['gate0']))
+        self.send('FREQ %i'%(data['freq0']))
+        self.send('OUTP:STAT 1')#%i'%(data['gate0']))
         
         
         # Save these values into final_values so the GUI can
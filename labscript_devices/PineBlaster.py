@@ -13,6 +13,8 @@
 
 from labscript import PseudoclockDevice, Pseudoclock, ClockLine, config, LabscriptError, set_passed_properties
 from labscript_devices import runviewer_parser, BLACS_tab
+from labscript_devices.clock_traces import clock_trace, max_points_for, reduce_instructions
+from labscript_devices.serial_pipelining import send_commands
 
 import numpy as np
 import labscript_utils.h5_lock, h5py
@@ -81,32 +83,10 @@ class PineBlaster(PseudoclockDevice):
         PseudoclockDevice.generate_code(self, hdf5_file)
         group = hdf5_file['devices'].create_group(self.name)   
         
-        # compress clock instructions with the same period: This will
-        # halve the number of instructions roughly, since the PineBlaster
-        # does not have a 'slow clock':
-        reduced_instructions = []
-        for instruction in self.pseudoclock.clock:
-            if instruction == 'WAIT':
-                # The following period and reps indicates a wait instruction
-                reduced_instructions.append({'period': 0, 'reps': 1})
-                continue
-            reps = instruction['reps']
-            # period is in quantised units:
-            period = int(round(instruction['step']/self.clock_resolution))
-            if reduced_instructions and reduced_instructions[-1]['period'] == period:
-                reduced_instructions[-1]['reps'] += reps
-            else:
-                reduced_instructions.append({'period': period, 'reps': reps})
-        # The following period and reps indicates a stop instruction:
-        reduced_instructions.append({'period': 0, 'reps': 0})
-        if len(reduced_instructions) > self.max_instructions:
-            raise LabscriptError("%s %s has too many instructions. It has %d and can only support %d"%(self.description, self.name, len(reduced_instructions), self.max_instructions))
+        pulse_program = reduce_instructions(self.pseudoclock.clock, self.clock_resolution)
+        if len(pulse_program) > self.max_instructions:
+            raise LabscriptError("%s %s has too many instructions. It has %d and can only support %d"%(self.description, self.name, len(pulse_program), self.max_instructions))
         # Store these instructions to the h5 file:
-        dtypes = [('period',int),('reps',int)]
-        pulse_program = np.zeros(len(reduced_instructions),dtype=dtypes)
-        for i, instruction in enumerate(reduced_instructions):
-            pulse_program[i]['period'] = instruction['period']
-            pulse_program[i]['reps'] = instruction['reps']
         group.create_dataset('PULSE_PROGRAM', compression = config.compression, data=pulse_program)
         # TODO: is this needed, the PulseBlasters don't save it... 
         self.set_property('is_master_pseudoclock', self.is_master_pseudoclock, location='device_properties')
@@ -126,6 +106,9 @@ class RunviewerClass(object):
         self.path = path
         self.name = device.name
         self.device = device
+        # If not None, the maximum number of points in the clock trace, of which only
+        # every nth tick is then included:
+        self.max_points = max_points_for(device)
         
             
     def get_traces(self, add_trace, clock=None):
@@ -144,31 +127,30 @@ class RunviewerClass(object):
         with h5py.File(self.path, 'r') as f:
             pulse_program = f['devices/%s/PULSE_PROGRAM'%self.name][:]
             
-        time = []
-        states = []
         trigger_index = 0
         t = 0 if clock is None else clock_ticks[trigger_index]+self.trigger_delay
         trigger_index += 1
         
-        clock_factor = self.clock_resolution/2.
-        
-        for row in pulse_program:
-            if row['period'] == 0:
+        # Get the start time of each instruction:
+        start_times = np.zeros(len(pulse_program))
+        periods = pulse_program['period']*self.clock_resolution
+        rows = zip(periods.tolist(), pulse_program['reps'].tolist())
+        for i, (period, reps) in enumerate(rows):
+            start_times[i] = t
+            if period == 0:
                 #special case
-                if row['reps'] == 1: # WAIT
+                if reps == 1: # WAIT
                     if clock is not None:
                         t = clock_ticks[trigger_index]+self.trigger_delay
                         trigger_index += 1
                     else:
                         t += self.wait_delay
             else:    
-                for i in range(row['reps']):
-                    for j in range(1, -1, -1):
-                        time.append(t)
-                        states.append(j)
-                        t += row['period']*clock_factor
+                t += reps*period
         
-        clock = (np.array(time), np.array(states))
+        # Waits and the stop instruction produce no clock ticks:
+        reps = np.where(periods == 0, 0, pulse_program['reps'])
+        clock = clock_trace(start_times, periods/2, periods/2, reps, max_points=self.max_points)
         
         clocklines_and_triggers = {}
         for pseudoclock_name, pseudoclock in self.device.child_list.items():
@@ -183,6 +165,7 @@ from blacs.tab_base_classes import Worker, define_state
 from blacs.tab_base_classes import MODE_MANUAL, MODE_TRANSITION_TO_BUFFERED, MODE_TRANSITION_TO_MANUAL, MODE_BUFFERED  
 
 from blacs.device_base_class import DeviceTab
+import time
 
 @BLACS_tab
 class PineblasterTab(DeviceTab):
@@ -235,21 +218,65 @@ class PineblasterTab(DeviceTab):
 
 
 class PineblasterWorker(Worker):
+    # Longest time the device may take to start up or restart:
+    startup_timeout = 10
+    # The device ignores commands until it has started up, so we greet it repeatedly
+    # until it says hello back. We wait greeting_interval for a reply to the first
+    # greeting, and twice as long after each subsequent one, up to
+    # max_greeting_interval, so that we notice promptly once it is up without writing
+    # to it continually whilst it restarts:
+    greeting_interval = 0.05
+    max_greeting_interval = 0.25
+
     def init(self):
         global h5py; import labscript_utils.h5_lock, h5py
         global serial; import serial
-        global time; import time
-        self.smart_cache = []
+        # The pulse program last programmed, or None if unknown:
+        self.smart_cache = None
     
         self.pineblaster = serial.Serial(self.usbport, 115200, timeout=1)
         # Device has a finite startup time:
-        time.sleep(5)
-        self.pineblaster.write(b'hello\r\n')
-        response = self.pineblaster.readline().decode()
-        
-        if response == 'hello\r\n':
-            return
-        elif response:
+        self.wait_until_ready()
+
+    def wait_until_ready(self):
+        """Greet the device until it says hello back, which it does once it has started
+        up, ignoring anything else it says in the meantime. The interval between
+        greetings starts at greeting_interval and doubles up to max_greeting_interval.
+        Raise an exception if it does not say hello within startup_timeout."""
+        deadline = time.monotonic() + self.startup_timeout
+        interval = self.greeting_interval
+        response = ''
+        timeout = self.pineblaster.timeout
+        try:
+            while time.monotonic() < deadline:
+                self.pineblaster.timeout = interval
+                try:
+                    self.pineblaster.write(b'hello\r\n')
+                    # Read everything the device says until the interval elapses with
+                    # no reply, before greeting it again:
+                    line = self.pineblaster.readline().decode()
+                    while line:
+                        if line == 'hello\r\n':
+                            # Discard replies to any earlier greetings still in transit,
+                            # so they are not mistaken for responses to later commands:
+                            self.pineblaster.timeout = self.greeting_interval
+                            while self.pineblaster.readline():
+                                pass
+                            return
+                        response = line
+                        line = self.pineblaster.readline().decode()
+                except serial.SerialException:
+                    # The USB connection may drop whilst the device restarts. Reconnect:
+                    self.pineblaster.close()
+                    time.sleep(interval)
+                    try:
+                        self.pineblaster.open()
+                    except serial.SerialException:
+                        pass
+                interval = min(2 * interval, self.max_greeting_interval)
+        finally:
+            self.pineblaster.timeout = timeout
+        if response:
             raise Exception('PineBlaster is confused: saying %s instead of hello'%(repr(response)))
         else:
             raise Exception('PineBlaster is not saying hello back when greeted politely. How rude. Maybe it needs a reboot.')
@@ -267,7 +294,7 @@ class PineblasterWorker(Worker):
         
     def transition_to_buffered(self, device_name, h5file, initial_values, fresh):
         if fresh:
-            self.smart_cache = []
+            self.smart_cache = None
         self.program_manual({'internal':0})
         
         with h5py.File(h5file,'r') as hdf5_file:
@@ -276,17 +303,27 @@ class PineblasterWorker(Worker):
             device_properties = labscript_utils.properties.get(hdf5_file, device_name, 'device_properties')
             self.is_master_pseudoclock = device_properties['is_master_pseudoclock']
             
-        for i, instruction in enumerate(pulse_program):
-            if i == len(self.smart_cache):
-                # Pad the smart cache out to be as long as the program:
-                self.smart_cache.append(None)
-                
-            # Only program instructions that differ from what's in the smart cache:
-            if self.smart_cache[i] != instruction:
-                self.pineblaster.write(b'set %d %d %d\r\n'%(i, instruction['period'], instruction['reps']))
-                response = self.pineblaster.readline().decode()
-                assert response == 'ok\r\n', 'PineBlaster said \'%s\', expected \'ok\''%repr(response)
-                self.smart_cache[i] = instruction
+        # Only program instructions that differ from what's in the smart cache:
+        cache = self.smart_cache
+        if cache is None or cache.dtype != pulse_program.dtype:
+            cache = pulse_program[:0]
+        n_cached = min(len(cache), len(pulse_program))
+        changed = np.ones(len(pulse_program), dtype=bool)
+        changed[:n_cached] = cache[:n_cached] != pulse_program[:n_cached]
+        indices = np.nonzero(changed)[0]
+        commands = [
+            b'set %d %d %d\r\n' % (i, period, reps)
+            for i, period, reps in zip(
+                indices.tolist(),
+                pulse_program['period'][indices].tolist(),
+                pulse_program['reps'][indices].tolist(),
+            )
+        ]
+        # The device's program is unknown if programming fails partway through:
+        self.smart_cache = None
+        send_commands(self.pineblaster, commands, b'ok\r\n', 'PineBlaster')
+        # Instructions beyond the end of this program remain programmed:
+        self.smart_cache = np.concatenate([pulse_program, cache[len(pulse_program):]])
                 
         if not self.is_master_pseudoclock:
             # Get ready for a hardware trigger:
@@ -328,8 +365,8 @@ class PineblasterWorker(Worker):
     
     def abort(self):
         self.pineblaster.write(b'restart\r\n')
-        time.sleep(5)
-        self.shutdown()
-        self.init()
+        # Restarting clears the device's program:
+        self.smart_cache = None
+        self.wait_until_ready()
         return True
 
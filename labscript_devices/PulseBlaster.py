@@ -111,6 +111,13 @@ class PulseBlaster(PseudoclockDevice):
                        'BRANCH':     6,
                        'LONG_DELAY': 7,
                        'WAIT':       8}
+
+    pb_dtype = [('freq0', np.int32), ('phase0', np.int32), ('amp0', np.int32), 
+                ('dds_en0', np.int32), ('phase_reset0', np.int32),
+                ('freq1', np.int32), ('phase1', np.int32), ('amp1', np.int32),
+                ('dds_en1', np.int32), ('phase_reset1', np.int32),
+                ('flags', np.int32), ('inst', np.int32),
+                ('inst_data', np.int32), ('length', np.float64)]
                        
     description = 'PB-DDSII-300'
     clock_limit = 8.3e6 # Slight underestimate I think.
@@ -322,9 +329,13 @@ class PulseBlaster(PseudoclockDevice):
         return dig_outputs, dds_outputs
 
     def generate_registers(self, hdf5_file, dds_outputs):
-        ampdicts = {}
-        phasedicts = {}
-        freqdicts = {}
+        """Write the frequency, amplitude and phase register tables of each DDS to
+        the hdf5 file, and return dicts, keyed by DDS number, of the register of
+        each value of its frequency, amplitude and phase outputs.
+
+        Each table holds the distinct values of its output over the whole shot in
+        ascending order, found along with the registers with a single np.unique."""
+        registers = {'freq': {}, 'amp': {}, 'phase': {}}
         group = hdf5_file['/devices/'+self.name]
         dds_dict = {}
         for output in dds_outputs:
@@ -336,13 +347,13 @@ class PulseBlaster(PseudoclockDevice):
                 output = dds_dict[num]
             
                 # Ensure that amplitudes are within bounds:
-                if any(output.amplitude.raw_output > 1)  or any(output.amplitude.raw_output < 0):
+                if np.any(output.amplitude.raw_output > 1) or np.any(output.amplitude.raw_output < 0):
                     raise LabscriptError('%s %s '%(output.amplitude.description, output.amplitude.name) +
                                       'can only have values between 0 and 1, ' + 
                                       'the limit imposed by %s.'%output.name)
                                       
                 # Ensure that frequencies are within bounds:
-                if any(output.frequency.raw_output > 150e6 )  or any(output.frequency.raw_output < 0):
+                if np.any(output.frequency.raw_output > 150e6) or np.any(output.frequency.raw_output < 0):
                     raise LabscriptError('%s %s '%(output.frequency.description, output.frequency.name) +
                                       'can only have values between 0Hz and and 150MHz, ' + 
                                       'the limit imposed by %s.'%output.name)
@@ -350,219 +361,197 @@ class PulseBlaster(PseudoclockDevice):
                 # Ensure that phase wraps around:
                 output.phase.raw_output %= 360
                 
-                amps = set(output.amplitude.raw_output)
-                phases = set(output.phase.raw_output)
-                freqs = set(output.frequency.raw_output)
+                values = {
+                    'freq': output.frequency.raw_output,
+                    'amp': output.amplitude.raw_output,
+                    'phase': output.phase.raw_output,
+                }
             else:
                 # If the DDS is unused, it will use the following values
                 # for the whole experimental run:
-                amps = set([0])
-                phases = set([0])
-                freqs = set([0])
-                                  
-            if len(amps) > 1024:
-                raise LabscriptError('%s dds%d can only support 1024 amplitude registers, and %s have been requested.'%(self.name, num, str(len(amps))))
-            if len(phases) > 128:
-                raise LabscriptError('%s dds%d can only support 128 phase registers, and %s have been requested.'%(self.name, num, str(len(phases))))
-            if len(freqs) > 1024:
-                raise LabscriptError('%s dds%d can only support 1024 frequency registers, and %s have been requested.'%(self.name, num, str(len(freqs))))
-                                
-            # start counting at 1 to leave room for the dummy instruction,
-            # which BLACS will fill in with the state of the front
-            # panel:
-            ampregs = range(1,len(amps)+1)
-            freqregs = range(1,len(freqs)+1)
-            phaseregs = range(1,len(phases)+1)
+                values = {'freq': [0], 'amp': [0], 'phase': [0]}
             
-            ampdicts[num] = dict(zip(amps,ampregs))
-            freqdicts[num] = dict(zip(freqs,freqregs))
-            phasedicts[num] = dict(zip(phases,phaseregs))
+            tables = {}
+            for quantity, raw_output in values.items():
+                tables[quantity], inverse = np.unique(np.asarray(raw_output, dtype=np.float64), return_inverse=True)
+                # start counting at 1 to leave room for the dummy instruction,
+                # which BLACS will fill in with the state of the front
+                # panel:
+                registers[quantity][num] = inverse.reshape(-1).astype(np.int32) + 1
+                                  
+            for quantity, description, limit in [('amp', 'amplitude', 1024), ('phase', 'phase', 128), ('freq', 'frequency', 1024)]:
+                if len(tables[quantity]) > limit:
+                    raise LabscriptError('%s dds%d can only support %d %s registers, and %d have been requested.'%(self.name, num, limit, description, len(tables[quantity])))
             
             # The zeros are the dummy instructions:
-            freq_table = np.array([0] + list(freqs), dtype = np.float64) / 1e6 # convert to MHz
-            amp_table = np.array([0] + list(amps), dtype = np.float32)
-            phase_table = np.array([0] + list(phases), dtype = np.float64)
+            freq_table = np.concatenate([[0], tables['freq']]) / 1e6 # convert to MHz
+            amp_table = np.concatenate([[0], tables['amp']]).astype(np.float32)
+            phase_table = np.concatenate([[0], tables['phase']])
             
             subgroup = group.create_group('DDS%d'%num)
             subgroup.create_dataset('FREQ_REGS', compression=config.compression, data = freq_table)
             subgroup.create_dataset('AMP_REGS', compression=config.compression, data = amp_table)
             subgroup.create_dataset('PHASE_REGS', compression=config.compression, data = phase_table)
             
-        return freqdicts, ampdicts, phasedicts
+        return registers['freq'], registers['amp'], registers['phase']
         
     def convert_to_pb_inst(self, dig_outputs, dds_outputs, freqs, amps, phases):
-        pb_inst = []
-        
-        # index to keep track of where in output.raw_output the
-        # pulseblaster flags are coming from
-        # starts at -1 because the internal flag should always tick on the first instruction and be 
-        # incremented (to 0) before it is used to index any arrays
-        i = -1 
-        # index to record what line number of the pulseblaster hardware
-        # instructions we're up to:
-        j = 0
-        # We've delegated the initial two instructions off to BLACS, which
-        # can ensure continuity with the state of the front panel. Thus
-        # these two instructions don't actually do anything:
-        flags = [0]*self.n_flags
-        freqregs = [0]*2
-        ampregs = [0]*2
-        phaseregs = [0]*2
-        dds_enables = [0]*2
-        phase_resets = [0]*2
-        
-        pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets': phase_resets,
-                        'flags': ''.join([str(flag) for flag in flags]), 'instruction': 'STOP',
-                        'data': 0, 'delay': 10.0/self.clock_limit*1e9})
-        pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets': phase_resets,
-                        'flags': ''.join([str(flag) for flag in flags]), 'instruction': 'STOP',
-                        'data': 0, 'delay': 10.0/self.clock_limit*1e9})    
-        j += 2
-        
-        flagstring = '0'*self.n_flags # So that this variable is still defined if the for loop has no iterations
-        for k, instruction in enumerate(self.pseudoclock.clock):
-            if instruction == 'WAIT':
-                # This is a wait instruction. Repeat the last instruction but with a 100ns delay and a WAIT op code:
-                wait_instruction = pb_inst[-1].copy()
-                wait_instruction['delay'] = 100
-                wait_instruction['instruction'] = 'WAIT'
-                wait_instruction['data'] = 0
-                pb_inst.append(wait_instruction)
-                j += 1
-                continue
-                
-            flags = [0]*self.n_flags
-            # The registers below are ones, not zeros, so that we don't
-            # use the BLACS-inserted initial instructions. Instead
-            # unused DDSs have a 'zero' in register one for freq, amp
-            # and phase.
-            freqregs = [1]*2
-            ampregs = [1]*2
-            phaseregs = [1]*2
-            dds_enables = [0]*2
-            phase_resets = [0]*2
-            
-            # This flag indicates whether we need a full clock tick, or are just updating an internal output
-            only_internal = True
-            # find out which clock flags are ticking during this instruction
-            for clock_line in instruction['enabled_clocks']:
-                if clock_line == self._direct_output_clock_line: 
-                    # advance i (the index keeping track of internal clockline output)
-                    i += 1
-                else:
-                    flag_index = int(clock_line.connection.split()[1])
-                    flags[flag_index] = 1
-                    # We are not just using the internal clock line
-                    only_internal = False
-            
-            for output in dig_outputs:
-                flagindex = int(output.connection.split()[1])
-                flags[flagindex] = int(output.raw_output[i])
-            for output in dds_outputs:
-                ddsnumber = int(output.connection.split()[1])
-                freqregs[ddsnumber] = freqs[ddsnumber][output.frequency.raw_output[i]]
-                ampregs[ddsnumber] = amps[ddsnumber][output.amplitude.raw_output[i]]
-                phaseregs[ddsnumber] = phases[ddsnumber][output.phase.raw_output[i]]
-                dds_enables[ddsnumber] = output.gate.raw_output[i]
-                if isinstance(output, PulseBlasterDDS):
-                    phase_resets[ddsnumber] = output.phase_reset.raw_output[i]
-                
-            flagstring = ''.join([str(flag) for flag in flags])
-            
-            if instruction['reps'] > 1048576:
-                raise LabscriptError('Pulseblaster cannot support more than 1048576 loop iterations. ' +
-                                      str(instruction['reps']) +' were requested at t = ' + str(instruction['start']) + '. '+
-                                     'This can be fixed easily enough by using nested loops. If it is needed, ' +
-                                     'please file a feature request at' +
-                                     'http://redmine.physics.monash.edu.au/projects/labscript.')
-                
-            if not only_internal:
-                if self.pulse_width == 'symmetric':
-                    high_time = instruction['step']/2
-                else:
-                    high_time = self.pulse_width
-                # High time cannot be longer than self.long_delay (~57 seconds for a
-                # 75MHz core clock freq). If it is, clip it to self.long_delay. In this
-                # case we are not honouring the requested symmetric or fixed pulse
-                # width. To do so would be possible, but would consume more pulseblaster
-                # instructions, so we err on the side of fewer instructions:
-                high_time = min(high_time, self.long_delay)
+        """Convert the pseudoclock instructions into a structured array of
+        PulseBlaster instructions with dtype ``self.pb_dtype``.
+
+        Flags, DDS registers and delays are computed for all instructions at
+        once with numpy, rather than instruction-by-instruction."""
+        # Pull out everything we need from the pseudoclock instructions. WAITs are
+        # strings, all other instructions are dicts:
+        clock = self.pseudoclock.clock
+        is_wait = np.array([instruction == 'WAIT' for instruction in clock], dtype=bool)
+        instructions = [instruction for instruction in clock if instruction != 'WAIT']
+        n_inst = len(instructions)
+        steps = np.array([instruction['step'] for instruction in instructions], dtype=np.float64)
+        reps = np.array([instruction['reps'] for instruction in instructions], dtype=np.int64)
 
-                # Low time is whatever is left:
-                low_time = instruction['step'] - high_time
+        # Which clock flags tick during each instruction, and whether the internal
+        # clockline (the one the direct outputs are clocked by) ticks:
+        clock_mask = np.zeros(n_inst, dtype=np.int64)
+        internal_ticks = np.zeros(n_inst, dtype=bool)
+        for clock_line in self.pseudoclock.child_devices:
+            enabled = np.array(
+                [clock_line in instruction['enabled_clocks'] for instruction in instructions],
+                dtype=bool,
+            )
+            if clock_line == self._direct_output_clock_line:
+                internal_ticks |= enabled
+            else:
+                flag_index = int(clock_line.connection.split()[1])
+                clock_mask[enabled] |= 1 << flag_index
+        only_internal = clock_mask == 0
 
-                # Do we need to insert a LONG_DELAY instruction to create a delay this
-                # long?
-                n_long_delays, remaining_low_time =  divmod(low_time, self.long_delay)
+        # index into output.raw_output of the direct outputs for each instruction.
+        # Starts at -1 because the internal flag should always tick on the first
+        # instruction and be incremented (to 0) before it is used to index any arrays
+        i = np.cumsum(internal_ticks) - 1
 
-                # If the remainder is too short to be output, add self.long_delay to it.
-                # self.long_delay was constructed such that adding self.min_delay to it
-                # is still not too long for a single instruction:
-                if n_long_delays and remaining_low_time < self.min_delay:
-                    n_long_delays -= 1
-                    remaining_low_time += self.long_delay
+        # Flags whilst the clocks are high. Direct outputs take precedence over
+        # clock flags:
+        dig_mask = 0
+        dig_flags = np.zeros(n_inst, dtype=np.int64)
+        for output in dig_outputs:
+            flag_index = int(output.connection.split()[1])
+            dig_mask |= 1 << flag_index
+            dig_flags |= np.asarray(output.raw_output, dtype=np.int64)[i] << flag_index
+        high_flags = (clock_mask & ~dig_mask) | dig_flags
+        # And once the clock edges have gone low:
+        low_flags = high_flags & ~clock_mask
 
-                # The start loop instruction, Clock edges are high:
-                pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
-                                'flags': flagstring, 'instruction': 'LOOP',
-                                'data': instruction['reps'], 'delay': high_time*1e9})
-                
-                for clock_line in instruction['enabled_clocks']:
-                    if clock_line != self._direct_output_clock_line:
-                        flag_index = int(clock_line.connection.split()[1])
-                        flags[flag_index] = 0
-                        
-                flagstring = ''.join([str(flag) for flag in flags])
-            
-                # The long delay instruction, if any. Clock edges are low: 
-                if n_long_delays:
-                    pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
-                                'flags': flagstring, 'instruction': 'LONG_DELAY',
-                                'data': int(n_long_delays), 'delay': self.long_delay*1e9})
-                                
-                # Remaining low time. Clock edges are low:
-                pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
-                                'flags': flagstring, 'instruction': 'END_LOOP',
-                                'data': j, 'delay': remaining_low_time*1e9})
-                                
-                # Two instructions were used in the case of there being no LONG_DELAY, 
-                # otherwise three. This increment is done here so that the j referred
-                # to in the previous line still refers to the LOOP instruction.
-                j += 3 if n_long_delays else 2
-            else:
-                # We only need to update a direct output, so no need to tick the clocks.
+        # The registers below are ones, not zeros, so that we don't use the
+        # BLACS-inserted initial instructions. Instead unused DDSs have a 'zero' in
+        # register one for freq, amp and phase.
+        dds_fields = {}
+        for ddsnumber in range(2):
+            for field in ['freq', 'amp', 'phase']:
+                dds_fields['%s%d' % (field, ddsnumber)] = np.ones(n_inst, dtype=np.int32)
+            for field in ['dds_en', 'phase_reset']:
+                dds_fields['%s%d' % (field, ddsnumber)] = np.zeros(n_inst, dtype=np.int32)
+        for output in dds_outputs:
+            ddsnumber = int(output.connection.split()[1])
+            for field, registers in [('freq', freqs), ('amp', amps), ('phase', phases)]:
+                dds_fields['%s%d' % (field, ddsnumber)] = registers[ddsnumber][i]
+            dds_fields['dds_en%d' % ddsnumber] = np.asarray(output.gate.raw_output)[i]
+            if isinstance(output, PulseBlasterDDS):
+                dds_fields['phase_reset%d' % ddsnumber] = np.asarray(
+                    output.phase_reset.raw_output
+                )[i]
 
-                # Do we need to insert a LONG_DELAY instruction to create a delay this
-                # long?
-                n_long_delays, remaining_delay =  divmod(instruction['step'], self.long_delay)
-                # If the remainder is too short to be output, add self.long_delay to it.
-                # self.long_delay was constructed such that adding self.min_delay to it
-                # is still not too long for a single instruction:
-                if n_long_delays and remaining_delay < self.min_delay:
-                    n_long_delays -= 1
-                    remaining_delay += self.long_delay
-                
-                if n_long_delays:
-                    pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
-                                'flags': flagstring, 'instruction': 'LONG_DELAY',
-                                'data': int(n_long_delays), 'delay': self.long_delay*1e9})
+        if np.any(reps > 1048576):
+            k = np.argmax(reps > 1048576)
+            raise LabscriptError('Pulseblaster cannot support more than 1048576 loop iterations. ' +
+                                  str(instructions[k]['reps']) +' were requested at t = ' + str(instructions[k]['start']) + '. '+
+                                 'This can be fixed easily enough by using nested loops. If it is needed, ' +
+                                 'please file a feature request at' +
+                                 'http://redmine.physics.monash.edu.au/projects/labscript.')
 
-                pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
-                                'flags': flagstring, 'instruction': 'CONTINUE',
-                                'data': 0, 'delay': remaining_delay*1e9})
-                
-                j += 2 if n_long_delays else 1
-                
+        # Clock ticks: the high time cannot be longer than self.long_delay (~57
+        # seconds for a 75MHz core clock freq). If it is, clip it to self.long_delay.
+        # In this case we are not honouring the requested symmetric or fixed pulse
+        # width. To do so would be possible, but would consume more pulseblaster
+        # instructions, so we err on the side of fewer instructions:
+        if self.pulse_width == 'symmetric':
+            high_time = steps / 2
+        else:
+            high_time = np.full(n_inst, self.pulse_width, dtype=np.float64)
+        high_time = np.minimum(high_time, self.long_delay)
+        # Low time is whatever is left. If we are only updating a direct output, there
+        # is no need to tick the clocks, and the whole step is 'low time':
+        low_time = np.where(only_internal, steps, steps - high_time)
+
+        # Do we need to insert a LONG_DELAY instruction to create a delay this long?
+        n_long_delays, remaining_low_time = np.divmod(low_time, self.long_delay)
+        # If the remainder is too short to be output, add self.long_delay to it.
+        # self.long_delay was constructed such that adding self.min_delay to it is
+        # still not too long for a single instruction:
+        too_short = (n_long_delays > 0) & (remaining_low_time < self.min_delay)
+        n_long_delays[too_short] -= 1
+        remaining_low_time[too_short] += self.long_delay
+        has_long_delay = n_long_delays > 0
+
+        # Number of hardware instructions used by each pseudoclock instruction: a
+        # LOOP/END_LOOP pair for clock ticks or a single CONTINUE for direct output
+        # updates, plus one if there is a LONG_DELAY. WAITs use a single
+        # instruction. We've delegated the initial two instructions off to BLACS,
+        # which can ensure continuity with the state of the front panel. Thus these
+        # two instructions don't actually do anything.
+        n_rows = np.ones(len(clock), dtype=np.int64)
+        n_rows[~is_wait] = np.where(only_internal, 1, 2) + has_long_delay
+        first_row = 2 + np.cumsum(n_rows) - n_rows
+        last_row = first_row + n_rows - 1
+        pb_inst = np.zeros(2 + n_rows.sum() + 1, dtype=self.pb_dtype)
+
+        # The dummy instructions:
+        pb_inst['inst'][:2] = self.pb_instructions['STOP']
+        pb_inst['length'][:2] = 10.0/self.clock_limit*1e9
+
+        def fill(rows, mask, inst, flags, data, delay):
+            rows = rows[mask]
+            pb_inst['inst'][rows] = self.pb_instructions[inst]
+            pb_inst['flags'][rows] = flags[mask]
+            pb_inst['inst_data'][rows] = data[mask] if np.ndim(data) else data
+            pb_inst['length'][rows] = delay[mask] if np.ndim(delay) else delay
+            for name, values in dds_fields.items():
+                pb_inst[name][rows] = values[mask]
+
+        rows = first_row[~is_wait]
+        ticks = ~only_internal
+        # The start loop instruction, clock edges are high:
+        fill(rows, ticks, 'LOOP', high_flags, reps, high_time*1e9)
+        # The long delay instruction, if any. Clock edges are low:
+        fill(rows + ticks, has_long_delay, 'LONG_DELAY', low_flags, n_long_delays.astype(np.int64), self.long_delay*1e9)
+        # Remaining low time. Clock edges are low, and we loop back to the LOOP
+        # instruction:
+        fill(rows + 1 + has_long_delay, ticks, 'END_LOOP', low_flags, rows, remaining_low_time*1e9)
+        # Direct output updates only:
+        fill(rows + has_long_delay, only_internal, 'CONTINUE', low_flags, 0, remaining_low_time*1e9)
+
+        # Each WAIT instruction repeats the last instruction but with a 100ns delay
+        # and a WAIT op code. Find the last row of the most recent non-wait
+        # instruction (or the dummy instructions if there is none):
+        source_rows = np.maximum.accumulate(np.where(is_wait, 1, last_row))
+        wait_rows = first_row[is_wait]
+        pb_inst[wait_rows] = pb_inst[source_rows[is_wait]]
+        pb_inst['inst'][wait_rows] = self.pb_instructions['WAIT']
+        pb_inst['inst_data'][wait_rows] = 0
+        pb_inst['length'][wait_rows] = 100
 
+        # The final instruction repeats the state of the last non-wait instruction:
+        pb_inst[-1] = pb_inst[source_rows[-1] if len(clock) else 1]
+        pb_inst['inst_data'][-1] = 0
+        pb_inst['length'][-1] = 10.0/self.clock_limit*1e9
         if self.programming_scheme == 'pb_start/BRANCH':
             # This is how we stop the pulse program. We branch from the last
             # instruction to the zeroth, which BLACS has programmed in with
             # the same values and a WAIT instruction. The PulseBlaster then
             # waits on instuction zero, which is a state ready for either
             # further static updates or buffered mode.
-            pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
-                            'flags': flagstring, 'instruction': 'BRANCH',
-                            'data': 0, 'delay': 10.0/self.clock_limit*1e9})
+            pb_inst['inst'][-1] = self.pb_instructions['BRANCH']
         elif self.programming_scheme == 'pb_stop_programming/STOP':
             # An ordinary stop instruction. This has the downside that the PulseBlaster might
             # (on some models) reset its output to zero momentarily until BLACS calls program_manual, which
@@ -570,9 +559,7 @@ class PulseBlaster(PseudoclockDevice):
             # repeated triggers coming to it, such as a 50Hz/60Hz line trigger. We can't have it sit
             # on a WAIT instruction as above, or it will trigger and run repeatedly when that's not what
             # we wanted.
-            pb_inst.append({'freqs': freqregs, 'amps': ampregs, 'phases': phaseregs, 'enables':dds_enables, 'phase_resets':phase_resets,
-                            'flags': flagstring, 'instruction': 'STOP',
-                            'data': 0, 'delay': 10.0/self.clock_limit*1e9})
+            pb_inst['inst'][-1] = self.pb_instructions['STOP']
         else:
             raise AssertionError('Invalid programming scheme %s'%str(self.programming_scheme))
             
@@ -580,38 +567,11 @@ class PulseBlaster(PseudoclockDevice):
             raise LabscriptError("The Pulseblaster memory cannot store more than {:d} instuctions, but the PulseProgram contains {:d} instructions.".format(self.max_instructions, len(pb_inst))) 
             
         return pb_inst
-        
+
     def write_pb_inst_to_h5(self, pb_inst, hdf5_file):
-        # OK now we squeeze the instructions into a numpy array ready for writing to hdf5:
-        pb_dtype = [('freq0', np.int32), ('phase0', np.int32), ('amp0', np.int32), 
-                    ('dds_en0', np.int32), ('phase_reset0', np.int32),
-                    ('freq1', np.int32), ('phase1', np.int32), ('amp1', np.int32),
-                    ('dds_en1', np.int32), ('phase_reset1', np.int32),
-                    ('flags', np.int32), ('inst', np.int32),
-                    ('inst_data', np.int32), ('length', np.float64)]
-        pb_inst_table = np.empty(len(pb_inst),dtype = pb_dtype)
-        for i,inst in enumerate(pb_inst):
-            flagint = int(inst['flags'][::-1],2)
-            instructionint = self.pb_instructions[inst['instruction']]
-            dataint = inst['data']
-            delaydouble = inst['delay']
-            freq0 = inst['freqs'][0]
-            freq1 = inst['freqs'][1]
-            phase0 = inst['phases'][0]
-            phase1 = inst['phases'][1]
-            amp0 = inst['amps'][0]
-            amp1 = inst['amps'][1]
-            en0 = inst['enables'][0]
-            en1 = inst['enables'][1]
-            phase_reset0 = inst['phase_resets'][0]
-            phase_reset1 = inst['phase_resets'][1]
-            
-            pb_inst_table[i] = (freq0,phase0,amp0,en0,phase_reset0,freq1,phase1,amp1,en1,phase_reset1, flagint, 
-                                instructionint, dataint, delaydouble)     
-                                
         # Okay now write it to the file: 
         group = hdf5_file['/devices/'+self.name]  
-        group.create_dataset('PULSE_PROGRAM', compression=config.compression,data = pb_inst_table)   
+        group.create_dataset('PULSE_PROGRAM', compression=config.compression,data = pb_inst)   
         self.set_property('stop_time', self.stop_time, location='device_properties')
 
 
@@ -1156,29 +1116,6 @@ class PulseBlasterParser(object):
         self.name = device.name
         self.device = device
         
-        # We create a lookup table for strings to be used later as dictionary keys.
-        # This saves having to evaluate '%d'%i many many times, and makes the _add_pulse_program_row_to_traces method
-        # significantly more efficient
-        self.dds_strings = {}
-        for i in range(self.num_dds):
-            self.dds_strings[i] = {}
-            self.dds_strings[i]['ddsfreq'] = 'dds %d_freq'%i
-            self.dds_strings[i]['ddsamp'] = 'dds %d_amp'%i
-            self.dds_strings[i]['ddsphase'] = 'dds %d_phase'%i
-            self.dds_strings[i]['freq'] = 'freq%d'%i
-            self.dds_strings[i]['amp'] = 'amp%d'%i
-            self.dds_strings[i]['phase'] = 'phase%d'%i
-            self.dds_strings[i]['dds_en'] = 'dds_en%d'%i
-            
-        self.flag_strings = {}
-        self.flag_powers = {}
-        
-        for i in range(self.num_flags):
-            self.flag_strings[i] = 'flag %d'%i
-            self.flag_powers[i] = 2**i
-        
-            
-        
     def get_traces(self, add_trace, parent=None):
         if parent is None:
             # we're the master pseudoclock, software triggered. So we don't have to worry about trigger delays, etc
@@ -1194,85 +1131,116 @@ class PulseBlasterParser(object):
                 for reg in ['FREQ', 'AMP', 'PHASE']:
                     dds[i][reg] = f['devices/%s/DDS%d/%s_REGS'%(self.name, i, reg)][:]
         
-        clock = []
-        traces = {}
-        for i in range(self.num_flags):
-            traces['flag %d'%i] = []
-        for i in range(self.num_dds):
-            for sub_chnl in ['freq', 'amp', 'phase']:
-                traces['dds %d_%s'%(i,sub_chnl)] = []   
+        # ignore the first 2 instructions, they are dummy instructions for BLACS
+        pulse_program = pulse_program[2:]
+        inst = pulse_program['inst']
         
-        # now build the traces
-        t = 0. if parent is None else PulseBlaster.trigger_delay # Offset by initial trigger of parent
-        i = 0
-        while i < len(pulse_program):
-            # ignore the first 2 instructions, they are dummy instructions for BLACS
-            if i < 2:
-                i += 1
-                continue
-            
-            row = pulse_program[i]
-            
-            if row['inst'] == 2: # Loop
-                loops = int(row['inst_data'])
-                
-                buffer = {}
-                j = i
-                while loops > 0:
-                    looping = True
-                    while looping:
-                        row = pulse_program[j]
-                        # buffer the index of traces used for this instruction
-                        # Cuts the runtime down by ~60%
-                        # start_profile('loop_contents')
-                        if j not in buffer:
-                            clock.append(t)
-                            self._add_pulse_program_row_to_traces(traces, row, dds)
-                            buffer[j] = len(clock)-1
-                        else:                            
-                            clock.append(t)
-                            self._add_pulse_program_row_from_buffer(traces, buffer[j])
-                        # stop_profile('loop_contents')
-                            
-                        # start_profile('end_of_loop')
-                        t+= row['length']*1.0e-9
-                        
-                        if row['inst'] == 3: # END_LOOP
-                            looping = False
-                            # print 'end loop. j=%d, t=%.7f'%(j,t)
-                            j = int(row['inst_data']) if loops > 1 else j
-                            # print 'setting j=%d'%j
-                        else:
-                            # print 'in loop. j=%d, t=%.7f'%(j,t)
-                            j+=1
-                        # stop_profile('end_of_loop')
-                    loops -= 1
-                    
-                i = j
-                # print 'i now %d'%i
-                    
-            else: # Continue
-                if row['inst'] == 8: #WAIT
-                    print('Wait at %.9f'%t)
-                    pass
-                clock.append(t)
-                self._add_pulse_program_row_to_traces(traces,row,dds)
-                t+= row['length']*1.0e-9
-            
-                if row['inst'] == 8 and parent is not None: #WAIT
-                    #TODO: Offset next time by trigger delay is not master pseudoclock
-                    t+= PulseBlaster.trigger_delay
-                    
-            
-            i += 1            
-                
-        print('Stop time: %.9f'%t)
-        # now put together the traces
+        # Each instruction is executed the number of times of its enclosing loop, if
+        # any. Loops are not nested, and each END_LOOP's inst_data is the index of its
+        # LOOP instruction. Group the instructions into blocks of consecutive
+        # instructions that are repeated together: each loop, and each instruction
+        # not in a loop.
+        loop_ends = np.flatnonzero(inst == 3) # END_LOOP
+        loop_starts = pulse_program['inst_data'][loop_ends] - 2
+        in_loop = np.zeros(len(pulse_program) + 1, dtype=np.int64)
+        np.add.at(in_loop, loop_starts, 1)
+        np.add.at(in_loop, loop_ends + 1, -1)
+        in_loop = np.cumsum(in_loop[:-1]) > 0
+        block_starts = np.flatnonzero(~in_loop)
+        block_starts = np.union1d(block_starts, loop_starts)
+        block_lengths = np.diff(np.append(block_starts, len(pulse_program)))
+        block_repeats = np.ones(len(block_starts), dtype=np.int64)
+        is_loop = in_loop[block_starts]
+        block_repeats[is_loop] = pulse_program['inst_data'][block_starts[is_loop]]
+        
+        # The duration of each instruction. A LONG_DELAY's length is multiplied by its
+        # inst_data.
+        durations = pulse_program['length']*1.0e-9
+        long_delays = inst == 7 # LONG_DELAY
+        durations[long_delays] *= pulse_program['inst_data'][long_delays]
+        waits = (inst == 8) & ~in_loop # WAIT
+        if parent is not None:
+            #TODO: Offset next time by trigger delay is not master pseudoclock
+            durations[waits] += PulseBlaster.trigger_delay
+        
+        # The time at which each block begins, and the stop time. Each execution of an
+        # instruction begins at its block's start time, plus a whole number of
+        # repeats of the block's duration, plus its offset within the block:
+        t0 = 0. if parent is None else PulseBlaster.trigger_delay # Offset by initial trigger of parent
+        block_durations = np.add.reduceat(durations, block_starts)
+        block_times = np.cumsum(np.concatenate([[t0], block_durations*block_repeats]))
+        block_of_row = np.repeat(np.arange(len(block_starts)), block_lengths)
+        start_offsets = np.cumsum(durations) - durations
+        row_offsets = start_offsets - np.repeat(start_offsets[block_starts], block_lengths)
+        for t in block_times[block_of_row[waits]]:
+            print('Wait at %.9f'%t)
+        print('Stop time: %.9f'%block_times[-1])
+        end_time = block_times[-2] + (block_repeats[-1] - 1)*block_durations[-1] + row_offsets[-1]
+        
+        # Each repeat of a loop after the first begins following its last instruction,
+        # otherwise each instruction follows the previous one:
+        block_ends = block_starts + block_lengths - 1
+        is_block_start = np.zeros(len(pulse_program), dtype=bool)
+        is_block_start[block_starts] = True
+        
+        def transitions(row_values):
+            """Return the times at which an output with the given value during each
+            instruction changes, and the values it changes to, along with its initial
+            value and its value at the start of the last instruction executed. Only these
+            are stored, rather than the value during every instruction executed."""
+            changed = np.ones(len(row_values), dtype=bool)
+            changed[1:] = row_values[1:] != row_values[:-1]
+            # Changes into an instruction that happen in every repeat of its block, those
+            # into the first instruction of a block from the previous block, which happen
+            # in its first repeat only, and those into the first instruction of a loop
+            # from its last, which happen in every repeat but the first:
+            every = np.flatnonzero(changed & ~is_block_start)
+            entered = np.flatnonzero(changed & is_block_start)
+            rewound = block_starts[
+                (row_values[block_starts] != row_values[block_ends]) & (block_repeats > 1)
+            ]
+            rows = np.concatenate([every, entered, rewound])
+            blocks = block_of_row[rows]
+            first_repeats = np.concatenate(
+                [np.zeros(len(every) + len(entered), dtype=np.int64), np.ones(len(rewound), dtype=np.int64)]
+            )
+            n_repeats = np.concatenate(
+                [block_repeats[blocks[:len(every)]], np.ones(len(entered), dtype=np.int64), block_repeats[blocks[len(every) + len(entered):]] - 1]
+            )
+            first_index = np.cumsum(n_repeats) - n_repeats
+            repeat = np.arange(n_repeats.sum()) - np.repeat(first_index - first_repeats, n_repeats)
+            rows = np.repeat(rows, n_repeats)
+            blocks = np.repeat(blocks, n_repeats)
+            times = block_times[blocks] + repeat*block_durations[blocks] + row_offsets[rows]
+            order = np.argsort(times, kind='stable')
+            times, rows = times[order], rows[order]
+            if times[-1] < end_time:
+                times = np.append(times, end_time)
+                rows = np.append(rows, len(row_values) - 1)
+            return times, row_values[rows]
+        
+        # The value of each output during each instruction, decoded only for outputs in
+        # use:
+        dds_connections = set(
+            'dds %d_%s'%(i, quantity) for i in range(self.num_dds) for quantity in ['freq', 'amp', 'phase']
+        )
+        def row_values(connection):
+            output, _, quantity = connection.partition('_')
+            if output.startswith('flag'):
+                flag = int(output.split()[1])
+                return ((pulse_program['flags'] >> flag) & 1).astype(np.int8)
+            i = int(output.split()[1])
+            values = dds[i][quantity.upper()][pulse_program['%s%d'%(quantity, i)]]
+            if quantity == 'amp':
+                values = np.where(pulse_program['dds_en%d'%i], values, 0)
+            return values
+        
+        # now build the traces, as the changes in each output in use:
         to_return = {}
-        clock = np.array(clock, dtype=np.float64)
-        for name, data in traces.items():
-            to_return[name] = (clock, np.array(data))
-            
+        def get_trace(connection):
+            if connection not in to_return:
+                to_return[connection] = transitions(row_values(connection))
+            return to_return[connection]
         
         # if slow_clock_flag is not None:
             # to_return['slow clock'] = to_return['flag %d'%slow_clock_flag[0]]
@@ -1285,60 +1253,18 @@ class PulseBlasterParser(object):
                     for internal_device_name, internal_device in clock_line.child_list.items():
                         for channel_name, channel in internal_device.child_list.items():
                             if channel.device_class == 'Trigger':
-                                clocklines_and_triggers[channel_name] = to_return[channel.parent_port]
-                                add_trace(channel_name, to_return[channel.parent_port], parent_device_name, channel.parent_port)
+                                clocklines_and_triggers[channel_name] = get_trace(channel.parent_port)
+                                add_trace(channel_name, get_trace(channel.parent_port), parent_device_name, channel.parent_port)
                             else:
                                 if channel.device_class == 'DDS':
                                     for subchnl_name, subchnl in channel.child_list.items():
                                         connection = '%s_%s'%(channel.parent_port, subchnl.parent_port)
-                                        if connection in to_return:
-                                            add_trace(subchnl.name, to_return[connection], parent_device_name, connection)
+                                        if connection in dds_connections:
+                                            add_trace(subchnl.name, get_trace(connection), parent_device_name, connection)
                                 else:
-                                    add_trace(channel_name, to_return[channel.parent_port], parent_device_name, channel.parent_port)
+                                    add_trace(channel_name, get_trace(channel.parent_port), parent_device_name, channel.parent_port)
                 else:
-                    clocklines_and_triggers[clock_line_name] = to_return[clock_line.parent_port]
-                    add_trace(clock_line_name, to_return[clock_line.parent_port], self.name, clock_line.parent_port)
+                    clocklines_and_triggers[clock_line_name] = get_trace(clock_line.parent_port)
+                    add_trace(clock_line_name, get_trace(clock_line.parent_port), self.name, clock_line.parent_port)
             
         return clocklines_and_triggers
-    
-    @profile
-    def _add_pulse_program_row_from_buffer(self, traces, index):
-        for i in range(self.num_flags):
-            traces[self.flag_strings[i]].append(traces[self.flag_strings[i]][index])
-            
-        for i in range(self.num_dds):
-            current_strings = self.dds_strings[i]
-            traces[current_strings['ddsfreq']].append(traces[current_strings['ddsfreq']][index])
-            traces[current_strings['ddsphase']].append(traces[current_strings['ddsphase']][index])
-            traces[current_strings['ddsamp']].append(traces[current_strings['ddsamp']][index])
-            
-    @profile            
-    def _add_pulse_program_row_to_traces(self, traces, row, dds, flags = None):
-        # add flags
-        if flags is None:
-            flags = np.binary_repr(row['flags'],self.num_flags)[::-1]
-        for i in range(self.num_flags):
-            traces[self.flag_strings[i]].append(int(flags[i]))
-        
-        # Below block saved for history. This is much slower compared to what is below!
-        # for i in range(self.num_dds):
-            # traces['dds %d_freq'%i].append(dds[i]['FREQ'][row['freq%d'%i]])
-            # traces['dds %d_phase'%i].append(dds[i]['PHASE'][row['phase%d'%i]])
-            # amp = dds[i]['AMP'][row['amp%d'%i]] if row['dds_en%d'%i] else 0
-            # traces['dds %d_amp'%i].append(amp)
-            
-       
-        # note that we are looking up keys for the traces dictionary and row array in self.dds_strings
-        # Doing this reduces the runtime (of the below block) by 25%
-        for i in range(self.num_dds):
-            # Note: This is done to reduce runtime (about 10%)
-            current_strings = self.dds_strings[i]
-            current_dds = dds[i]
-            
-            traces[current_strings['ddsfreq']].append(current_dds['FREQ'][row[current_strings['freq']]])
-            traces[current_strings['ddsphase']].append(current_dds['PHASE'][row[current_strings['phase']]])
-            # Note: Using the inline if statement reduces the runtime (of this for loop) by 50%
-            amp = current_dds['AMP'][row[current_strings['amp']]] if row[current_strings['dds_en']] else 0
-            traces[current_strings['ddsamp']].append(amp)
-            
-            
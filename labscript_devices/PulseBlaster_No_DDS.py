@@ -30,12 +30,8 @@ class PulseBlaster_No_DDS(PulseBlaster):
         # OK now we squeeze the instructions into a numpy array ready for writing to hdf5:
         pb_dtype= [('flags',np.int32), ('inst',np.int32), ('inst_data',np.int32), ('length',np.float64)]
         pb_inst_table = np.empty(len(pb_inst),dtype = pb_dtype)
-        for i,inst in enumerate(pb_inst):
-            flagint = int(inst['flags'][::-1],2)
-            instructionint = self.pb_instructions[inst['instruction']]
-            dataint = inst['data']
-            delaydouble = inst['delay']
-            pb_inst_table[i] = (flagint, instructionint, dataint, delaydouble)
+        for name in pb_inst_table.dtype.names:
+            pb_inst_table[name] = pb_inst[name]
         
         # Okay now write it to the file: 
         group = hdf5_file['/devices/'+self.name]  
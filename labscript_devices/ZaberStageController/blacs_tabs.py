@@ -28,9 +28,12 @@ class ZaberStageControllerTab(DeviceTab):
 
         # Create the AO output objects
         ao_prop = {}
+        self.speed_units = {}
         for stage in device.child_list.values():
             connection = stage.parent_port
             base_min, base_max = stage.properties['limits']
+            # Absent from connection tables compiled before it was added:
+            self.speed_units[connection] = stage.properties.get('speed_units')
             ao_prop[connection] = {
                 'base_unit': self.base_units,
                 'min': base_min,
@@ -61,6 +64,7 @@ class ZaberStageControllerTab(DeviceTab):
                 'com_port': self.com_port,
                 'mock': self.mock,
                 'child_connections': self.child_connections,
+                'speed_units': self.speed_units,
             },
         )
         self.primary_worker = "main_worker"
@@ -12,7 +12,7 @@
 #####################################################################
 
 from blacs.tab_base_classes import Worker
-from time import monotonic
+from time import monotonic, sleep
 from labscript_utils import dedent
 import labscript_utils.h5_lock, h5py
 
@@ -23,25 +23,24 @@ zaber = None
 
 TIMEOUT = 60
 
+# Shortest and longest intervals between position queries whilst waiting for devices
+# that have not arrived by their estimated arrival time:
+MIN_POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.5
 
-class MockZaberInterface(object):
-    def __init__(self, com_port):
-        from collections import defaultdict
-        self.positions = defaultdict(int)
-
-    def move(self, device_number, position):
-        print(f"Mock move device {device_number} to position {position}")
-        self.positions[device_number] = position
-
-    def get_position(self, device_number):
-        return self.positions[device_number]
-
-    def close(self):
-        print(f"mock close")
+# Binary protocol command numbers:
+MOVE_ABSOLUTE = 20
+SET_TARGET_SPEED = 42
+RETURN_SETTING = 53
+RETURN_CURRENT_POSITION = 60
+ERROR = 255
 
 
 class ZaberInterface(object):
-    def __init__(self, com_port):
+    def __init__(self, com_port, speed_units=None):
+        """speed_units is a dict of the speed, in steps per second, of one unit of the
+        target speed setting of each device, keyed by device number. This depends on the
+        device series. Devices absent from it are assumed to have an unknown speed."""
         global zaber
         try:
             import zaber.serial as zaber
@@ -51,30 +50,157 @@ class ZaberInterface(object):
             raise ImportError(dedent(msg))
 
         self.port = zaber.BinarySerial(com_port)
+        if speed_units is None:
+            speed_units = {}
+        self.speed_units = speed_units
+
+    def start_move(self, device_number, position):
+        """Command the device to move to the given position, without waiting for it to
+        get there. The device replies once the move is complete, which get_position()
+        will discard."""
+        self.port.write(zaber.BinaryCommand(device_number, MOVE_ABSOLUTE, position))
+
+    def wait_until_moved(self, positions, timeout=TIMEOUT):
+        """Wait for the devices to reach their positions, given as a dict of positions
+        keyed by device number. Raise TimeoutError if they do not all get there within
+        the timeout"""
+        # Rather than querying positions continually, which would keep the serial bus
+        # busy and a CPU core occupied, sleep until the earliest estimated arrival time
+        # of the devices still moving. Devices take longer to arrive than estimated as
+        # they accelerate and decelerate, after which we poll with an interval that
+        # doubles with each poll. We also poll like this if no device's speed is known.
+        remaining = dict(positions)
+        # Speeds are queried anew for each move, as their settings may have changed:
+        speeds = {n: self.get_speed(n) for n in remaining}
+        deadline = monotonic() + timeout
+        interval = MIN_POLL_INTERVAL
+        while True:
+            time_to_arrival = float('inf')
+            for device_number, position in list(remaining.items()):
+                distance = abs(position - self.get_position(device_number))
+                if distance == 0:
+                    del remaining[device_number]
+                    continue
+                speed = speeds[device_number]
+                if speed:
+                    time_to_arrival = min(time_to_arrival, distance / speed)
+            if not remaining:
+                return
+            now = monotonic()
+            if now > deadline:
+                devices = ', '.join(str(n) for n in sorted(remaining))
+                msg = f"""Device(s) {devices} did not move to requested position within
+                    timeout"""
+                raise TimeoutError(dedent(msg))
+            if interval < time_to_arrival < float('inf'):
+                delay = time_to_arrival
+                interval = MIN_POLL_INTERVAL
+            else:
+                delay = interval
+                interval = min(2 * interval, MAX_POLL_INTERVAL)
+            # Poll once more at the deadline rather than sleeping past it:
+            sleep(min(delay, deadline - now))
 
     def move(self, device_number, position):
-        device = zaber.BinaryDevice(self.port, device_number)
-        device.move_abs(position)
-        deadline = monotonic() + TIMEOUT
-        while device.get_position() != position:
-            if monotonic() > deadline:
-                msg = "Device did not move to requested position within timeout"
-                raise TimeoutError(msg)
+        self.start_move(device_number, position)
+        self.wait_until_moved({device_number: position})
+
+    def query(self, device_number, command_number, data=0, reply_command_number=None):
+        """Send a command to the device and return the data of its reply, which has the
+        given command number, by default the same as that of the command. Discard other
+        replies received in the meantime, which are to completed moves."""
+        if reply_command_number is None:
+            reply_command_number = command_number
+        self.port.write(zaber.BinaryCommand(device_number, command_number, data))
+        while True:
+            reply = self.port.read()
+            if reply.command_number == ERROR:
+                msg = f"Device {reply.device_number} returned error code {reply.data}"
+                raise RuntimeError(msg)
+            if (
+                reply.device_number == device_number
+                and reply.command_number == reply_command_number
+            ):
+                return reply.data
 
     def get_position(self, device_number):
-        device = zaber.BinaryDevice(self.port, device_number)
-        return device.get_position()
+        return self.query(device_number, RETURN_CURRENT_POSITION)
+
+    def get_speed(self, device_number):
+        """Return the speed at which the device moves, in steps per second, or None if
+        the units of its speed setting are not known"""
+        if self.speed_units.get(device_number) is None:
+            return None
+        speed = self.query(
+            device_number,
+            RETURN_SETTING,
+            SET_TARGET_SPEED,
+            reply_command_number=SET_TARGET_SPEED,
+        )
+        return speed * self.speed_units[device_number]
 
     def close(self):
         self.port.close()
 
 
+class MockZaberInterface(ZaberInterface):
+    """Simulates stages that travel at the given speed, in steps per second, and then
+    take settling_time seconds to settle at their final position. As for real stages,
+    get_speed() returns None for stages absent from speed_units. The number of position
+    queries to each device is counted in self.position_queries."""
+
+    def __init__(self, com_port, speed_units=None, speed=200000, settling_time=0):
+        from collections import Counter, defaultdict
+        if speed_units is None:
+            speed_units = {}
+        self.speed_units = speed_units
+        self.speed = speed
+        self.settling_time = settling_time
+        # The start and end position and start time of each device's most recent move:
+        self.moves = defaultdict(lambda: (0, 0, 0.0))
+        self.position_queries = Counter()
+
+    def start_move(self, device_number, position):
+        print(f"Mock move device {device_number} to position {position}")
+        self.moves[device_number] = (
+            self._position(device_number),
+            position,
+            monotonic(),
+        )
+
+    def _position(self, device_number):
+        start, end, start_time = self.moves[device_number]
+        elapsed = monotonic() - start_time
+        travel_time = abs(end - start) / self.speed
+        if end == start or elapsed >= travel_time + self.settling_time:
+            return end
+        # Stop one step short of the final position until settled:
+        distance = min(int(self.speed * elapsed), abs(end - start) - 1)
+        return start + distance * (1 if end > start else -1)
+
+    def get_position(self, device_number):
+        self.position_queries[device_number] += 1
+        return self._position(device_number)
+
+    def get_speed(self, device_number):
+        if self.speed_units.get(device_number) is None:
+            return None
+        return self.speed
+
+    def close(self):
+        print(f"mock close")
+
+
 class ZaberWorker(Worker):
     def init(self):
+        speed_units = {
+            get_device_number(connection): units
+            for connection, units in self.speed_units.items()
+        }
         if self.mock:
-            self.controller = MockZaberInterface(self.com_port)
+            self.controller = MockZaberInterface(self.com_port, speed_units)
         else:
-            self.controller = ZaberInterface(self.com_port)
+            self.controller = ZaberInterface(self.com_port, speed_units)
 
     def check_remote_values(self):
         remote_values = {} 
@@ -84,9 +210,14 @@ class ZaberWorker(Worker):
         return remote_values
 
     def program_manual(self, values):
+        # Start all the moves before waiting for any of them, so that the stages move
+        # concurrently:
+        positions = {}
         for connection, value in values.items():
             device_number = get_device_number(connection)
-            self.controller.move(device_number, int(round(value)))
+            positions[device_number] = int(round(value))
+            self.controller.start_move(device_number, positions[device_number])
+        self.controller.wait_until_moved(positions)
         return self.check_remote_values()
 
     def transition_to_buffered(self, device_name, h5file, initial_values, fresh):
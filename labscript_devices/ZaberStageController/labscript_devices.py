@@ -18,11 +18,14 @@ from .utils import get_device_number
 # Base class for stages:
 class ZaberStage(StaticAnalogQuantity):
     limits = (0, np.inf)
+    # Speed in steps per second of one unit of the target speed setting, which depends
+    # on the device series, or None if unknown:
+    speed_units = None
     description = "Zaber Stage"
     @set_passed_properties(
-        property_names={"connection_table_properties": ["limits"]}
+        property_names={"connection_table_properties": ["limits", "speed_units"]}
     )
-    def __init__(self, *args, limits=None, **kwargs):
+    def __init__(self, *args, limits=None, speed_units=None, **kwargs):
         """Static Analog output device for controlling the position of a Zaber stage.
         Can be added as a child device of `ZaberStageController`. Subclasses for
         specific models already have model-specific limits set for their values, but you
@@ -41,6 +44,14 @@ class ZaberStage(StaticAnalogQuantity):
                 by the device if using one of the model-specific subclasses defined in
                 this module, or is (0, inf) otherwise.
 
+            speed_units (float), default `None`
+                the speed, in steps per second, of one unit of the device's target speed
+                setting, which BLACS uses to estimate when moves will complete. If None,
+                the value set as a class attribute will be used, which is set for the
+                device series of the model-specific subclasses defined in this module,
+                or is None otherwise, in which case BLACS polls the device's position
+                until it arrives.
+
             **kwargs:
                 Further keyword arguments to be passed to the `__init__` method of the
                 parent class (StaticAnalogQuantity).
@@ -49,24 +60,33 @@ class ZaberStage(StaticAnalogQuantity):
 
         if limits is None:
             limits = self.limits
+        if speed_units is None:
+            speed_units = self.speed_units
+        self.speed_units = speed_units
         StaticAnalogQuantity.__init__(self, *args, limits=limits, **kwargs)
 
 
+# Base class for T-series stages, whose target speed setting is in units of 9.375
+# microsteps per second:
+class ZaberStageTSeries(ZaberStage):
+    speed_units = 9.375
+
+
 # Child classes for specific models of stages, which have knowledge of their valid
 # ranges:
-class ZaberStageTLSR150D(ZaberStage):
+class ZaberStageTLSR150D(ZaberStageTSeries):
     limits = (0, 76346)
     description = 'Zaber Stage T-LSR150D'
 
-class ZaberStageTLSR300D(ZaberStage):
+class ZaberStageTLSR300D(ZaberStageTSeries):
     limits = (0, 151937)
     description = 'Zaber Stage T-LSR300D'
 
-class ZaberStageTLS28M(ZaberStage):
+class ZaberStageTLS28M(ZaberStageTSeries):
     limits = (0, 282879)
     description = 'Zaber Stage T-LS28-M'
 
-class ZaberStageTLSR300B(ZaberStage):
+class ZaberStageTLSR300B(ZaberStageTSeries):
     limits = (0, 607740)
     description = 'Zaber Stage T-LSR150D'
 
@@ -0,0 +1,101 @@
+#####################################################################
+#                                                                   #
+# /clock_traces.py                                                  #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Construction of pulse programs, and of clock traces for runviewer parsers, for
+pseudoclocks whose pulse programs consist of instructions to output a number of
+identical clock ticks"""
+
+import numpy as np
+
+
+def reduce_instructions(clock, clock_resolution):
+    """Return the pulse program for the given pseudoclock instructions, as a structured
+    array of periods, in units of clock_resolution, and reps. Consecutive instructions
+    with the same period are merged, which will halve the number of instructions
+    roughly, for pseudoclocks that do not have a 'slow clock'. A period of zero
+    indicates a wait if reps is 1, and the stop instruction, appended at the end, if
+    reps is 0."""
+    is_wait = np.array([instruction == 'WAIT' for instruction in clock], dtype=bool)
+    steps = np.zeros(len(clock))
+    reps = np.ones(len(clock), dtype=int)
+    instructions = [instruction for instruction in clock if instruction != 'WAIT']
+    steps[~is_wait] = [instruction['step'] for instruction in instructions]
+    reps[~is_wait] = [instruction['reps'] for instruction in instructions]
+    # period is in quantised units:
+    periods = np.round(steps / clock_resolution).astype(int)
+    # Each run of instructions to be merged starts where the period changes, and at
+    # waits and the instructions following them, which are not merged:
+    run_starts = np.ones(len(clock), dtype=bool)
+    run_starts[1:] = (periods[1:] != periods[:-1]) | is_wait[1:] | is_wait[:-1]
+    run_starts = np.nonzero(run_starts)[0]
+    # The additional row is the stop instruction:
+    dtypes = [('period', int), ('reps', int)]
+    pulse_program = np.zeros(len(run_starts) + 1, dtype=dtypes)
+    if len(run_starts):
+        pulse_program['period'][:-1] = periods[run_starts]
+        pulse_program['reps'][:-1] = np.add.reduceat(reps, run_starts)
+    return pulse_program
+
+
+def max_points_for(device):
+    """Return the maximum number of points the clock traces of a pseudoclock device
+    should have in runviewer, for passing to clock_trace() as max_points, given its
+    runviewer connection table entry. This is the max_clock_trace_points option in the
+    [runviewer] section of the labconfig, or None if it is not set, in which case clock
+    traces include every tick. It is also None if any clock line of the device has
+    child devices, since they cannot be parsed without every tick."""
+    for pseudoclock in device.child_list.values():
+        for clock_line in pseudoclock.child_list.values():
+            if clock_line.child_list:
+                return None
+    from labscript_utils.labconfig import LabConfig
+    max_points = LabConfig().get('runviewer', 'max_clock_trace_points', fallback='')
+    return int(max_points) if max_points else None
+
+
+def clock_trace(start_times, high_times, low_times, reps, max_points=None):
+    """Return the (times, states) trace of a clock line given, for each instruction of a
+    pulse program, its start time, the durations for which each of its ticks is high
+    and low, and its number of ticks. Instructions with zero reps produce no ticks.
+
+    If max_points is not None and the trace would have more points than this, only
+    every nth tick is included, with n chosen such that the trace has at most
+    max_points points. Such a trace is for display only, as it does not contain every
+    clock tick that child devices would need to be parsed."""
+    start_times = np.asarray(start_times, dtype=float)
+    high_times = np.asarray(high_times, dtype=float)
+    low_times = np.asarray(low_times, dtype=float)
+    reps = np.asarray(reps, dtype=np.int64)
+    # Index of the first tick of each instruction, and the total number of ticks:
+    first_ticks = np.cumsum(reps) - reps
+    n_ticks = int(reps.sum())
+    if max_points is not None and 2 * n_ticks > max_points:
+        # Each tick is two points:
+        stride = -(-n_ticks // max(max_points // 2, 1))
+        ticks = np.arange(0, n_ticks, stride)
+        instructions = np.searchsorted(first_ticks + reps, ticks, side='right')
+    else:
+        ticks = np.arange(n_ticks)
+        instructions = np.repeat(np.arange(len(reps)), reps)
+    # Which tick of its instruction each tick is:
+    ticks -= first_ticks[instructions]
+    # Rising edges at even indices and falling edges at odd indices, computed in place
+    # to limit the memory used for long traces:
+    times = np.empty(2 * len(ticks))
+    rising_edges = times[::2]
+    np.multiply(ticks, (high_times + low_times)[instructions], out=rising_edges)
+    del ticks
+    rising_edges += start_times[instructions]
+    np.add(rising_edges, high_times[instructions], out=times[1::2])
+    states = np.zeros(len(times), dtype=np.int8)
+    states[::2] = 1
+    return times, states
@@ -0,0 +1,57 @@
+#####################################################################
+#                                                                   #
+# /serial_pipelining.py                                             #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Sending many commands to serial devices that acknowledge each command they
+execute, without waiting for each acknowledgement before sending the next command"""
+
+# Commands are sent in batches of this many. Each batch is written before reading the
+# responses to the previous one, so that the device always has commands waiting for
+# it, but no more than two batches are unacknowledged at a time, so as not to overrun
+# its input buffer:
+BATCH_SIZE = 16
+
+
+def send_commands(connection, commands, ack, device_name, batch_size=BATCH_SIZE):
+    """Write a list of commands, each a bytestring including its terminator, to a
+    serial connection in batches of batch_size, writing each batch before reading the
+    responses to the previous one. Raise an exception if any response is not ack."""
+    unacknowledged = []
+    for i in range(0, len(commands) + batch_size, batch_size):
+        batch = commands[i:i + batch_size]
+        if batch:
+            connection.write(b''.join(batch))
+        check_responses(connection, unacknowledged, ack, device_name)
+        unacknowledged = batch
+
+
+def check_responses(connection, commands, ack, device_name):
+    """Read the responses to the given commands, which have already been written to the
+    connection, and raise an exception naming the first command whose response is not
+    ack, having discarded the responses to any other commands already sent"""
+    expected = ack * len(commands)
+    response = b''
+    while len(response) < len(expected):
+        data = connection.read(len(expected) - len(response))
+        if not data:
+            # Timed out:
+            break
+        response += data
+    if response != expected:
+        connection.readlines()
+        responses = response.splitlines(True)
+        responses += [b''] * (len(commands) - len(responses))
+        for command, response in zip(commands, responses):
+            if response != ack:
+                break
+        response, command, ack = (s.decode('utf8').strip() for s in (response, command, ack))
+        msg = '%s said %s in response to %s, expected %s'
+        raise Exception(msg % (device_name, repr(response), repr(command), repr(ack)))
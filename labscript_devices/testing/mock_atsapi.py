@@ -0,0 +1,256 @@
+#####################################################################
+#                                                                   #
+# /testing/mock_atsapi.py                                           #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""A stand-in for atsapi, for exercising the AlazarTechBoard worker without a board
+or the AlazarTech SDK installed. To use it, install it in place of atsapi before
+importing AlazarTechBoard:
+
+    import sys
+    from labscript_devices.testing import mock_atsapi
+    sys.modules['labscript_devices.atsapi'] = mock_atsapi
+    from labscript_devices.AlazarTechBoard import GuilessWorker
+
+The constants defined are those of atsapi that the worker uses, with the same values.
+The Board emulates an ATS9462, ignoring its
+configuration and filling each buffer with a ramp when waitNextAsyncBufferComplete()
+is called. DMABuffers are numpy arrays, and the numbers of them allocated and freed are
+counted in DMABuffer.allocations and DMABuffer.frees."""
+
+import threading
+from ctypes import addressof, c_uint8
+
+import numpy as np
+
+# Board types:
+ATS9462 = 11
+boardNames = {ATS9462: 'ATS9462'}
+
+# Channels:
+CHANNEL_A = 1
+CHANNEL_B = 2
+CHANNEL_C = 4
+CHANNEL_D = 8
+CHANNEL_E = 16
+CHANNEL_F = 32
+CHANNEL_G = 64
+CHANNEL_H = 128
+CHANNEL_I = 256
+CHANNEL_J = 512
+CHANNEL_K = 1024
+CHANNEL_L = 2048
+CHANNEL_M = 4096
+CHANNEL_N = 8192
+CHANNEL_O = 16384
+CHANNEL_P = 32768
+channels = [
+    CHANNEL_A,
+    CHANNEL_B,
+    CHANNEL_C,
+    CHANNEL_D,
+    CHANNEL_E,
+    CHANNEL_F,
+    CHANNEL_G,
+    CHANNEL_H,
+    CHANNEL_I,
+    CHANNEL_J,
+    CHANNEL_K,
+    CHANNEL_L,
+    CHANNEL_M,
+    CHANNEL_N,
+    CHANNEL_O,
+    CHANNEL_P,
+]
+
+# Clock sources and edges:
+INTERNAL_CLOCK = 1
+FAST_EXTERNAL_CLOCK = 2
+MEDIUM_EXTERNAL_CLOCK = 3
+SLOW_EXTERNAL_CLOCK = 4
+EXTERNAL_CLOCK_AC = 5
+EXTERNAL_CLOCK_DC = 6
+EXTERNAL_CLOCK_10MHz_REF = 7
+CLOCK_EDGE_RISING = 0
+
+# Sample rates:
+SAMPLE_RATE_1KSPS = 1
+SAMPLE_RATE_2KSPS = 2
+SAMPLE_RATE_5KSPS = 5
+SAMPLE_RATE_10KSPS = 8
+SAMPLE_RATE_20KSPS = 10
+SAMPLE_RATE_50KSPS = 12
+SAMPLE_RATE_100KSPS = 14
+SAMPLE_RATE_200KSPS = 16
+SAMPLE_RATE_500KSPS = 18
+SAMPLE_RATE_1MSPS = 20
+SAMPLE_RATE_2MSPS = 24
+SAMPLE_RATE_5MSPS = 26
+SAMPLE_RATE_10MSPS = 28
+SAMPLE_RATE_20MSPS = 30
+SAMPLE_RATE_25MSPS = 33
+SAMPLE_RATE_50MSPS = 34
+SAMPLE_RATE_100MSPS = 36
+SAMPLE_RATE_125MSPS = 37
+SAMPLE_RATE_160MSPS = 38
+SAMPLE_RATE_180MSPS = 39
+
+# Input ranges, couplings and impedances:
+INPUT_RANGE_PM_40_MV = 2
+INPUT_RANGE_PM_50_MV = 3
+INPUT_RANGE_PM_80_MV = 4
+INPUT_RANGE_PM_100_MV = 5
+INPUT_RANGE_PM_200_MV = 6
+INPUT_RANGE_PM_400_MV = 7
+INPUT_RANGE_PM_500_MV = 8
+INPUT_RANGE_PM_800_MV = 9
+INPUT_RANGE_PM_1_V = 10
+INPUT_RANGE_PM_2_V = 11
+INPUT_RANGE_PM_4_V = 12
+INPUT_RANGE_PM_5_V = 13
+INPUT_RANGE_PM_8_V = 14
+INPUT_RANGE_PM_10_V = 15
+INPUT_RANGE_PM_20_V = 16
+INPUT_RANGE_PM_40_V = 17
+INPUT_RANGE_PM_16_V = 18
+INPUT_RANGE_PM_1_V_25 = 33
+INPUT_RANGE_PM_2_V_5 = 37
+INPUT_RANGE_PM_125_MV = 40
+INPUT_RANGE_PM_250_MV = 48
+AC_COUPLING = 1
+DC_COUPLING = 2
+IMPEDANCE_1M_OHM = 1
+
+# Triggers:
+TRIG_ENGINE_OP_J = 0
+TRIG_ENGINE_J = 0
+TRIG_ENGINE_K = 1
+TRIG_EXTERNAL = 2
+TRIG_DISABLE = 3
+TRIGGER_SLOPE_POSITIVE = 1
+ETR_5V = 0
+AUX_OUT_TRIGGER = 0
+
+# Acquisition flags:
+ADMA_ALLOC_BUFFERS = 32
+ADMA_TRIGGERED_STREAMING = 1024
+ADMA_FIFO_ONLY_STREAMING = 2048
+
+
+class AlazarException(RuntimeError):
+    pass
+
+
+def getSDKVersion():
+    return (7, 2, 3)
+
+
+def getDriverVersion():
+    return (7, 2, 3)
+
+
+class DMABuffer(object):
+    # Number of buffers allocated and freed, summed over all instances:
+    allocations = 0
+    frees = 0
+
+    # Buffers by address, for the Board to find the buffer it is asked to fill:
+    _buffers = {}
+
+    def __init__(self, c_sample_type, size_bytes):
+        DMABuffer.allocations += 1
+        self.size_bytes = size_bytes
+        self.ctypes_buffer = (c_uint8 * size_bytes)()
+        self.buffer = np.frombuffer(self.ctypes_buffer, dtype=np.dtype(c_sample_type))
+        self.addr = addressof(self.ctypes_buffer)
+        DMABuffer._buffers[self.addr] = self
+
+    def __exit__(self):
+        DMABuffer.frees += 1
+        del DMABuffer._buffers[self.addr]
+
+    @classmethod
+    def reset_counts(cls):
+        cls.allocations = 0
+        cls.frees = 0
+
+
+class Board(object):
+    def __init__(self, systemId=1, boardId=1):
+        self.systemId = systemId
+        self.boardId = boardId
+        self.type = ATS9462
+        self.revision = (1, 5)
+        self.revision_string = '{:d}.{:d}'.format(*self.revision)
+        self.cpld_version = (25, 0)
+        self.cpld_version_string = '{:d}.{:d}'.format(*self.cpld_version)
+        self.num_channels = 2
+        self.memorysize_samples, self.bits_per_sample = self.getChannelInfo()
+        self.serial_number = 12345
+        self.aborted = threading.Event()
+
+    def getChannelInfo(self):
+        return 2 ** 28, 16
+
+    def setCaptureClock(self, source, rate, edge=CLOCK_EDGE_RISING, decimation=0):
+        pass
+
+    def setExternalTrigger(self, coupling, range=ETR_5V):
+        pass
+
+    def setTriggerOperation(
+        self, operation, engine1, source1, slope1, level1, engine2, source2, slope2, level2
+    ):
+        pass
+
+    def setTriggerDelay(self, delay_samples):
+        pass
+
+    def setTriggerTimeOut(self, timeout_ticks):
+        pass
+
+    def configureAuxIO(self, mode, parameter):
+        pass
+
+    def inputControl(self, channel, coupling, inputRange, impedance):
+        pass
+
+    def setBWLimit(self, channel, enable):
+        pass
+
+    def setRecordSize(self, preTriggerSamples, postTriggerSamples):
+        pass
+
+    def beforeAsyncRead(
+        self,
+        channels,
+        transferOffset,
+        samplesPerRecord,
+        recordsPerBuffer,
+        recordsPerAcquisition,
+        flags,
+    ):
+        self.aborted.clear()
+
+    def waitNextAsyncBufferComplete(self, buffer, bytes_to_copy, timeout_ms):
+        if self.aborted.is_set():
+            raise AlazarException(
+                "Error calling function AlazarWaitNextAsyncBufferComplete: ApiDmaCalled",
+                'AlazarWaitNextAsyncBufferComplete',
+                (buffer, bytes_to_copy, timeout_ms),
+                572,
+                'ApiDmaCalled',
+            )
+        data = DMABuffer._buffers[buffer].buffer
+        n = bytes_to_copy // data.itemsize
+        data[:n] = np.arange(n) % 2 ** (8 * data.itemsize)
+
+    def abortAsyncRead(self):
+        self.aborted.set()
@@ -0,0 +1,122 @@
+#####################################################################
+#                                                                   #
+# /testing/mock_frontpanel.py                                       #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""A stand-in for the Opal Kelly FrontPanel connection to a CiceroOpalKellyXEM3001, for
+exercising CiceroOpalKellyXEM3001Worker without hardware or the ok library installed.
+To use it, provide an ok module whose okCFrontPanel returns one, e.g.:
+
+    import sys, types
+    from labscript_devices.testing.mock_frontpanel import MockFrontPanel
+    sys.modules['ok'] = types.SimpleNamespace(okCFrontPanel=MockFrontPanel)
+    worker.init()
+"""
+
+import time
+
+import numpy as np
+
+from labscript_devices.CiceroOpalKellyXEM3001 import instruction_dtype
+
+
+class MockFrontPanel(object):
+    """A stand-in for the ok.okCFrontPanel connection to an XEM3001 running the
+    Cicero firmware. Once started, the
+    emulated device runs the pulse program written to it in real time, with the nth
+    wait lasting wait_durations[n] seconds, or until it times out if this is sooner or
+    there is no such entry. Each UpdateWireOuts takes latency seconds, as a USB
+    transfer does, and the number of them is counted in wire_out_updates."""
+
+    NoError = 0
+
+    def __init__(self, clock_frequency=100e6, latency=0.001, wait_durations=()):
+        self.clock_frequency = clock_frequency
+        self.latency = latency
+        self.wait_durations = list(wait_durations)
+        self.wire_out_updates = 0
+        self.serial = None
+        self.pulse_program = None
+        self.start_time = None
+        self.aborted = False
+        self.wire_outs = {}
+
+    def OpenBySerial(self, serial):
+        self.serial = serial
+        return self.NoError
+
+    def IsFrontPanelEnabled(self):
+        return True
+
+    def ConfigureFPGA(self, path):
+        return self.NoError
+
+    def SetWireInValue(self, address, value):
+        return self.NoError
+
+    def UpdateWireIns(self):
+        return self.NoError
+
+    def WriteToPipeIn(self, address, data):
+        words = np.frombuffer(bytes(data), dtype=instruction_dtype)
+        dtypes = [('on_period', np.int64), ('off_period', np.int64), ('reps', np.int64)]
+        self.pulse_program = np.zeros(len(words), dtype=dtypes)
+        for name in self.pulse_program.dtype.names:
+            for word in words[name].T:
+                self.pulse_program[name] = (self.pulse_program[name] << 16) + word
+        return len(data)
+
+    def ActivateTriggerIn(self, address, bit):
+        if bit == 0:
+            self.start()
+        else:
+            self.start_time = None
+            self.aborted = True
+        return self.NoError
+
+    def start(self):
+        """Start running the pulse program, working out how many samples each
+        instruction generates and how many it waits for"""
+        reps = self.pulse_program['reps']
+        is_wait = reps == 0
+        self.samples = (self.pulse_program['on_period'] + self.pulse_program['off_period']) * reps
+        self.wait_samples = np.zeros(len(reps), dtype=np.int64)
+        for i, index in enumerate(np.where(is_wait)[0]):
+            # The on period of a wait is one less than its timeout:
+            timeout = self.pulse_program['on_period'][index] + 1
+            if i < len(self.wait_durations):
+                timeout = min(timeout, int(round(self.wait_durations[i] * self.clock_frequency)))
+            self.wait_samples[index] = timeout
+        durations = self.samples + self.wait_samples
+        self.instruction_starts = np.cumsum(durations) - durations
+        self.end_time = time.perf_counter() + durations.sum() / self.clock_frequency
+        self.start_time = time.perf_counter()
+        self.aborted = False
+
+    def UpdateWireOuts(self):
+        self.wire_out_updates += 1
+        time.sleep(self.latency / 2)
+        samples_generated, samples_waited, status = 0, 0, int(self.aborted) << 1
+        if self.start_time is not None:
+            cycles = int((time.perf_counter() - self.start_time) * self.clock_frequency)
+            i = np.searchsorted(self.instruction_starts, cycles, side='right') - 1
+            elapsed = cycles - self.instruction_starts[i]
+            samples_generated = self.samples[:i].sum() + min(elapsed, self.samples[i])
+            samples_waited = self.wait_samples[:i].sum() + min(elapsed, self.wait_samples[i])
+            if elapsed >= self.samples[i] + self.wait_samples[i] and i == len(self.samples) - 1:
+                status |= 1
+        for address, value in [(0x22, samples_generated), (0x26, samples_waited)]:
+            self.wire_outs[address] = int(value) & 0xFFFF
+            self.wire_outs[address + 1] = (int(value) >> 16) & 0xFFFF
+        self.wire_outs[0x25] = status
+        time.sleep(self.latency / 2)
+
+    def GetWireOutValue(self, address):
+        return self.wire_outs.get(address, 0)
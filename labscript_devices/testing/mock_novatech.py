@@ -0,0 +1,75 @@
+#####################################################################
+#                                                                   #
+# /testing/mock_novatech.py                                         #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""A stand-in for the serial connection to a NovaTech DDS9m, for exercising
+NovatechDDS9mWorker without hardware."""
+
+import time
+
+from labscript_devices.testing.mock_serial import MockSerial
+
+
+class MockNovaTechSerial(MockSerial):
+    """A stand-in for the serial connection to a NovaTech DDS9m. Commands written to it
+    are executed by an emulated device, which sends the usual responses. Each byte
+    takes as long to transmit as it would at the baud rate, and responses take an
+    additional latency to arrive, as they do via a USB serial adapter."""
+
+    def __init__(self, port=None, baudrate=115200, timeout=None, latency=0.001):
+        MockSerial.__init__(self, port, baudrate, timeout)
+        self.latency = latency
+        # Emulated device state. Frequencies are in units of 0.1 Hz:
+        self.static_values = {channel: (0, 0, 0) for channel in range(4)}
+        self.table = {}
+        # When the device will have received everything written so far:
+        self.received_time = 0
+
+    def write(self, data):
+        self.received_time = max(self.received_time, time.perf_counter())
+        for command in self.split_commands(data):
+            self.received_time += (len(command) + 2) * 10 / self.baudrate
+            response = self.execute(command.decode('utf8'))
+            arrival_time = self.received_time + len(response) * 10 / self.baudrate
+            self.queue_response(response, arrival_time + self.latency)
+        return len(data)
+
+    def execute(self, command):
+        """Execute a command on the emulated device and return its response"""
+        args = command.split()
+        try:
+            if not args or args[0] in ['e', 'I', 'm', 'Kb']:
+                pass
+            elif command[0] in 'FVP':
+                channel = int(command[1])
+                freq, phase, amp = self.static_values[channel]
+                if command[0] == 'F':
+                    freq = int(round(float(args[1]) * 1e7))
+                elif command[0] == 'V':
+                    amp = int(args[1])
+                else:
+                    phase = int(args[1])
+                self.static_values[channel] = (freq, phase, amp)
+            elif command[0] == 't':
+                freq, phase, amp, _ = args[2].split(',')
+                key = (int(command[1]), int(args[1], 16))
+                self.table[key] = (int(freq, 16), int(phase, 16), int(amp, 16))
+            elif command == 'QUE':
+                lines = [
+                    b'%08x %04x %04x 0000 0000 0000 0000\r\n' % self.static_values[i]
+                    for i in range(4)
+                ]
+                return b''.join(lines) + b'OK\r\n'
+            else:
+                raise ValueError(command)
+        except (ValueError, IndexError, KeyError):
+            return b'?0\r\n'
+        return b'OK\r\n'
@@ -0,0 +1,102 @@
+#####################################################################
+#                                                                   #
+# /testing/mock_pineblaster.py                                      #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""A stand-in for the serial connection to a PineBlaster, for exercising
+PineblasterWorker without hardware."""
+
+import time
+from collections import deque
+
+from labscript_devices.testing.mock_serial import MockSerial
+
+
+class MockPineBlasterSerial(MockSerial):
+    """A stand-in for the serial connection to a PineBlaster. Commands written to it
+    are executed by an emulated device, which takes command_time seconds to execute
+    each one, and its responses take an additional latency to arrive, as they do over
+    USB. The device takes reset_time seconds to start up, both when the connection is
+    opened and when commanded to restart, and ignores commands received in the
+    meantime."""
+
+    clock_resolution = 25e-9
+
+    def __init__(
+        self,
+        port=None,
+        baudrate=115200,
+        timeout=None,
+        latency=0.001,
+        command_time=20e-6,
+        reset_time=0.5,
+    ):
+        MockSerial.__init__(self, port, baudrate, timeout)
+        self.latency = latency
+        self.command_time = command_time
+        self.reset_time = reset_time
+        # Emulated device state:
+        self.program = {}
+        self.output = 0
+        # When the device will have executed everything written so far:
+        self.executed_time = 0
+        # When the device will have started up:
+        self.ready_time = time.perf_counter() + reset_time
+
+    def write(self, data):
+        self.executed_time = max(self.executed_time, time.perf_counter())
+        for command in self.split_commands(data):
+            if self.executed_time < self.ready_time:
+                # Still starting up:
+                continue
+            self.executed_time += self.command_time
+            if command == b'restart':
+                self.restart()
+                continue
+            self.respond(self.execute(command.decode('utf8')), self.executed_time)
+            if command in [b'start', b'hwstart']:
+                # The run starts immediately, and is done after its duration:
+                self.respond(b'done\r\n', self.executed_time + self.run_duration())
+        return len(data)
+
+    def restart(self):
+        """Clear the device state and any responses not yet sent, and start up again"""
+        self.program = {}
+        self.output = 0
+        sent = [r for r in self.responses if r[0] <= self.executed_time + self.latency]
+        self.responses = deque(sent)
+        self.ready_time = self.executed_time + self.reset_time
+
+    def respond(self, response, time_sent):
+        return self.queue_response(response, time_sent + self.latency)
+
+    def execute(self, command):
+        """Execute a command on the emulated device and return its response"""
+        args = command.split()
+        if command == 'hello':
+            return b'hello\r\n'
+        elif command in ['go high', 'go low']:
+            self.output = int(command == 'go high')
+        elif args and args[0] == 'set' and len(args) == 4:
+            index, period, reps = (int(arg) for arg in args[1:])
+            self.program[index] = (period, reps)
+        elif command not in ['start', 'hwstart']:
+            return b'invalid command\r\n'
+        return b'ok\r\n'
+
+    def run_duration(self):
+        """The duration of the programmed run, ignoring waits"""
+        duration = 0
+        for index in range(len(self.program)):
+            period, reps = self.program.get(index, (0, 0))
+            if period == 0 and reps == 0:
+                break
+            duration += period * reps * self.clock_resolution
+        return duration
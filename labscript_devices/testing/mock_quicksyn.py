@@ -0,0 +1,74 @@
+#####################################################################
+#                                                                   #
+# /testing/mock_quicksyn.py                                         #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""A stand-in for the serial connection to a PhaseMatrix QuickSyn, for exercising
+QuickSynWorker without hardware."""
+
+import time
+
+from labscript_devices.testing.mock_serial import MockSerial
+
+
+class MockQuickSynSerial(MockSerial):
+    """A stand-in for the serial connection to a QuickSyn. Commands written to it are
+    executed by an emulated device, which takes latency seconds to process each command
+    and respond. Like the real device, it ignores commands received whilst it is still
+    processing the previous one. These are counted in self.dropped_commands."""
+
+    terminator = b'\r'
+
+    def __init__(self, port=None, baudrate=115200, timeout=None, latency=0.005):
+        MockSerial.__init__(self, port, baudrate, timeout)
+        self.latency = latency
+        # Emulated device state. Frequency is in mHz:
+        self.freq = 10**12
+        self.output = 0
+        self.reference = 'EXT'
+        # External reference present, and both locks acquired:
+        self.status = 0x01
+        self.temperature = 35.0
+        self.dropped_commands = 0
+        # When the device will be ready to accept another command:
+        self.ready_time = 0
+
+    def write(self, data):
+        for command in self.split_commands(data):
+            now = time.perf_counter()
+            if now < self.ready_time:
+                self.dropped_commands += 1
+                continue
+            self.ready_time = now + self.latency
+            response = self.execute(command.decode('utf8'))
+            if response:
+                self.queue_response(response, self.ready_time)
+        return len(data)
+
+    def execute(self, command):
+        """Execute a command on the emulated device and return its response, if any"""
+        args = command.split()
+        if command == 'FREQ?':
+            return b'%d\n' % self.freq
+        elif command == 'OUTP:STAT?':
+            return b'ON\n' if self.output else b'OFF\n'
+        elif command == 'STAT?':
+            return b'%02X\n' % (self.status | self.output << 3)
+        elif command == 'DIAG:MEAS? 21':
+            return b'%.1f\n' % self.temperature
+        elif command == 'ROSC:SOUR?':
+            return self.reference.encode('utf8') + b'\n'
+        elif args[0] == 'FREQ':
+            self.freq = int(args[1])
+        elif args[0] == 'OUTP:STAT':
+            self.output = int(args[1])
+        elif args[0] == 'ROSC:SOUR':
+            self.reference = args[1]
+        return b''
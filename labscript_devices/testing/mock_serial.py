@@ -0,0 +1,134 @@
+#####################################################################
+#                                                                   #
+# /testing/mock_serial.py                                           #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""A base class for stand-ins for serial.Serial, for exercising the BLACS workers of
+serial devices without hardware. Subclasses emulate a device by implementing write(),
+executing the commands written and passing each response to queue_response() along
+with the time it arrives at the computer. The reading methods of serial.Serial then
+return responses only once they have arrived, waiting for them up to the timeout as
+pyserial does.
+
+For example, to connect a worker to an emulated NovaTech DDS9m:
+
+    import serial
+    from labscript_devices.testing.mock_novatech import MockNovaTechSerial
+    serial.Serial = MockNovaTechSerial
+    worker.init()
+"""
+
+import time
+from collections import deque
+
+
+class MockSerial(object):
+    """A stand-in for serial.Serial. Responses queued by the emulated device are
+    returned by the reading methods once their arrival time has passed. If a read asks
+    for more than has arrived, it waits for further responses until the timeout
+    elapses, or returns what has arrived if there are no further responses in transit
+    and no timeout, rather than blocking forever."""
+
+    # The bytes terminating each command written to the device, for split_commands:
+    terminator = b'\r\n'
+
+    def __init__(self, port=None, baudrate=115200, timeout=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.writeTimeout = None
+        # pyserial opens the port on construction if one is given:
+        self.is_open = port is not None
+        # Every command received, for tests to inspect:
+        self.commands = []
+        self.partial_command = b''
+        self.n_reads = 0
+        # Responses in transit, each with the time it arrives, and those arrived:
+        self.responses = deque()
+        self.buffer = bytearray()
+
+    def split_commands(self, data):
+        """Return the complete commands in data, keeping any incomplete command at the
+        end until the rest of it is written, and add them to self.commands"""
+        data = self.partial_command + bytes(data)
+        *commands, self.partial_command = data.split(self.terminator)
+        self.commands.extend(commands)
+        return commands
+
+    def queue_response(self, response, arrival_time):
+        """Send a response from the emulated device, to arrive at the given
+        time.perf_counter() time. Return the entry added to self.responses, which may
+        be removed from it to cancel the response before it arrives."""
+        entry = (arrival_time, response)
+        self.responses.append(entry)
+        # Keep responses in order of arrival:
+        if len(self.responses) > 1 and self.responses[-2][0] > arrival_time:
+            self.responses = deque(sorted(self.responses, key=lambda r: r[0]))
+        return entry
+
+    def open(self):
+        self.is_open = True
+
+    def isOpen(self):
+        return self.is_open
+
+    def close(self):
+        self.is_open = False
+
+    def flushInput(self):
+        self.responses.clear()
+        self.buffer = bytearray()
+
+    def flushOutput(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        self._receive()
+        return len(self.buffer)
+
+    def _receive(self):
+        now = time.perf_counter()
+        while self.responses and self.responses[0][0] <= now:
+            self.buffer += self.responses.popleft()[1]
+
+    def read(self, size=1):
+        return self._read(lambda buffer: size if len(buffer) >= size else None)
+
+    def readline(self):
+        return self._read(lambda buffer: buffer.find(b'\n') + 1 or None)
+
+    def readlines(self):
+        return self._read(lambda buffer: None).splitlines(True)
+
+    def _read(self, end_of_data):
+        """Wait for responses to arrive until end_of_data(buffer) returns the number of
+        bytes to return, or until the timeout elapses"""
+        self.n_reads += 1
+        if self.timeout is not None:
+            deadline = time.perf_counter() + self.timeout
+        else:
+            deadline = None
+        while True:
+            self._receive()
+            now = time.perf_counter()
+            end = end_of_data(self.buffer)
+            if end is None:
+                wake_times = [t for t in [deadline] if t is not None]
+                if self.responses:
+                    wake_times.append(self.responses[0][0])
+                if not wake_times or (deadline is not None and now >= deadline):
+                    end = len(self.buffer)
+                else:
+                    time.sleep(max(0, min(wake_times) - now))
+                    continue
+            data = bytes(self.buffer[:end])
+            del self.buffer[:end]
+            return data
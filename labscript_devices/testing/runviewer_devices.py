@@ -0,0 +1,61 @@
+#####################################################################
+#                                                                   #
+# /testing/runviewer_devices.py                                     #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Stand-ins for the connection table entries that runviewer passes to the runviewer
+parsers of devices, for exercising the parsers without a connection table. For
+example:
+
+    from labscript_devices.PulseBlaster import PulseBlasterParser
+    from labscript_devices.testing.runviewer_devices import make_pulseblaster_device
+    parser = PulseBlasterParser(h5_filepath, make_pulseblaster_device('pulseblaster'))
+    parser.get_traces(add_trace)
+"""
+
+from types import SimpleNamespace
+
+
+def connection(name, device_class, parent_port, children=()):
+    """Return a stand-in for a connection table entry, with the given children"""
+    child_list = {child.name: child for child in children}
+    return SimpleNamespace(
+        name=name,
+        device_class=device_class,
+        parent_port=parent_port,
+        child_list=child_list,
+    )
+
+
+def make_pulseblaster_device(name):
+    """Return a stand-in for the connection table entry of a PulseBlaster with a clock
+    line on flag 0, and all other flags and both DDSs in use as direct outputs"""
+    outputs = [connection('do%d' % i, 'DigitalOut', 'flag %d' % i) for i in range(1, 12)]
+    for i in range(2):
+        subchannels = [
+            connection('dds%d_%s' % (i, sub), 'AnalogOut', sub)
+            for sub in ['freq', 'amp', 'phase']
+        ]
+        outputs.append(connection('dds%d' % i, 'DDS', 'dds %d' % i, subchannels))
+    direct_outputs = connection(
+        'direct_outputs', 'PulseBlasterDirectOutputs', 'internal', outputs
+    )
+    pseudoclock = connection(
+        '%s_pseudoclock' % name,
+        'Pseudoclock',
+        'clock',
+        [
+            connection('clock_line', 'ClockLine', 'flag 0'),
+            connection(
+                'direct_output_clock_line', 'ClockLine', 'internal', [direct_outputs]
+            ),
+        ],
+    )
+    return connection(name, 'PulseBlaster', None, [pseudoclock])
@@ -0,0 +1,121 @@
+#####################################################################
+#                                                                   #
+# /tests/test_CiceroOpalKellyXEM3001_packing.py                     #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that instructions_to_bytes packs the PULSE_PROGRAM of a CiceroOpalKellyXEM3001
+into the same bytes as packing each instruction in a Python loop, as was done
+previously, including at the full 48, 48 and 32 bit widths of the on_period,
+off_period and reps fields, and that unpacking them gives back the pulse program."""
+
+import numpy as np
+import pytest
+
+from labscript_devices.CiceroOpalKellyXEM3001 import (
+    instruction_dtype,
+    instructions_to_bytes,
+)
+
+DTYPES = [('on_period', np.int64), ('off_period', np.int64), ('reps', np.int64)]
+MAX_ON_PERIOD = MAX_OFF_PERIOD = 2 ** 48 - 1
+MAX_REPS = 2 ** 32 - 1
+
+
+def int_to_bytes(n, m):
+    """Part of the previous implementation, for comparison"""
+    return [(n >> (i * 8)) & 0xFF for i in range(m - 1, -1, -1)]
+
+
+def add_instruction_to_bytearray(data, instruction, on, off, reps):
+    """The previous implementation of packing an instruction, for comparison"""
+    on_period = int_to_bytes(on, 6)
+    off_period = int_to_bytes(off, 6)
+    reps = int_to_bytes(reps, 4)
+    offset = 16 * instruction
+    data[offset + 0] = on_period[1]
+    data[offset + 1] = on_period[0]
+    data[offset + 2] = on_period[3]
+    data[offset + 3] = on_period[2]
+    data[offset + 4] = on_period[5]
+    data[offset + 5] = on_period[4]
+    data[offset + 6] = off_period[1]
+    data[offset + 7] = off_period[0]
+    data[offset + 8] = off_period[3]
+    data[offset + 9] = off_period[2]
+    data[offset + 10] = off_period[5]
+    data[offset + 11] = off_period[4]
+    data[offset + 12] = reps[1]
+    data[offset + 13] = reps[0]
+    data[offset + 14] = reps[3]
+    data[offset + 15] = reps[2]
+
+
+def instructions_to_bytes_loop(pulse_program):
+    data = bytearray(len(pulse_program) * 16)
+    for i, instruction in enumerate(pulse_program):
+        add_instruction_to_bytearray(
+            data,
+            i,
+            instruction['on_period'],
+            instruction['off_period'],
+            instruction['reps'],
+        )
+    return data
+
+
+def bytes_to_instructions(data):
+    """Unpack bytes written to the FPGA back into a pulse program"""
+    words = np.frombuffer(data, dtype=instruction_dtype)
+    pulse_program = np.zeros(len(words), dtype=DTYPES)
+    for name in pulse_program.dtype.names:
+        for word in words[name].T:
+            pulse_program[name] = (pulse_program[name] << 16) + word
+    return pulse_program
+
+
+def random_program(n_instructions, seed=0):
+    """Return a pulse program with values spanning the full width of each field"""
+    rng = np.random.RandomState(seed)
+    pulse_program = np.zeros(n_instructions, dtype=DTYPES)
+    for name, maximum in [
+        ('on_period', MAX_ON_PERIOD),
+        ('off_period', MAX_OFF_PERIOD),
+        ('reps', MAX_REPS),
+    ]:
+        pulse_program[name] = rng.randint(0, maximum + 1, n_instructions, dtype=np.int64)
+    return pulse_program
+
+
+def extreme_program():
+    """Return a pulse program of the extremes of each field, and of each bit of each
+    field set alone, so that misplaced bits, bytes and words are told apart"""
+    instructions = [
+        (MAX_ON_PERIOD, MAX_OFF_PERIOD, MAX_REPS),
+        (0, 0, 0),
+        (MAX_ON_PERIOD, 0, MAX_REPS),
+        (0, MAX_OFF_PERIOD, 0),
+        (1, 2, 0),
+    ]
+    for bit in range(48):
+        instructions.append((1 << bit, 1 << (47 - bit), 1 << (bit % 32)))
+    return np.array(instructions, dtype=DTYPES)
+
+
+@pytest.mark.parametrize(
+    'pulse_program',
+    [random_program(1000), extreme_program(), np.zeros(0, dtype=DTYPES)],
+    ids=['random', 'extremes', 'empty'],
+)
+def test_instructions_to_bytes(pulse_program):
+    data = instructions_to_bytes(pulse_program)
+    assert isinstance(data, bytearray)
+    assert len(data) == 16 * len(pulse_program)
+    assert data == instructions_to_bytes_loop(pulse_program)
+    assert np.array_equal(bytes_to_instructions(data), pulse_program)
@@ -0,0 +1,161 @@
+#####################################################################
+#                                                                   #
+# /tests/test_NI_DAQmx_output_task_reuse.py                         #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that NI_DAQmxOutputWorker reuses its buffered output tasks between shots with
+unchanged output tables, and creates and programs new ones when a table changes or a
+shot is aborted. The workers use the stand-in for PyDAQmx in mock_daqmx, so neither
+PyDAQmx nor the NI-DAQmx library is required."""
+
+import collections
+import importlib
+import logging
+import sys
+
+import numpy as np
+import pytest
+import labscript_utils.h5_lock
+import h5py
+
+from labscript_devices.NI_DAQmx.testing import mock_daqmx
+from labscript_devices.NI_DAQmx.testing.mock_daqmx import MockTask
+
+DEVICE_NAME = 'ni_card'
+INITIAL_VALUES = {'ao0': 0.0, 'ao1': 0.0}
+INITIAL_VALUES.update({'port0/line%d' % i: 0 for i in range(8)})
+
+
+def write_shot(path, AO_values):
+    """Write a shot file with AO and DO tables for the device, with the AO channels
+    taking the given values in turn"""
+    AO_table = np.zeros(len(AO_values), dtype=[('ao0', float), ('ao1', float)])
+    AO_table['ao0'] = AO_values
+    AO_table['ao1'] = -np.array(AO_values)
+    DO_table = np.zeros(len(AO_values), dtype=[('port0', np.uint32)])
+    DO_table['port0'] = np.arange(len(AO_values)) % 256
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/' + DEVICE_NAME)
+        group.create_dataset('AO', data=AO_table)
+        group.create_dataset('DO', data=DO_table)
+    return str(path)
+
+
+@pytest.fixture
+def blacs_workers(monkeypatch):
+    """The NI_DAQmx blacs_workers module, imported with the stand-in for PyDAQmx"""
+    for name, module in mock_daqmx.pydaqmx_modules().items():
+        monkeypatch.setitem(sys.modules, name, module)
+    for name in ['blacs_workers', 'daqmx_utils']:
+        monkeypatch.delitem(sys.modules, 'labscript_devices.NI_DAQmx.' + name, False)
+    return importlib.import_module('labscript_devices.NI_DAQmx.blacs_workers')
+
+
+@pytest.fixture
+def worker(blacs_workers):
+    worker = object.__new__(blacs_workers.NI_DAQmxOutputWorker)
+    worker.device_name = DEVICE_NAME
+    worker.MAX_name = 'Dev1'
+    worker.Vmin = -10.0
+    worker.Vmax = 10.0
+    worker.num_AO = 2
+    worker.ports = {'port0': {'num_lines': 8, 'supports_buffered': True}}
+    worker.clock_limit = 1e6
+    worker.clock_terminal = '/Dev1/PFI0'
+    worker.clock_mirror_terminal = None
+    worker.static_AO = False
+    worker.static_DO = False
+    worker.wait_timeout_device = None
+    worker.logger = logging.getLogger(__name__)
+    worker.init()
+    return worker
+
+
+def buffered_calls(worker, h5file, fresh=False):
+    """Run a shot, returning the calls to DAQmx made in transition_to_buffered"""
+    MockTask.reset_calls()
+    worker.transition_to_buffered(DEVICE_NAME, h5file, INITIAL_VALUES, fresh)
+    calls = collections.Counter(MockTask.calls)
+    worker.transition_to_manual()
+    return calls
+
+
+def assert_programmed(calls):
+    """Assert new AO and DO tasks were created and programmed"""
+    assert calls['Task'] == 2
+    assert calls['CreateAOVoltageChan'] == 1
+    assert calls['CreateDOChan'] == 1
+    assert calls['CfgSampClkTiming'] == 2
+    assert calls['WriteAnalogF64'] == 1
+    assert calls['WriteDigitalU32'] == 1
+
+
+def assert_reused(calls):
+    """Assert the AO and DO tasks of the previous shot were restarted as they were"""
+    assert calls['Task'] == 0
+    assert calls['CreateAOVoltageChan'] == 0
+    assert calls['CreateDOChan'] == 0
+    assert calls['CfgSampClkTiming'] == 0
+    assert calls['WriteAnalogF64'] == 0
+    assert calls['WriteDigitalU32'] == 0
+    assert calls['StartTask'] == 2
+
+
+def test_identical_shots_reuse_tasks(worker, tmp_path):
+    h5file = write_shot(tmp_path / 'shot.h5', [1.0, 2.0, 3.0, 3.0])
+    assert_programmed(buffered_calls(worker, h5file, fresh=True))
+    AO_task = worker.smart_cache['AO_task']
+    assert_reused(buffered_calls(worker, h5file))
+    assert worker.smart_cache['AO_task'] is AO_task
+    assert worker.output_table_unchanged('AO', worker.smart_cache['AO_table'])
+
+
+def test_fresh_shot_reprograms_tasks(worker, tmp_path):
+    h5file = write_shot(tmp_path / 'shot.h5', [1.0, 2.0, 3.0, 3.0])
+    buffered_calls(worker, h5file, fresh=True)
+    assert_programmed(buffered_calls(worker, h5file, fresh=True))
+
+
+def test_changed_table_reprograms_only_its_task(worker, tmp_path):
+    h5file = write_shot(tmp_path / 'shot.h5', [1.0, 2.0, 3.0, 3.0])
+    buffered_calls(worker, h5file, fresh=True)
+    DO_task = worker.smart_cache['DO_task']
+    # Same DO table, different AO table:
+    h5file = write_shot(tmp_path / 'changed.h5', [1.0, 2.5, 3.0, 3.0])
+    calls = buffered_calls(worker, h5file)
+    assert calls['Task'] == 1
+    assert calls['CreateAOVoltageChan'] == 1
+    assert calls['CreateDOChan'] == 0
+    assert calls['CfgSampClkTiming'] == 1
+    assert calls['WriteAnalogF64'] == 1
+    assert calls['WriteDigitalU32'] == 0
+    assert worker.smart_cache['DO_task'] is DO_task
+    np.testing.assert_array_equal(
+        worker.smart_cache['AO_task'].written_data, [[1.0, -1.0], [2.5, -2.5], [3.0, -3.0]]
+    )
+
+
+def test_aborted_shot_clears_cached_tasks(worker, tmp_path):
+    h5file = write_shot(tmp_path / 'shot.h5', [1.0, 2.0, 3.0, 3.0])
+    buffered_calls(worker, h5file, fresh=True)
+    worker.transition_to_buffered(DEVICE_NAME, h5file, INITIAL_VALUES, False)
+    MockTask.reset_calls()
+    worker.abort_buffered()
+    # Both buffered tasks are cleared rather than stopped, and the initial values
+    # written to the new manual mode tasks:
+    assert MockTask.calls['StopTask'] == 0
+    assert MockTask.calls['ClearTask'] == 2
+    assert MockTask.calls['WriteAnalogF64'] == 1
+    assert MockTask.calls['WriteDigitalU32'] == 1
+    for name in ['AO', 'DO']:
+        assert worker.smart_cache[name + '_task'] is None
+        assert worker.smart_cache[name + '_table'] is None
+    # So the next shot programs new tasks, despite its tables being unchanged:
+    assert_programmed(buffered_calls(worker, h5file))
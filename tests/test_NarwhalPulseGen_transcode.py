@@ -0,0 +1,112 @@
+#####################################################################
+#                                                                   #
+# /tests/test_NarwhalPulseGen_transcode.py                          #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that the batched NarwhalPulseGen encoding and decoding functions in transcode
+agree with the message formats, and with the functions encoding or decoding one message
+at a time."""
+
+import numpy as np
+import pytest
+
+from labscript_devices.NarwhalPulseGen import transcode
+from labscript_devices.NarwhalPulseGen.testing.mock_narwhal import (
+    MockNarwhalPulseGenSerial,
+)
+
+FLAGS = ['stop_and_wait', 'hardware_trig_out', 'notify_computer', 'powerline_sync']
+
+
+def random_instructions(rng, n_instructions):
+    """Return a table of random instructions at consecutive addresses, with each other
+    field spanning its full range in the message format"""
+    instructions = np.zeros(n_instructions, dtype=transcode.instruction_dtype)
+    instructions['address'] = np.arange(n_instructions)
+    instructions['state'] = rng.randint(0, 2 ** 24, n_instructions)
+    instructions['duration'] = rng.randint(1, 2 ** 48, n_instructions, dtype=np.int64)
+    instructions['goto_address'] = rng.randint(0, 2 ** 16, n_instructions)
+    instructions['goto_counter'] = rng.randint(0, 2 ** 32, n_instructions, dtype=np.int64)
+    for name in FLAGS:
+        instructions[name] = rng.randint(0, 2, n_instructions)
+    return instructions
+
+
+def decode_instructions(data):
+    """Decode instruction messages back to a table of instructions"""
+    messages = np.frombuffer(data, dtype=transcode.instruction_message_dtype)
+    instructions = np.zeros(len(messages), dtype=transcode.instruction_dtype)
+    for name in ['address', 'goto_address', 'goto_counter']:
+        instructions[name] = messages[name]
+    for name, n_bytes in [('state', 3), ('duration', 6)]:
+        padded = np.zeros((len(messages), 8), dtype=np.uint8)
+        padded[:, :n_bytes] = messages[name]
+        instructions[name] = padded.view('<u8')[:, 0]
+    for bit, name in enumerate(FLAGS):
+        instructions[name] = (messages['tags'] >> bit) & 1
+    assert (messages['identifier'] == transcode.msgout_identifier['load_ram']).all()
+    return instructions
+
+
+def random_devicestates(rng, n_messages):
+    """Return a stream of random device state messages, with valid tags"""
+    messages = rng.randint(0, 256, (n_messages, 17)).astype(np.uint8)
+    messages[:, 0] = transcode.msgin_identifier['devicestate']
+    # Tags of 6 bits, without the undefined trigger mode 3:
+    tags = rng.randint(0, 2 ** 6, n_messages).astype(np.uint8)
+    tags[(tags >> 1) & 0b11 == 3] &= ~np.uint8(0b110)
+    messages[:, 14] = tags
+    return messages.tobytes()
+
+
+@pytest.mark.parametrize('n_instructions', [0, 1, 200])
+def test_encode_instructions_round_trip(n_instructions):
+    instructions = random_instructions(np.random.RandomState(n_instructions), n_instructions)
+    data = transcode.encode_instructions(instructions)
+    assert len(data) == 19 * n_instructions
+    np.testing.assert_array_equal(decode_instructions(data), instructions)
+
+
+def test_encode_instructions_matches_encode_instruction():
+    instructions = random_instructions(np.random.RandomState(0), 200)
+    expected = b''.join(
+        transcode.encode_instruction(
+            **{name: instruction[name].item() for name in transcode.instruction_dtype.names}
+        )
+        for instruction in instructions
+    )
+    assert transcode.encode_instructions(instructions) == expected
+
+
+def test_encoded_instructions_load_into_device_memory():
+    instructions = random_instructions(np.random.RandomState(1), 200)
+    connection = MockNarwhalPulseGenSerial('COM1', write_latency=0)
+    connection.write(transcode.encode_instructions(instructions))
+    np.testing.assert_array_equal(connection.ram[:len(instructions)], instructions)
+
+
+@pytest.mark.parametrize('n_messages', [0, 1, 200])
+def test_decode_devicestates_matches_decode_devicestate(n_messages):
+    messages = random_devicestates(np.random.RandomState(n_messages), n_messages)
+    decoded = transcode.decode_devicestates(messages)
+    assert len(decoded) == n_messages
+    for i, row in enumerate(decoded):
+        # decode_devicestate takes the message without its identifier:
+        expected = transcode.decode_devicestate(messages[17 * i + 1 : 17 * (i + 1)])
+        np.testing.assert_array_equal(row['state'], expected.pop('state:'))
+        for name, value in expected.items():
+            assert row[name] == value, name
+
+
+def test_decode_devicestates_rejects_partial_messages():
+    messages = random_devicestates(np.random.RandomState(0), 10)
+    for bad_messages in [messages[:-1], bytes([100]) + messages[1:]]:
+        with pytest.raises(ValueError):
+            transcode.decode_devicestates(bad_messages)
@@ -0,0 +1,120 @@
+#####################################################################
+#                                                                   #
+# /tests/test_NarwhalPulseGen_upload.py                             #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that NarwhalPulseGenWorker uploads a shot's instructions to the device in a
+single write, resending only those that changed since the previous shot, using
+MockNarwhalPulseGenSerial in place of the device."""
+
+import time
+
+import numpy as np
+import pytest
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties as properties
+
+from labscript_devices.NarwhalPulseGen import transcode
+from labscript_devices.NarwhalPulseGen.testing.mock_narwhal import make_worker
+
+DEVICE_NAME = 'narwhal'
+N_INSTRUCTIONS = 5000
+MESSAGE_SIZE = transcode.instruction_message_dtype.itemsize
+
+
+def write_shot(path, instructions):
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/' + DEVICE_NAME)
+        group.create_dataset('PULSE_PROGRAM', data=instructions)
+        properties.set_attributes(
+            group, {'stop_time': 1.0, 'is_master_pseudoclock': True}
+        )
+    return path
+
+
+def random_instructions(rng, n_instructions):
+    """Return a table of instructions at consecutive addresses with random states and
+    durations, and no loops"""
+    instructions = np.zeros(n_instructions, dtype=transcode.instruction_dtype)
+    instructions['address'] = np.arange(n_instructions)
+    instructions['state'] = rng.randint(0, 2 ** 24, n_instructions)
+    instructions['duration'] = rng.randint(1, 1000, n_instructions)
+    return instructions
+
+
+def upload(worker, path, fresh):
+    """Run transition_to_buffered, returning the number of instructions written to the
+    device, the number of writes, and the time taken"""
+    device = worker.ser
+    bytes_written, n_writes = device.bytes_written, device.n_writes
+    start_time = time.perf_counter()
+    worker.transition_to_buffered(DEVICE_NAME, path, {}, fresh)
+    duration = time.perf_counter() - start_time
+    # Device options, and the actions requesting the device state and enabling the run:
+    other_bytes = sum(device.msgout_length[i] for i in [154, 152, 152])
+    n_bytes = device.bytes_written - bytes_written - other_bytes
+    assert n_bytes % MESSAGE_SIZE == 0
+    return n_bytes // MESSAGE_SIZE, device.n_writes - n_writes, duration
+
+
+@pytest.fixture
+def worker():
+    return make_worker()
+
+
+@pytest.fixture
+def instructions():
+    return random_instructions(np.random.RandomState(0), N_INSTRUCTIONS)
+
+
+def test_upload_round_trip(worker, instructions, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), instructions)
+    n_uploaded, n_writes, duration = upload(worker, path, fresh=True)
+    assert n_uploaded == len(instructions)
+    np.testing.assert_array_equal(worker.ser.instructions(), instructions)
+    # All instructions in a single write, so the upload is limited only by the link:
+    assert n_writes == 4
+    link_time = worker.ser.transfer_time(bytes(n_uploaded * MESSAGE_SIZE))
+    assert duration < 2 * link_time + 0.05
+
+
+def test_unchanged_instructions_not_resent(worker, instructions, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), instructions)
+    upload(worker, path, fresh=True)
+    n_uploaded, _, _ = upload(worker, path, fresh=False)
+    assert n_uploaded == 0
+    np.testing.assert_array_equal(worker.ser.instructions(), instructions)
+    n_uploaded, _, _ = upload(worker, path, fresh=True)
+    assert n_uploaded == len(instructions)
+
+
+def test_changed_instructions_resent(worker, instructions, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), instructions)
+    upload(worker, path, fresh=True)
+    changed = np.random.RandomState(1).choice(len(instructions), 10, replace=False)
+    instructions['duration'][changed] += 1
+    # A shorter table, ending with a changed instruction:
+    instructions = instructions[:-100]
+    instructions['state'][-1] ^= 1
+    write_shot(path, instructions)
+    n_uploaded, _, _ = upload(worker, path, fresh=False)
+    assert n_uploaded == len(set(changed[changed < len(instructions)]) | {len(instructions) - 1})
+    np.testing.assert_array_equal(worker.ser.instructions(), instructions)
+
+
+def test_aborted_upload_resends_all(worker, instructions, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), instructions)
+    upload(worker, path, fresh=True)
+    worker.abort_transition_to_buffered()
+    # The device's memory is unknown, so nothing can be skipped:
+    n_uploaded, _, _ = upload(worker, path, fresh=False)
+    assert n_uploaded == len(instructions)
+    np.testing.assert_array_equal(worker.ser.instructions(), instructions)
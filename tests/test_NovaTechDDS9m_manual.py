@@ -0,0 +1,95 @@
+#####################################################################
+#                                                                   #
+# /tests/test_NovaTechDDS9m_manual.py                               #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that NovatechDDS9mWorker sends only the commands needed to apply changes made
+on the front panel, using MockNovaTechSerial in place of the device."""
+
+import logging
+
+import pytest
+import serial
+import labscript_utils.h5_lock
+import h5py
+
+from labscript_devices.NovaTechDDS9M import NovatechDDS9mWorker
+from labscript_devices.testing.mock_novatech import MockNovaTechSerial
+
+
+def front_panel_values():
+    return {
+        'channel %d' % i: {'freq': 10e6 * (i + 1), 'amp': 1.0, 'phase': 0.0}
+        for i in range(4)
+    }
+
+
+def sent_commands(worker):
+    """Return the commands written to the device since the last call, other than the
+    query program_manual uses to read back the output values"""
+    commands = [c for c in worker.connection.commands if c != b'QUE']
+    worker.connection.commands = []
+    return commands
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setattr(serial, 'Serial', MockNovaTechSerial)
+    worker = object.__new__(NovatechDDS9mWorker)
+    worker.com_port = 'COM1'
+    worker.baud_rate = 115200
+    worker.default_baud_rate = None
+    worker.phase_mode = 'continuous'
+    worker.update_mode = 'synchronous'
+    worker.logger = logging.getLogger(__name__)
+    worker.init()
+    worker.program_manual(front_panel_values())
+    sent_commands(worker)
+    return worker
+
+
+def test_unchanged_values_send_nothing(worker):
+    worker.program_manual(front_panel_values())
+    assert sent_commands(worker) == []
+
+
+@pytest.mark.parametrize(
+    'channel, subchannel, value, command',
+    [
+        (0, 'freq', 12.5e6, b'F0 12.5000000'),
+        (1, 'amp', 0.5, b'V1 512'),
+        (3, 'phase', 90.0, b'P3 4096'),
+    ],
+)
+def test_single_change_sends_one_command(worker, channel, subchannel, value, command):
+    values = front_panel_values()
+    values['channel %d' % channel][subchannel] = value
+    remote_values = worker.program_manual(values)
+    assert sent_commands(worker) == [command]
+    assert remote_values['channel %d' % channel][subchannel] == pytest.approx(
+        value, rel=1e-3
+    )
+    worker.program_manual(values)
+    assert sent_commands(worker) == []
+
+
+def test_values_resent_after_shot(worker, tmp_path):
+    # The device's outputs may have been changed by the shot, so each value must be
+    # sent again after it, even if unchanged:
+    path = str(tmp_path / 'shot.h5')
+    with h5py.File(path, 'w') as f:
+        f.create_group('devices/novatech')
+    worker.transition_to_buffered('novatech', path, front_panel_values(), True)
+    sent_commands(worker)
+    worker.abort_transition_to_buffered()
+    worker.program_manual(front_panel_values())
+    commands = [c.split()[0] for c in sent_commands(worker)]
+    setpoints = [c for c in commands if c[:1] in [b'F', b'V', b'P']]
+    assert sorted(setpoints) == sorted(b'%s%d' % (c, i) for c in [b'F', b'V', b'P'] for i in range(4))
@@ -0,0 +1,112 @@
+#####################################################################
+#                                                                   #
+# /tests/test_PineBlaster_abort.py                                  #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that aborting a PineblasterWorker returns promptly once the device has
+restarted and forgets the programmed instructions, and that waiting for a device that
+does not start up times out, using MockPineBlasterSerial in place of the device."""
+
+import time
+
+import numpy as np
+import pytest
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+import serial
+
+from labscript_devices.PineBlaster import PineblasterWorker
+from labscript_devices.testing.mock_pineblaster import MockPineBlasterSerial
+
+DEVICE_NAME = 'pineblaster'
+LATENCY = 0.001
+RESET_TIME = 0.2
+N_INSTRUCTIONS = 100
+
+
+def write_shot_file(path, pulse_program):
+    with h5py.File(path, 'w') as f:
+        group = f.create_group('devices/' + DEVICE_NAME)
+        group.create_dataset('PULSE_PROGRAM', data=pulse_program)
+        properties = {'is_master_pseudoclock': True, 'stop_time': 1.0}
+        labscript_utils.properties.set_device_properties(f, DEVICE_NAME, properties)
+    return path
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """An initialised PineblasterWorker connected to a MockPineBlasterSerial, without
+    starting a worker process"""
+    monkeypatch.setattr(
+        serial,
+        'Serial',
+        lambda *args, **kwargs: MockPineBlasterSerial(
+            *args, latency=LATENCY, reset_time=RESET_TIME, **kwargs
+        ),
+    )
+    worker = object.__new__(PineblasterWorker)
+    worker.usbport = 'COM1'
+    worker.init()
+    return worker
+
+
+@pytest.fixture
+def shot(tmp_path):
+    rng = np.random.RandomState(0)
+    pulse_program = np.zeros(N_INSTRUCTIONS, dtype=[('period', int), ('reps', int)])
+    pulse_program['period'][:-1] = rng.randint(4, 400, N_INSTRUCTIONS - 1)
+    pulse_program['reps'][:-1] = rng.randint(1, 10, N_INSTRUCTIONS - 1)
+    return write_shot_file(str(tmp_path / 'shot.h5'), pulse_program)
+
+
+def test_abort(worker, shot):
+    worker.transition_to_buffered(DEVICE_NAME, shot, {}, True)
+    assert len(worker.pineblaster.program) == N_INSTRUCTIONS
+    assert worker.smart_cache is not None
+
+    start_time = time.perf_counter()
+    assert worker.abort_transition_to_buffered()
+    duration = time.perf_counter() - start_time
+    # The device restarts and responds to the next greeting, at most
+    # max_greeting_interval later, and then we wait one more greeting_interval for any
+    # stray responses:
+    max_duration = (
+        RESET_TIME + worker.max_greeting_interval + worker.greeting_interval
+    )
+    assert RESET_TIME <= duration < max_duration + 2 * LATENCY + 0.05
+    assert worker.pineblaster.program == {}
+    # The restarted device has forgotten its program, so the next shot reprograms all
+    # of it:
+    assert worker.smart_cache is None
+    n_commands = len(worker.pineblaster.commands)
+    worker.transition_to_buffered(DEVICE_NAME, shot, {}, False)
+    n_set = sum(
+        command.startswith(b'set')
+        for command in worker.pineblaster.commands[n_commands:]
+    )
+    assert n_set == N_INSTRUCTIONS
+
+
+def test_wait_until_ready_timeout(worker):
+    worker.startup_timeout = 0.5
+    # Restart the device, which then takes longer than the timeout to start up:
+    worker.pineblaster.reset_time = 10
+    worker.pineblaster.write(b'restart\r\n')
+    start_time = time.perf_counter()
+    with pytest.raises(Exception, match='not saying hello back'):
+        worker.wait_until_ready()
+    duration = time.perf_counter() - start_time
+    # The last greeting may be sent just before the deadline, and waited on for up to
+    # max_greeting_interval:
+    max_duration = worker.startup_timeout + worker.max_greeting_interval
+    assert worker.startup_timeout <= duration < max_duration + 0.05
+    # The timeout of the serial connection is restored:
+    assert worker.pineblaster.timeout == 1
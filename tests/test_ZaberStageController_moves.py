@@ -0,0 +1,149 @@
+#####################################################################
+#                                                                   #
+# /tests/test_ZaberStageController_moves.py                         #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that ZaberWorker moves stages concurrently, that waiting for a move that does
+not complete in time raises TimeoutError, and that whilst waiting the stages are
+queried only a few times, with a backoff between the minimum and maximum poll
+intervals, including stages of unknown speed. MockZaberInterface is used in place of
+the stages."""
+
+import time
+
+import pytest
+
+from labscript_devices.ZaberStageController import blacs_workers
+from labscript_devices.ZaberStageController.blacs_workers import (
+    ZaberWorker,
+    MIN_POLL_INTERVAL,
+)
+
+N_STAGES = 4
+DISTANCE = 20000
+SPEED = 200000
+SETTLING_TIME = 0.02
+TRAVEL_TIME = DISTANCE / SPEED + SETTLING_TIME
+# Most position queries per device per move. Waiting for a stage takes one query at the
+# start, one at the estimated arrival time, and then a number that grows only
+# logarithmically with how late the stage is, due to the doubling poll interval:
+MAX_QUERIES = 12
+
+
+def make_worker(n_stages=N_STAGES, speed_units=9.375):
+    """Return a ZaberWorker using a MockZaberInterface, without starting a worker
+    process"""
+    worker = object.__new__(ZaberWorker)
+    worker.mock = True
+    worker.com_port = 'COM1'
+    worker.child_connections = ['device %d' % (i + 1) for i in range(n_stages)]
+    worker.speed_units = {c: speed_units for c in worker.child_connections}
+    worker.init()
+    worker.controller.speed = SPEED
+    worker.controller.settling_time = SETTLING_TIME
+    return worker
+
+
+@pytest.fixture
+def worker():
+    return make_worker()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """The durations of the sleeps whilst waiting for moves"""
+    sleeps = []
+
+    def sleep(duration):
+        sleeps.append(duration)
+        time.sleep(duration)
+
+    monkeypatch.setattr(blacs_workers, 'sleep', sleep)
+    return sleeps
+
+
+def move_all(worker, position):
+    """Move all the stages to the given position with program_manual, returning the
+    time taken and the most position queries to any stage whilst waiting for them"""
+    controller = worker.controller
+    values = {connection: position for connection in worker.child_connections}
+    controller.position_queries.clear()
+    start_time = time.perf_counter()
+    positions = worker.program_manual(values)
+    duration = time.perf_counter() - start_time
+    assert positions == values
+    # Less the query by check_remote_values() after the move:
+    return duration, max(controller.position_queries.values()) - 1
+
+
+def test_program_manual_moves_concurrently(worker):
+    controller = worker.controller
+    start_time = time.perf_counter()
+    for device_number in range(1, N_STAGES + 1):
+        controller.move(device_number, DISTANCE)
+    sequential_time = time.perf_counter() - start_time
+    assert sequential_time >= N_STAGES * TRAVEL_TIME
+
+    values = {connection: 0 for connection in worker.child_connections}
+    start_time = time.perf_counter()
+    positions = worker.program_manual(values)
+    concurrent_time = time.perf_counter() - start_time
+    assert positions == values
+    # All the stages travel at once, so take little longer than one does alone:
+    assert TRAVEL_TIME <= concurrent_time < 1.5 * TRAVEL_TIME
+    assert concurrent_time < sequential_time / 2
+
+
+def test_wait_until_moved_timeout(worker):
+    controller = worker.controller
+    controller.start_move(1, DISTANCE)
+    timeout = 0.1 * TRAVEL_TIME
+    start_time = time.perf_counter()
+    with pytest.raises(TimeoutError, match='Device\\(s\\) 1 did not move'):
+        controller.wait_until_moved({1: DISTANCE}, timeout=timeout)
+    duration = time.perf_counter() - start_time
+    # Raised at the deadline, rather than once the stage arrived:
+    assert timeout <= duration < 0.5 * TRAVEL_TIME
+    assert controller.get_position(1) != DISTANCE
+
+
+def test_position_queries_bounded(worker, sleeps):
+    _, queries = move_all(worker, DISTANCE)
+    assert queries <= MAX_QUERIES
+    # Slept until the estimated arrival time, then polled with a doubling interval:
+    assert sleeps[0] == pytest.approx(DISTANCE / SPEED, abs=MIN_POLL_INTERVAL)
+    expected = [MIN_POLL_INTERVAL * 2 ** i for i in range(len(sleeps) - 1)]
+    assert sleeps[1:] == pytest.approx(expected)
+
+
+def test_poll_interval_backoff_capped(worker, sleeps, monkeypatch):
+    max_poll_interval = 4 * MIN_POLL_INTERVAL
+    monkeypatch.setattr(blacs_workers, 'MAX_POLL_INTERVAL', max_poll_interval)
+    worker.controller.settling_time = 0.2
+    move_all(worker, DISTANCE)
+    assert len(sleeps) > 4
+    # Doubled from the minimum, then held at the maximum:
+    expected = [
+        min(MIN_POLL_INTERVAL * 2 ** i, max_poll_interval)
+        for i in range(len(sleeps) - 1)
+    ]
+    assert sleeps[1:] == pytest.approx(expected)
+
+
+def test_unknown_speeds(sleeps):
+    worker = make_worker(speed_units=None)
+    duration, queries = move_all(worker, DISTANCE)
+    assert queries <= MAX_QUERIES
+    # Polled from the start, as there is no estimated arrival time:
+    expected = [MIN_POLL_INTERVAL * 2 ** i for i in range(len(sleeps))]
+    assert sleeps == pytest.approx(expected)
+    # Polling with a doubling interval notices arrival at most one poll interval late,
+    # which is no longer than the time already waited:
+    assert TRAVEL_TIME <= duration < 2 * TRAVEL_TIME + 0.05
@@ -0,0 +1,139 @@
+#####################################################################
+#                                                                   #
+# /tests/test_pseudoclock_completion.py                             #
+#                                                                   #
+# Copyright 2020, Monash University and contributors                #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+"""Tests that the NarwhalPulseGen and DummyPseudoclock workers report shots done when
+their runs end, including time spent in waits, and not before. The Narwhal PulseGen is
+emulated by MockNarwhalPulseGenSerial."""
+
+import time
+
+import numpy as np
+import pytest
+import labscript_utils.h5_lock
+import h5py
+import labscript_utils.properties
+
+from labscript_devices.DummyPseudoclock.blacs_workers import (
+    DummyPseudoclockWorker,
+    SimulatedPseudoclock,
+)
+from labscript_devices.NarwhalPulseGen import transcode
+from labscript_devices.NarwhalPulseGen.testing.mock_narwhal import make_worker
+
+SHOT_DURATION = 0.2
+WAIT_DURATION = 0.1
+
+
+def write_shot(path, device_name, stop_time=SHOT_DURATION):
+    """Write a shot file for a master pseudoclock with the given stop time, with a
+    program for a Narwhal PulseGen of that duration, which waits once for a trigger"""
+    instructions = np.zeros(3, dtype=transcode.instruction_dtype)
+    instructions['address'] = np.arange(3)
+    instructions['duration'] = [1, 1, int(round(stop_time / 10e-9)) - 2]
+    instructions['stop_and_wait'][1] = True
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('devices/%s/PULSE_PROGRAM' % device_name, data=instructions)
+        labscript_utils.properties.set_device_properties(
+            f, device_name, {'is_master_pseudoclock': True, 'stop_time': stop_time}
+        )
+    return path
+
+
+def run_shot(worker, path, device_name):
+    """Start a shot and call check_if_done as the tab does until it reports the shot
+    done. Return the time it did so"""
+    worker.transition_to_buffered(device_name, path, {}, False)
+    worker.start_run()
+    while not worker.check_if_done():
+        pass
+    return time.perf_counter()
+
+
+@pytest.fixture
+def narwhal_worker():
+    worker = make_worker()
+    worker.ser.wait_duration = WAIT_DURATION
+    return worker
+
+
+@pytest.fixture
+def dummy_worker():
+    worker = object.__new__(DummyPseudoclockWorker)
+    worker.device_name = 'dummy'
+    worker.init()
+    return worker
+
+
+def test_narwhal_done_after_run_including_waits(narwhal_worker, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), 'narwhal')
+    device = narwhal_worker.ser
+    done_time = run_shot(narwhal_worker, path, 'narwhal')
+    narwhal_worker.transition_to_manual()
+    run_duration = device.run_end_time - device.run_start_time
+    assert run_duration == pytest.approx(SHOT_DURATION + WAIT_DURATION, abs=1e-3)
+    assert device.run_end_time <= done_time < device.run_end_time + 0.05
+
+
+def test_narwhal_not_done_before_timeout(narwhal_worker, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), 'narwhal')
+    narwhal_worker.done_timeout = 0.01
+    narwhal_worker.transition_to_buffered('narwhal', path, {}, True)
+    narwhal_worker.start_run()
+    assert not narwhal_worker.check_if_done()
+    while not narwhal_worker.check_if_done():
+        pass
+    assert time.perf_counter() >= narwhal_worker.ser.run_end_time
+
+
+def test_narwhal_aborted_shot_not_reported_done(narwhal_worker, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), 'narwhal')
+    narwhal_worker.transition_to_buffered('narwhal', path, {}, True)
+    narwhal_worker.start_run()
+    narwhal_worker.abort_buffered()
+    # The next shot starts before the aborted run would have ended:
+    done_time = run_shot(narwhal_worker, path, 'narwhal')
+    assert narwhal_worker.ser.n_triggers == 2
+    assert done_time >= narwhal_worker.ser.run_end_time
+
+
+def test_simulated_pseudoclock():
+    pseudoclock = SimulatedPseudoclock()
+    with pytest.raises(RuntimeError):
+        pseudoclock.start()
+    pseudoclock.arm(SHOT_DURATION)
+    pseudoclock.start()
+    assert not pseudoclock.wait_until_done(0)
+    assert pseudoclock.wait_until_done(1)
+    assert time.perf_counter() >= pseudoclock.end_time
+    assert pseudoclock.state == SimulatedPseudoclock.DONE
+    pseudoclock.arm(SHOT_DURATION)
+    pseudoclock.start()
+    pseudoclock.stop()
+    assert pseudoclock.state == SimulatedPseudoclock.IDLE
+    assert not pseudoclock.wait_until_done(SHOT_DURATION + 0.05)
+
+
+def test_dummy_done_after_stop_time(dummy_worker, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), 'dummy')
+    start_time = time.perf_counter()
+    done_time = run_shot(dummy_worker, path, 'dummy')
+    assert done_time - start_time >= SHOT_DURATION
+    assert done_time < dummy_worker.pseudoclock.end_time + 0.05
+
+
+def test_dummy_aborted_shot_not_reported_done(dummy_worker, tmp_path):
+    path = write_shot(str(tmp_path / 'shot.h5'), 'dummy')
+    dummy_worker.transition_to_buffered('dummy', path, {}, True)
+    dummy_worker.start_run()
+    dummy_worker.abort_buffered()
+    done_time = run_shot(dummy_worker, path, 'dummy')
+    assert done_time >= dummy_worker.pseudoclock.end_time